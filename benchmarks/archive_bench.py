@@ -0,0 +1,97 @@
+"""Compares the gzipped NDJSON archive with the columnar (Parquet, Arrow IPC) one: size, write and scan speed.
+
+The same seeded history is backfilled once per format with the array engine.
+Each archive is then scanned twice for the phones:
+  * full: every record, every field (what a loader into another system reads)
+  * query: mean battery per status, the kind of aggregate analytics run
+    (JSON must parse every record; columnar files read two columns)
+Reports bytes on disk, bytes per record, records written per second and
+records scanned per second.
+
+Usage:
+    python -m benchmarks.archive_bench [--devices N] [--hours H] [--formats ndjson,parquet,arrow]
+"""
+import os
+import gzip
+import json
+import time
+import argparse
+import tempfile
+from collections import defaultdict
+from typing import Dict
+
+from src.ec2.iot_devices.backfill import run_backfill
+from src.util.columnar import read_archive
+
+START = 1704067200  # 2024-01-01 00:00 UTC
+
+def _disk_bytes(root: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, name)) for d, _, names in os.walk(root) for name in names)
+
+def _ndjson_paths(root: str):
+    for directory, _, names in sorted(os.walk(os.path.join(root, "type=phone"))):
+        for name in sorted(names):
+            yield os.path.join(directory, name)
+
+def _scan_ndjson(root: str) -> Dict[str, object]:
+    started = time.perf_counter()
+    rows = 0
+    for path in _ndjson_paths(root):
+        with gzip.open(path, "rb") as f:
+            rows += sum(1 for line in f if json.loads(line))
+    full = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sums, counts = defaultdict(float), defaultdict(int)
+    for path in _ndjson_paths(root):
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                record = json.loads(line)
+                sums[record["status"]] += record["battery"]
+                counts[record["status"]] += 1
+    query = time.perf_counter() - started
+    return {"rows": rows, "full_s": full, "query_s": query,
+            "means": {status: round(sums[status] / counts[status], 3) for status in sorted(counts)}}
+
+def _scan_columnar(root: str) -> Dict[str, object]:
+    started = time.perf_counter()
+    rows = read_archive(root, "phone").num_rows
+    full = time.perf_counter() - started
+
+    started = time.perf_counter()
+    table = read_archive(root, "phone", columns=["status", "battery"])
+    grouped = table.group_by("status").aggregate([("battery", "mean")]).to_pylist()
+    query = time.perf_counter() - started
+    return {"rows": rows, "full_s": full, "query_s": query,
+            "means": {row["status"]: round(row["battery_mean"], 3) for row in sorted(grouped, key=str)}}
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--hours", type=float, default=6.0)
+    parser.add_argument("--formats", default="ndjson,parquet,arrow", help="Comma-separated archive formats")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_format in args.formats.split(","):
+            root = os.path.join(tmp, file_format)
+            summary = run_backfill(args.devices, START, START + args.hours * 3600, root, seed=1,
+                                   file_format=file_format)
+            scan = _scan_ndjson(root) if file_format == "ndjson" else _scan_columnar(root)
+            size = _disk_bytes(root)
+            results.append({
+                "format": file_format,
+                "records": summary["records"],
+                "disk_mb": round(size / 1e6, 2),
+                "bytes_per_record": round(size / summary["records"], 2),
+                "write_records_per_s": round(summary["records"] / summary["elapsed_s"]),
+                "phone_rows": scan["rows"],
+                "full_scan_rows_per_s": round(scan["rows"] / scan["full_s"]),
+                "query_rows_per_s": round(scan["rows"] / scan["query_s"]),
+                "mean_battery_by_status": scan["means"],
+            })
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
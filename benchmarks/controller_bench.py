@@ -0,0 +1,53 @@
+"""Measures how fast and how closely the load controller holds a throughput target.
+
+Each run plays a constant scenario (--population devices at most, one ping
+per --interval) on a VirtualClock with a target, and reports the
+controller's time to steady state, drift after it, and the devices and rate
+multiplier it settled on:
+  * records: --records-per-s in TEST mode (records counted, not formatted)
+  * bytes: --bytes-per-s into the null sink
+  * throttled: --records-per-s into a sink that takes SHARD_RECORDS_PER_SEC
+    per shard of --shards each second, like a stream with too few shards;
+    the controller settles below that capacity and reports it
+
+Usage:
+    python -m benchmarks.controller_bench [--records-per-s 50000] [--bytes-per-s 2000000] [--shards 20]
+"""
+import json
+import argparse
+import logging
+
+from src.util.clock import VirtualClock
+from src.util.sinks import CappedSink, NullSink
+from src.util.shard_router import SHARD_RECORDS_PER_SEC
+from src.ec2.iot_devices.scenario import Scenario, ScenarioRunner
+
+def run(name: str, target: dict, args: argparse.Namespace, sink=None) -> dict:
+    clock = VirtualClock(start=1704067200)
+    spec = {"name": name, "duration": args.duration, "population": args.population, "interval": args.interval,
+            "target": target}
+    summary = ScenarioRunner(Scenario(spec), sink(clock) if sink else None, clock, seed=1).run()
+    return dict(summary["controller"], run=name, elapsed_s=summary["elapsed_s"])
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records-per-s", type=float, default=50000, help="Records target")
+    parser.add_argument("--bytes-per-s", type=float, default=2_000_000, help="Bytes target")
+    parser.add_argument("--shards", type=int, default=20, help="Shards of the throttling sink")
+    parser.add_argument("--population", type=int, default=5_000_000, help="Most devices the controller may use")
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between pings of a device")
+    parser.add_argument("--duration", type=float, default=300.0, help="Scenario seconds per run")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    capacity = args.shards * SHARD_RECORDS_PER_SEC
+    results = [
+        run("records", {"records_per_s": args.records_per_s}, args),
+        run("bytes", {"bytes_per_s": args.bytes_per_s}, args, lambda clock: NullSink()),
+        run("throttled", {"records_per_s": args.records_per_s}, args,
+            lambda clock: CappedSink(capacity, clock)),
+    ]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
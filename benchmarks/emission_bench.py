@@ -0,0 +1,77 @@
+"""Measures how many records dead-reckoning suppression saves and what the consumer loses.
+
+The same seeded fleet is stepped under a virtual clock once sending every
+tick and once per --position-errors value with a DeadReckoning policy, with
+and without the heading trigger. Reports records and bytes sent, the
+reduction factor against sending every tick (Kinesis bills PUT payload units
+per record, so records are the cost), the triggers, and the worst position
+and level error of the series reconstruct() rebuilds.
+
+Usage:
+    python -m benchmarks.emission_bench [--devices N] [--steps N] [--delay SECONDS] [--position-errors 5,10,25]
+                                        [--level-step POINTS] [--heartbeat SECONDS]
+"""
+import json
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet
+from src.util.clock import VirtualClock
+from src.util.emission import HEARTBEAT, LEVEL_STEP, DeadReckoning, error_meters, reconstruct
+from src.util.sinks import MemorySink
+from src.util.state_store import decode_record
+
+def _run(devices: int, steps: int, delay: float, policy: Optional[DeadReckoning]) -> Dict[str, List[dict]]:
+    sink = MemorySink(devices * steps)
+    clock = VirtualClock(start=1704067200)
+    fleet = build_fleet(devices, test=False, producer=sink, seed=1, clock=clock, emission=policy)
+    FleetRunner(fleet, delay, clock=clock).run(steps)
+    by_device = defaultdict(list)
+    for _, data in sink.records:
+        payload = decode_record(data)
+        by_device[payload["deviceId"]].append(payload)
+    return by_device
+
+def _worst_errors(truth: Dict[str, List[dict]], sent: Dict[str, List[dict]], delay: float) -> Dict[str, float]:
+    position = level = 0.0
+    for device_id, actual in truth.items():
+        rebuilt = reconstruct(sent[device_id], delay, end=actual[-1]["timestamp"])
+        field = next(key for key in ("battery", "gas") if key in actual[0])
+        for got, expected in zip(rebuilt, actual):
+            g, e = got["location"], expected["location"]
+            position = max(position, error_meters((0, g[0], g[1], g[2], 0), (0, e[0], e[1], e[2], 0)))
+            level = max(level, abs(got[field] - expected[field]))
+    return {"max_position_error_m": round(position, 1), "max_level_error": round(level, 1)}
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=120, help="Ticks per device")
+    parser.add_argument("--delay", type=float, default=60.0, help="Seconds between two ticks of a device")
+    parser.add_argument("--position-errors", default="5,10,25", help="Comma-separated position thresholds in meters")
+    parser.add_argument("--level-step", type=float, default=LEVEL_STEP)
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT)
+    args = parser.parse_args(argv)
+
+    truth = _run(args.devices, args.steps, args.delay, None)
+    records = sum(map(len, truth.values()))
+    size = sum(len(json.dumps(p)) for payloads in truth.values() for p in payloads)
+    results = [{"policy": "every tick", "records": records, "bytes": size, "reduction": 1.0}]
+    variants = [(float(p), True) for p in args.position_errors.split(",")]
+    variants += [(position_m, False) for position_m, _ in variants]
+    for position_m, on_heading in variants:
+        policy = DeadReckoning(position_m, args.level_step, args.heartbeat, on_heading)
+        sent = _run(args.devices, args.steps, args.delay, policy)
+        sent_records = sum(map(len, sent.values()))
+        results.append(dict({
+            "policy": f"dead reckoning {position_m:g} m" + ("" if on_heading else ", ignoring headings"),
+            "records": sent_records,
+            "bytes": sum(len(json.dumps(p)) for payloads in sent.values() for p in payloads),
+            "reduction": round(records / sent_records, 1),
+            "triggers": {k: v for k, v in policy.stats.items() if k not in ("sent", "suppressed")},
+        }, **_worst_errors(truth, sent, args.delay)))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Measures encode ns/record and bytes/record of every payload encoder.
+
+The baseline is the original path, json.dumps(device.get_payload()).
+
+Usage:
+    python -m benchmarks.encoder_bench [--records N]
+"""
+import json
+import time
+import logging
+import argparse
+
+from src.ec2.iot_devices.fleet import build_fleet
+from src.util.encoders import ENCODERS
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    devices = build_fleet(1000, test=True)
+    for device in devices:
+        device.simulate_step()  # Moves off the 6-digit start grid, like a running fleet
+    picks = [devices[i % len(devices)] for i in range(args.records)]
+    timestamp = int(time.time())
+
+    paths = {"json.dumps(get_payload())": lambda d: json.dumps(d.get_payload()).encode("utf-8")}
+    paths.update({name: (lambda e: lambda d: e.encode(d, timestamp))(encoder) for name, encoder in ENCODERS.items()})
+
+    results = []
+    for name, encode in paths.items():
+        start = time.perf_counter()
+        total = 0
+        for device in picks:
+            total += len(encode(device))
+        elapsed = time.perf_counter() - start
+        results.append({"encoder": name, "ns_per_record": round(elapsed / args.records * 1e9),
+                        "bytes_per_record": round(total / args.records, 1)})
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Measures device steps per second of the vectorized fleet engine.
+
+Usage:
+    python -m benchmarks.engine_bench [NUM_DEVICES] [--ticks N]
+"""
+import json
+import time
+import argparse
+
+import numpy as np
+
+from src.ec2.iot_devices.fleet_arrays import PhoneArrays, CarArrays, DroneArrays
+
+def measure(cls, num_devices: int, ticks: int, rng: np.random.Generator) -> dict:
+    """Steps `num_devices` devices of one type `ticks` times and reports steps/sec."""
+    arrays = cls.random(num_devices, rng)
+    arrays.step(rng)  # warm-up
+    start = time.perf_counter()
+    for _ in range(ticks):
+        arrays.step(rng)
+    elapsed = time.perf_counter() - start
+    return {
+        "type": cls.prefix,
+        "devices": num_devices,
+        "ms_per_tick": round(elapsed / ticks * 1000, 2),
+        "steps_per_sec": round(num_devices * ticks / elapsed),
+    }
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("num_devices", nargs="?", type=int, default=1_000_000)
+    parser.add_argument("--ticks", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    results = [measure(cls, args.num_devices, args.ticks, rng) for cls in (PhoneArrays, CarArrays, DroneArrays)]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
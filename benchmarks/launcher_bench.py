@@ -0,0 +1,101 @@
+"""Compares the subprocess-per-device launcher with the in-process fleet runner.
+
+Both launchers are started through `python -m src.ec2.iot_devices.main` in TEST
+mode. At the end of the window the RSS and accumulated CPU time (start-up
+included) of the whole process tree are sampled from /proc (Linux only) and
+turned into devices-per-GB and devices-per-core figures.
+
+Usage:
+    python -m benchmarks.launcher_bench [NUM_DEVICES] [--window SECONDS]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, List
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+def _children(pid: int) -> List[int]:
+    """Returns every descendant pid of `pid` by scanning /proc."""
+    parents: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+        except (OSError, IndexError):
+            continue
+    tree, frontier = [], [pid]
+    while frontier:
+        current = frontier.pop()
+        kids = [child for child, parent in parents.items() if parent == current]
+        tree.extend(kids)
+        frontier.extend(kids)
+    return tree
+
+def _proc_usage(pid: int) -> Dict[str, float]:
+    """Returns RSS (bytes) and user+system CPU seconds of one process."""
+    rss = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) * 1024
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return {"rss": rss, "cpu": cpu}
+
+def measure_launcher(launcher: str, num_devices: int, window: float) -> Dict[str, float]:
+    """Runs one launcher for `window` seconds and samples its process tree."""
+    command = [sys.executable, "-m", "src.ec2.iot_devices.main", str(num_devices),
+               "--launcher", launcher, "--test"]
+    root = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(window)
+        rss, cpu, processes = 0, 0.0, 0
+        for pid in [root.pid] + _children(root.pid):
+            try:
+                usage = _proc_usage(pid)
+            except OSError:
+                continue
+            rss += usage["rss"]
+            cpu += usage["cpu"]
+            processes += 1
+    finally:
+        for pid in _children(root.pid):
+            try:
+                os.kill(pid, 9)
+            except OSError:
+                pass
+        root.kill()
+        root.wait()
+
+    cores_busy = cpu / window
+    return {
+        "launcher": launcher,
+        "devices": num_devices,
+        "processes": processes,
+        "rss_mb": round(rss / 2**20, 1),
+        "cpu_seconds": round(cpu, 2),
+        "devices_per_gb": round(num_devices / (rss / 2**30), 1) if rss else 0.0,
+        "devices_per_core": round(num_devices / cores_busy, 1) if cores_busy else float("inf"),
+    }
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("num_devices", nargs="?", type=int, default=100)
+    parser.add_argument("--window", type=float, default=15.0,
+                        help="Seconds to let each launcher run before sampling")
+    args = parser.parse_args(argv)
+
+    results = [measure_launcher(launcher, args.num_devices, args.window)
+               for launcher in ("subprocess", "fleet")]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Reports bytes per device for the object model and the array engine.
+
+Object devices are measured with tracemalloc while they are built (id string,
+location list and numbers included); the array engine is measured from the
+size of its NumPy buffers. Object devices are checked against
+DEVICE_BYTES_BUDGET.
+
+Usage:
+    python -m benchmarks.memory_bench [--sizes 10000 100000 1000000]
+"""
+import gc
+import json
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from src.ec2.iot_devices.fleet import (
+    DEVICE_BYTES_BUDGET, DEVICE_CLASSES, random_coordinates, random_heading, random_seven_digit_integer
+)
+from src.ec2.iot_devices.fleet_arrays import ARRAY_CLASSES
+
+def object_bytes_per_device(prefix: str, count: int) -> float:
+    cls = DEVICE_CLASSES[prefix]
+    devices = [None] * count
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        devices[i] = cls(f"{prefix}-{random_seven_digit_integer()}", random_coordinates(), random_heading(), True)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / count
+
+def array_bytes_per_device(prefix: str, count: int) -> float:
+    arrays = ARRAY_CLASSES[prefix].random(count, np.random.default_rng(0))
+    return sum(value.nbytes for value in vars(arrays).values() if isinstance(value, np.ndarray)) / count
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args(argv)
+
+    results = []
+    for count in args.sizes:
+        for prefix in ("phone", "car", "drone"):
+            object_bytes = object_bytes_per_device(prefix, count)
+            results.append({
+                "type": prefix,
+                "devices": count,
+                "object_bytes_per_device": round(object_bytes, 1),
+                "object_within_budget": object_bytes <= DEVICE_BYTES_BUDGET,
+                "array_bytes_per_device": round(array_bytes_per_device(prefix, count), 1),
+            })
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
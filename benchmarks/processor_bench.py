@@ -0,0 +1,109 @@
+"""Measures the local stream processor end to end against the Kinesis stand-in.
+
+Two phases run against an in-process stand-in (src/util/kinesis_local.py):
+  * backlog: --records device payloads are loaded first, then drained once per
+    --processes value (from TRIM_HORIZON, fresh checkpoints); reports records/s
+  * live: a producer writes --rate records/s for --duration seconds while the
+    processor consumes; reports records/s and lag (arrival in the stream ->
+    handler done) percentiles
+
+The handler decodes and parses every record, like a minimal Lambda function.
+
+Usage:
+    python -m benchmarks.processor_bench [--shards N] [--records N] [--processes 1,2,4]
+                                         [--rate RECORDS_PER_SEC] [--duration SECONDS] [--batch-size N]
+"""
+import os
+import json
+import time
+import base64
+import logging
+import argparse
+import tempfile
+import threading
+from typing import Dict, List
+
+import boto3
+
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet
+from src.util.clock import VirtualClock
+from src.util.sinks import MemorySink
+from src.util.kinesis_local import LocalKinesis, start_server
+from src.util.kinesis_producer import KinesisProducer
+from src.util.rate_limiter import ShardRateLimiter
+from src.util.shard_router import list_shards
+from src.util.stream_processor import BATCH_SIZE, run_processor
+
+STREAM = "nairobi-stream"
+HANDLER = "benchmarks.processor_bench:parse_records"
+
+def parse_records(event: Dict[str, object], context: object) -> None:
+    for record in event["Records"]:
+        json.loads(base64.b64decode(record["kinesis"]["data"]))
+
+def _payloads(records: int) -> List[tuple]:
+    """(key, data) of real device payloads, from a fleet stepped under a virtual clock."""
+    sink = MemorySink(records)
+    clock = VirtualClock(start=1704067200)
+    devices = build_fleet(1000, test=False, producer=sink, seed=1, clock=clock)
+    FleetRunner(devices, 1.0, clock=clock).run(steps=-(-records // len(devices)))
+    return list(sink.records)[:records]
+
+def _producer(endpoint: str) -> KinesisProducer:
+    client = boto3.client("kinesis", region_name="us-east-2", endpoint_url=endpoint)
+    return KinesisProducer(stream=STREAM, client=client, limiter=ShardRateLimiter(list_shards(client, STREAM)))
+
+def _load(endpoint: str, payloads: List[tuple]) -> None:
+    producer = _producer(endpoint)
+    for key, data in payloads:
+        producer.put(data, key)
+    producer.close()
+
+def _feed(endpoint: str, payloads: List[tuple], rate: float, duration: float) -> None:
+    producer = _producer(endpoint)
+    start = time.monotonic()
+    for i in range(int(rate * duration)):
+        key, data = payloads[i % len(payloads)]
+        producer.put(data, key)
+        delay = start + (i + 1) / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    producer.close()
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--records", type=int, default=20_000, help="Backlog drained by every --processes value")
+    parser.add_argument("--processes", default="1,2,4", help="Comma-separated worker process counts")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Records/s written during the live phase")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of the live phase")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+    server = start_server(kinesis=LocalKinesis(shards=args.shards, retain=args.records + int(args.rate * 60)))
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    payloads = _payloads(args.records)
+    results = []
+    try:
+        _load(endpoint, payloads)
+        for processes in [int(p) for p in args.processes.split(",")]:
+            with tempfile.TemporaryDirectory() as checkpoints:
+                result = run_processor(HANDLER, STREAM, endpoint, processes, checkpoints, until_caught_up=True,
+                                       batch_size=args.batch_size)
+            results.append(dict({"phase": "backlog", "processes": processes}, **result))
+        with tempfile.TemporaryDirectory() as checkpoints:
+            feeder = threading.Thread(target=_feed, args=(endpoint, payloads, args.rate, args.duration))
+            feeder.start()
+            result = run_processor(HANDLER, STREAM, endpoint, None, checkpoints, duration=args.duration + 1,
+                                   batch_size=args.batch_size, start="LATEST")
+            feeder.join()
+        results.append(dict({"phase": "live", "processes": args.shards, "rate": args.rate}, **result))
+    finally:
+        server.shutdown()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Compares per-record put_record with the batched PutRecords producer.
+
+Three paths are measured against the same stream:
+  * per_record_new_client: a fresh boto3 client per record, as send_to_kinesis used to
+    do (capped at 200 records, it is slow)
+  * per_record_pooled: put_record on the shared client
+  * batched: KinesisProducer
+  * batched_routed: KinesisProducer with a ShardRouter (explicit hash keys balanced per shard)
+  * batched_routed_limited: the same plus a ShardRateLimiter (per-shard token buckets that
+    pace sends and resends instead of the fixed backoff), as the kinesis sink runs it
+
+--local-shards N runs the paths offline against an in-process stand-in
+(src/util/kinesis_local.py) with N shards and real per-shard limits, so the
+batched numbers show throttling and resends as well. --hot-keys only uses
+partition keys whose MD5 falls into the first shard, the worst case of a
+skewed fleet.
+
+Usage:
+    python -m benchmarks.producer_bench [--records N] [--stream NAME] [--endpoint-url URL | --local-shards N]
+                                        [--hot-keys]
+"""
+import os
+import json
+import time
+import argparse
+from typing import Dict, List
+
+import boto3
+
+from src.util.sim_functions import REGION_NAME, STREAM_NAME, get_kinesis_client
+from src.util.kinesis_producer import KinesisProducer
+from src.util.kinesis_local import LocalKinesis, hash_key, start_server
+from src.util.shard_router import ShardRouter, list_shards
+from src.util.rate_limiter import ShardRateLimiter
+
+def _summary(name: str, records: int, elapsed: float, latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+    return {
+        "path": name,
+        "records": records,
+        "records_per_sec": round(records / elapsed, 1),
+        "latency_p50_ms": pick(0.50),
+        "latency_p99_ms": pick(0.99),
+    }
+
+def _payloads(records: int) -> List[bytes]:
+    return [json.dumps({"deviceId": f"phone-{1000000 + i}", "timestamp": int(time.time()), "status": "moving",
+                        "location": [-1.292076, 36.821948, 0.0], "battery": 88.4}).encode("utf-8")
+            for i in range(records)]
+
+def _keys(records: int, hot: bool, first_shard_end: int) -> List[str]:
+    keys, i = [], 0
+    while len(keys) < records:
+        key = f"phone-{1000000 + i}"
+        if not hot or hash_key(key) <= first_shard_end:
+            keys.append(key)
+        i += 1
+    return keys
+
+def bench_per_record(records: int, stream: str, endpoint_url: str, pooled: bool) -> Dict[str, float]:
+    latencies = []
+    start = time.perf_counter()
+    for i, data in enumerate(_payloads(records)):
+        sent = time.perf_counter()
+        if pooled:
+            client = get_kinesis_client(endpoint_url=endpoint_url)
+        else:
+            client = boto3.client("kinesis", region_name=REGION_NAME, endpoint_url=endpoint_url)
+        client.put_record(StreamName=stream, Data=data, PartitionKey=f"phone-{1000000 + i}")
+        latencies.append(time.perf_counter() - sent)
+    name = "per_record_pooled" if pooled else "per_record_new_client"
+    return _summary(name, records, time.perf_counter() - start, latencies)
+
+class _TimedClient:
+    """Notes when each record of a PutRecords call was acknowledged."""
+
+    def __init__(self, client, acked: Dict[bytes, float]):
+        self.client = client
+        self.acked = acked
+
+    def put_records(self, **kwargs):
+        response = self.client.put_records(**kwargs)
+        now = time.perf_counter()
+        for record, result in zip(kwargs["Records"], response["Records"]):
+            if "ErrorCode" not in result:
+                self.acked[record["Data"]] = now
+        return response
+
+def bench_batched(records: int, stream: str, endpoint_url: str, keys: List[str],
+                  routed: bool = False, limited: bool = False) -> Dict[str, float]:
+    acked: Dict[bytes, float] = {}
+    client = get_kinesis_client(endpoint_url=endpoint_url)
+    shards = list_shards(client, stream)
+    producer = KinesisProducer(stream=stream, client=_TimedClient(client, acked),
+                               router=ShardRouter(shards) if routed else None,
+                               limiter=ShardRateLimiter(shards) if limited else None)
+    enqueued = {}
+    start = time.perf_counter()
+    for data, key in zip(_payloads(records), keys):
+        enqueued[data] = time.perf_counter()
+        producer.put(data, key)
+    producer.close()
+    elapsed = time.perf_counter() - start
+    latencies = [acked[data] - sent for data, sent in enqueued.items() if data in acked]
+    name = "batched" + ("_routed" if routed else "") + ("_limited" if limited else "")
+    result = _summary(name, records, elapsed, latencies)
+    result["resent"] = producer.stats["resent"]
+    result["dropped"] = producer.stats["dropped"]
+    return result
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--stream", default=STREAM_NAME)
+    parser.add_argument("--endpoint-url", default=None, help="e.g. a local Kinesis stand-in")
+    parser.add_argument("--local-shards", type=int, help="Start a local stand-in with this many shards")
+    parser.add_argument("--hot-keys", action="store_true", help="Only keys the MD5 maps to the first shard")
+    args = parser.parse_args(argv)
+
+    if args.local_shards:
+        server = start_server(kinesis=LocalKinesis(shards=args.local_shards))
+        args.endpoint_url = f"http://127.0.0.1:{server.server_address[1]}"
+        # The stand-in does not check signatures, but botocore needs something to sign with
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+
+    first_shard_end = list_shards(get_kinesis_client(endpoint_url=args.endpoint_url), args.stream)[0][2]
+    keys = _keys(args.records, args.hot_keys, first_shard_end)
+    results = [
+        bench_per_record(min(args.records, 200), args.stream, args.endpoint_url, pooled=False),
+        bench_per_record(args.records, args.stream, args.endpoint_url, pooled=True),
+    ]
+    for routed, limited in ((False, False), (True, False), (True, True)):
+        time.sleep(1.0)  # Lets the shards' rate limits refill after the previous path
+        results.append(bench_batched(args.records, args.stream, args.endpoint_url, keys, routed, limited))
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
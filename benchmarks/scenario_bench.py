@@ -0,0 +1,61 @@
+"""Measures how fast a scenario changes its population and plays its ticks.
+
+  * population: a --devices pool is filled from empty to full in --steps
+    equal joins, then emptied again; devices joined per second and the
+    time all of them took to leave
+  * run: a ramp from 0 to --devices and back over --duration scenario seconds
+    (60 s interval, VirtualClock) played in TEST mode (records counted, not
+    formatted) and into the null sink; records and ticks per second
+
+Usage:
+    python -m benchmarks.scenario_bench [--devices 2000000] [--steps 20] [--duration 600]
+"""
+import json
+import time
+import argparse
+
+import numpy as np
+
+from src.util.clock import VirtualClock
+from src.util.sinks import NullSink
+from src.ec2.iot_devices.scenario import DevicePool, Scenario, ScenarioRunner, parse_curve
+
+def bench_population(devices: int, steps: int) -> dict:
+    started = time.perf_counter()
+    pool = DevicePool("phone", "phone", devices, 60.0, parse_curve(1), [], np.random.default_rng(1))
+    allocate_s = time.perf_counter() - started
+    sizes = np.linspace(0, devices, steps + 1).astype(int)[1:]
+    started = time.perf_counter()
+    for now, size in enumerate(sizes):
+        pool.resize(int(size), float(now))
+    join_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for size in sizes[::-1][1:].tolist() + [0]:
+        pool.resize(size, 0.0)
+    leave_s = time.perf_counter() - started
+    return {"devices": devices, "allocate_s": round(allocate_s, 3), "joined_per_s": round(devices / join_s),
+            "leave_all_ms": round(leave_s * 1000, 3)}
+
+def bench_run(devices: int, duration: float, test: bool) -> dict:
+    scenario = Scenario({"name": "ramp", "duration": duration, "interval": 60,
+                         "population": [[0, 0], [duration / 2, devices], [duration, 0]]})
+    runner = ScenarioRunner(scenario, None if test else NullSink(), VirtualClock(start=1704067200), seed=1)
+    summary = runner.run()
+    return {"mode": "test" if test else "null sink", "peak_devices": summary["peak_devices"],
+            "records": summary["records"], "elapsed_s": summary["elapsed_s"],
+            "records_per_s": summary["records_per_s"],
+            "ticks_per_s": round(summary["ticks"] / summary["elapsed_s"]) if summary["elapsed_s"] else None}
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=2_000_000, help="Peak devices")
+    parser.add_argument("--steps", type=int, default=20, help="Joins from an empty to a full pool")
+    parser.add_argument("--duration", type=float, default=600.0, help="Scenario seconds of the ramp run")
+    args = parser.parse_args(argv)
+
+    results = {"population": bench_population(args.devices, args.steps),
+               "run": [bench_run(args.devices, args.duration, test) for test in (True, False)]}
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
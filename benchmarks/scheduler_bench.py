@@ -0,0 +1,48 @@
+"""Runs a large in-process fleet on the timing-wheel scheduler and reports tick lateness.
+
+Devices run in TEST mode with logging silenced, so the numbers reflect the
+scheduler and the simulation steps, not log formatting.
+
+With --virtual-clock the duration is simulated time, run as fast as possible
+(or at --speedup), and the result also reports the achieved speedup.
+
+Usage:
+    python -m benchmarks.scheduler_bench [NUM_DEVICES] [--duration SECONDS] [--delay SECONDS]
+                                         [--virtual-clock] [--speedup X]
+"""
+import json
+import time
+import logging
+import argparse
+
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet
+from src.util.clock import VirtualClock
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("num_devices", nargs="?", type=int, default=100_000)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--delay", type=float, default=60.0, help="Phone interval; cars x0.5, drones x0.25")
+    parser.add_argument("--virtual-clock", action="store_true", help="Run --duration seconds of simulated time")
+    parser.add_argument("--speedup", type=float, help="Simulated seconds per real second (implies --virtual-clock)")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    clock = VirtualClock(speedup=args.speedup) if args.virtual_clock or args.speedup else None
+    devices = build_fleet(args.num_devices, test=True, clock=clock)
+    intervals = {"phone": args.delay, "car": args.delay / 2, "drone": args.delay / 4}
+    runner = FleetRunner(devices, args.delay, intervals, clock)
+
+    start = time.perf_counter()
+    runner.run(duration=args.duration)
+    elapsed = time.perf_counter() - start
+    result = {"devices": args.num_devices, "duration_s": round(elapsed, 1),
+              "ticks_per_sec": round(runner.steps_run / elapsed, 1)}
+    if clock is not None:
+        result["simulated_s"] = args.duration
+        result["speedup"] = round(args.duration / elapsed, 1)
+    result.update(runner.scheduler.lateness.summary())
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
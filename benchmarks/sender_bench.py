@@ -0,0 +1,100 @@
+"""Runs a fleet against a degraded sink, sending from the ticks vs through a BackgroundSender.
+
+The sink stalls for --stall seconds every --stall-every records (like a slow
+PutRecords round trip) and fails --fail-rate of its puts. Sending from the
+ticks, every stall and failure lands in the device tick that hit it; with
+the background sender ticks only queue records, so tick lateness and
+steps/s should stay where an idle sink puts them.
+
+Usage:
+    python -m benchmarks.sender_bench [NUM_DEVICES] [--duration SECONDS] [--delay SECONDS]
+                                      [--stall SECONDS] [--stall-every N] [--fail-rate P]
+                                      [--overflow {block,drop-oldest,spill}] [--capacity N]
+"""
+import json
+import time
+import random
+import logging
+import argparse
+from typing import Dict
+
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet
+from src.util.sinks import NullSink
+from src.util.background_sender import OVERFLOW_POLICIES, QUEUE_CAPACITY, BackgroundSender
+
+class DegradedSink(NullSink):
+    """NullSink that stalls every `stall_every` records and fails a share of its puts."""
+
+    def __init__(self, stall: float, stall_every: int, fail_rate: float, seed: int = 0):
+        super().__init__()
+        self.stall = stall
+        self.stall_every = stall_every
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self.rng = random.Random(seed)
+
+    def put(self, data: bytes, key: str) -> None:
+        self.calls += 1
+        if self.stall_every and self.calls % self.stall_every == 0:
+            time.sleep(self.stall)
+        if self.rng.random() < self.fail_rate:
+            raise ConnectionError("degraded sink dropped the request")
+        super().put(data, key)
+
+class _Unreliable:
+    """Sends from the ticks the way a device's own send does: a failed put loses the record."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.stats = sink.stats
+
+    def put(self, data: bytes, key: str) -> None:
+        try:
+            self.sink.put(data, key)
+        except ConnectionError:
+            self.stats["dropped"] += 1
+
+    def flush(self) -> None:
+        self.sink.flush()
+
+    def close(self) -> None:
+        self.sink.close()
+
+def _run(mode: str, args: argparse.Namespace) -> Dict[str, object]:
+    sink = DegradedSink(args.stall, args.stall_every, args.fail_rate)
+    if mode == "background":
+        producer = BackgroundSender(sink, capacity=args.capacity, overflow=args.overflow, retry_backoff=0.01)
+    else:
+        producer = _Unreliable(sink)
+    devices = build_fleet(args.num_devices, test=False, producer=producer, seed=1)
+    runner = FleetRunner(devices, args.delay, {"phone": args.delay, "car": args.delay / 2, "drone": args.delay / 4})
+    start = time.perf_counter()
+    runner.run(duration=args.duration)
+    elapsed = time.perf_counter() - start
+    depth = getattr(producer, "queue_depth", 0)
+    producer.close()
+    drained = time.perf_counter() - start - elapsed
+    stats = producer.stats
+    result = {"mode": mode, "steps_per_sec": round(runner.steps_run / elapsed, 1),
+              "records_sent": stats["records_sent"], "dropped": stats["dropped"],
+              "queue_depth_at_end": depth, "drain_s": round(drained, 2)}
+    result.update(runner.scheduler.lateness.summary())
+    return result
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("num_devices", nargs="?", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--delay", type=float, default=4.0, help="Phone interval; cars x0.5, drones x0.25")
+    parser.add_argument("--stall", type=float, default=0.05, help="Seconds the sink stalls")
+    parser.add_argument("--stall-every", type=int, default=100, help="Records between two stalls")
+    parser.add_argument("--fail-rate", type=float, default=0.05, help="Share of puts that fail")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default="block")
+    parser.add_argument("--capacity", type=int, default=QUEUE_CAPACITY)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    print(json.dumps([_run(mode, args) for mode in ("ticks", "background")], indent=2))
+
+if __name__ == "__main__":
+    main()
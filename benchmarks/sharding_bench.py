@@ -0,0 +1,39 @@
+"""Measures emitted records/sec of the sharded fleet for 1..N worker processes.
+
+Devices run in TEST mode with logging silenced and a short interval, so each
+worker is CPU-bound and the figures show how throughput scales with cores.
+
+Usage:
+    python -m benchmarks.sharding_bench [NUM_DEVICES] [--max-processes N] [--steps N] [--delay SECONDS]
+"""
+import os
+import json
+import logging
+import argparse
+
+from src.ec2.iot_devices.fleet import run_sharded
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("num_devices", nargs="?", type=int, default=20_000)
+    parser.add_argument("--max-processes", type=int, default=os.cpu_count())
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = []
+    processes = 1
+    while processes <= args.max_processes:
+        summary = run_sharded(args.num_devices, processes, steps=args.steps, delay=args.delay, test=True,
+                              report_interval=60.0)
+        results.append({"processes": processes, "records_per_sec": summary["records_per_sec"],
+                        "worst_p99_lateness_ms": summary["worst_p99_lateness_ms"]})
+        processes *= 2
+    baseline = results[0]["records_per_sec"] or 1.0
+    for result in results:
+        result["speedup"] = round(result["records_per_sec"] / baseline, 2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
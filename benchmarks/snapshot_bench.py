@@ -0,0 +1,87 @@
+"""Measures how long fleet snapshots take to save and to restore.
+
+Array engine: --devices devices are stepped once, packed with array_records,
+saved, mapped back with load_snapshot and rebuilt with restore_arrays.
+Object fleet: --objects Phone/Car/Drone objects (with per-device random
+streams if --seed is given) are saved through FleetSnapshots, once at a time
+and once in the background as a running fleet saves (reporting the longest
+the event loop waited for a turn), and rebuilt with restore_fleet.
+Reports seconds per phase, snapshot bytes and devices restored per second.
+
+Usage:
+    python -m benchmarks.snapshot_bench [--devices N] [--objects N] [--seed SEED]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+from src.ec2.iot_devices.fleet import build_fleet, fleet_mix, restore_fleet
+from src.ec2.iot_devices.fleet_arrays import PhoneArrays, CarArrays, DroneArrays
+from src.ec2.iot_devices.snapshot import FleetSnapshots, array_records, load_snapshot, restore_arrays, save_snapshot
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - started, 3)
+
+def bench_arrays(num_devices: int, path: str) -> dict:
+    rng = np.random.default_rng(1)
+    fleets = [cls.random(count, rng) for cls, count in zip((PhoneArrays, CarArrays, DroneArrays),
+                                                           fleet_mix(num_devices))]
+    for arrays in fleets:
+        arrays.step(rng)
+    records, pack_s = _timed(array_records, fleets)
+    size, write_s = _timed(save_snapshot, path, records, time.time())
+    (mapped, _), map_s = _timed(load_snapshot, path)
+    restored, restore_s = _timed(restore_arrays, mapped)
+    assert sum(map(len, restored.values())) == num_devices
+    return {"engine": "arrays", "devices": num_devices, "snapshot_mb": round(size / 1e6, 1), "pack_s": pack_s,
+            "write_s": write_s, "map_s": map_s, "restore_s": restore_s,
+            "restored_per_s": round(num_devices / (map_s + restore_s))}
+
+def _background_save(snapshots: FleetSnapshots, devices: list) -> float:
+    """Saves in the background and returns the longest the event loop went without a turn meanwhile."""
+    async def save() -> float:
+        task = asyncio.ensure_future(snapshots.save_in_background(devices, time.time()))
+        longest, last = 0.0, time.perf_counter()
+        while not task.done():
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            longest, last = max(longest, now - last), now
+        await task
+        return longest
+    return asyncio.run(save())
+
+def bench_objects(num_devices: int, path: str, seed: Optional[int]) -> dict:
+    devices, build_s = _timed(build_fleet, num_devices, test=True, seed=seed)
+    snapshots = FleetSnapshots(path)
+    _, save_s = _timed(snapshots.save, devices, time.time())
+    longest_pause, background_s = _timed(_background_save, snapshots, devices)
+    del devices
+    restored, restore_s = _timed(restore_fleet, FleetSnapshots(path), test=True, seed=seed)
+    assert len(restored) == num_devices
+    return {"engine": "objects", "seeded": seed is not None, "devices": num_devices,
+            "snapshot_mb": round(os.path.getsize(path) / 1e6, 1), "build_new_s": build_s, "save_s": save_s,
+            "background_save_s": background_s, "longest_loop_pause_s": round(longest_pause, 3),
+            "restore_s": restore_s, "restored_per_s": round(num_devices / restore_s)}
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=1_000_000, help="Array engine devices")
+    parser.add_argument("--objects", type=int, default=200_000, help="Object fleet devices")
+    parser.add_argument("--seed", type=int, help="Fleet seed of the object fleet (default: unseeded)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [bench_arrays(args.devices, os.path.join(tmp, "arrays.snap")),
+                   bench_objects(args.objects, os.path.join(tmp, "objects.snap"), args.seed)]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
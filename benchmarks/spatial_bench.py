@@ -0,0 +1,76 @@
+"""Measures the spatial grid index over a large fleet: update cost and query latency.
+
+Points are spread over the Nairobi square like random_coordinates(). Reports
+  * build: seconds to insert every device
+  * update_ns: mean cost of one update() after a step-sized move (~17 m, a
+    car at 60 km/h between one-second ticks), as called from update_location
+  * per query kind (count / within / nearest): p50 and p99 microseconds over
+    --queries random points, with the mean number of hits
+
+Usage:
+    python -m benchmarks.spatial_bench [--devices N] [--cell-m METERS] [--radius-m METERS] [--k N] [--queries N]
+"""
+import json
+import time
+import random
+import argparse
+from typing import Callable, Dict, List
+
+from src.util.sim_functions import DEGREES_PER_KM
+from src.util.spatial_index import NAIROBI_LAT_RANGE, NAIROBI_LON_RANGE, CELL_METERS, GridIndex
+
+STEP_DEG = 60 / 3600 * DEGREES_PER_KM  # One second at 60 km/h
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {"p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+            "p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1)}
+
+def _timed(query: Callable, points: List[tuple]) -> Dict[str, float]:
+    samples, hits = [], 0
+    for lat, lon in points:
+        start = time.perf_counter()
+        result = query(lat, lon)
+        samples.append(time.perf_counter() - start)
+        hits += result if isinstance(result, int) else len(result)
+    return dict(_percentiles(samples), mean_hits=round(hits / len(points), 1))
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=1_000_000)
+    parser.add_argument("--cell-m", type=float, default=CELL_METERS)
+    parser.add_argument("--radius-m", type=float, default=50.0, help="Radius of count/within queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per nearest query")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    locations = [[rng.uniform(*NAIROBI_LAT_RANGE), rng.uniform(*NAIROBI_LON_RANGE), 0.0]
+                 for _ in range(args.devices)]
+    keys = [f"phone-{i}" for i in range(args.devices)]
+    index = GridIndex(args.cell_m)
+    start = time.perf_counter()
+    for key, location in zip(keys, locations):
+        index.update(key, location)
+    build = time.perf_counter() - start
+
+    moved = min(args.devices, 200_000)
+    for location in locations[:moved]:
+        location[rng.randrange(2)] += rng.choice((-STEP_DEG, STEP_DEG))
+    start = time.perf_counter()
+    for key, location in zip(keys[:moved], locations[:moved]):
+        index.update(key, location)
+    update_ns = (time.perf_counter() - start) / moved * 1e9
+
+    points = [(rng.uniform(*NAIROBI_LAT_RANGE), rng.uniform(*NAIROBI_LON_RANGE)) for _ in range(args.queries)]
+    result = {
+        "devices": args.devices, "cell_m": args.cell_m, "radius_m": args.radius_m, "k": args.k,
+        "cells": len(index.cells), "build_s": round(build, 2), "update_ns": round(update_ns),
+        "count": _timed(lambda lat, lon: index.count_within(lat, lon, args.radius_m), points),
+        "within": _timed(lambda lat, lon: index.within(lat, lon, args.radius_m), points),
+        "nearest": _timed(lambda lat, lon: index.nearest(lat, lon, args.k), points),
+    }
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
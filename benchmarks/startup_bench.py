@@ -0,0 +1,75 @@
+"""Measures the cold-start cost of the simulator: module imports and time to the first and the full fleet.
+
+Every measurement runs in a fresh interpreter, as on a newly booted instance.
+  * imports: wall time of `python -c "import MODULE"` (best of --repeat),
+    next to a bare interpreter and to boto3 + botocore + tenacity, which every
+    device module used to import
+  * startup: a process builds --devices devices and runs them for one tick
+    each into --sink under a VirtualClock; the runner's boot milestones
+    (fleet_ready, first_record, full_fleet) are seconds since that process
+    started. Under a real clock full_fleet also includes the phase spread of
+    up to one --delay.
+
+Usage:
+    python -m benchmarks.startup_bench [--devices 1000,100000] [--sink null] [--repeat 5]
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict
+
+IMPORTS = {
+    "interpreter": "pass",
+    "boto3 + botocore + tenacity": "import boto3, botocore.exceptions, tenacity",
+    "src.util.sim_functions": "import src.util.sim_functions",
+    "src.ec2.iot_devices.phone": "import src.ec2.iot_devices.phone",
+    "src.ec2.iot_devices.fleet": "import src.ec2.iot_devices.fleet",
+    "src.ec2.iot_devices.main": "import src.ec2.iot_devices.main",
+}
+
+STARTUP = """
+import sys, json
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet, open_producer
+from src.util.clock import VirtualClock
+clock = VirtualClock()
+producer = open_producer(False, {sink!r})
+runner = FleetRunner(build_fleet({devices}, test=False, producer=producer, clock=clock), clock=clock)
+runner.run(steps=1)
+producer.close()
+print(json.dumps(dict(runner.boot, aws_loaded="boto3" in sys.modules)))
+"""
+
+def _wall(code: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def startup(devices: int, sink: str) -> Dict[str, object]:
+    done = subprocess.run([sys.executable, "-c", STARTUP.format(devices=devices, sink=sink)], check=True,
+                          capture_output=True, text=True)
+    return dict({"devices": devices, "sink": sink}, **json.loads(done.stdout.splitlines()[-1]))
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", default="1000,100000", help="Comma-separated fleet sizes")
+    parser.add_argument("--sink", default="null", help="Sink spec of the startup runs, see src.util.sinks")
+    parser.add_argument("--repeat", type=int, default=5, help="Interpreters per import measurement")
+    args = parser.parse_args(argv)
+
+    imports = {}
+    for name, code in IMPORTS.items():
+        try:
+            imports[name] = round(_wall(code, args.repeat) * 1000, 1)
+        except subprocess.CalledProcessError:
+            imports[name] = None  # Not installed
+    results = {"import_ms": imports,
+               "startup": [startup(int(devices), args.sink) for devices in args.devices.split(",")]}
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
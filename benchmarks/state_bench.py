@@ -0,0 +1,59 @@
+"""Measures the device state store: write units and bytes per 1k pings for several flush windows.
+
+A fleet is stepped under a virtual clock into a MemorySink, then its records
+are replayed into a StateStore once per --windows value. Reports per window:
+items written, write units per 1k pings (one unit per started KB of item, as
+DynamoDB bills BatchWriteItem), delta bytes per 1k pings, batches, and pings
+recorded per second. The "full" row is the naive baseline: one whole item
+per ping.
+
+Usage:
+    python -m benchmarks.state_bench [--devices N] [--steps N] [--delay SECONDS] [--windows 0,10,60,300]
+"""
+import json
+import time
+import argparse
+from typing import Dict, List
+
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet
+from src.util.clock import VirtualClock
+from src.util.sinks import MemorySink
+from src.util.state_store import MemoryTable, StateStore, decode_record, item_bytes, write_units
+
+def _pings(devices: int, steps: int, delay: float) -> List[Dict[str, object]]:
+    sink = MemorySink(devices * steps)
+    clock = VirtualClock(start=1704067200)
+    FleetRunner(build_fleet(devices, test=False, producer=sink, seed=1, clock=clock), delay, clock=clock).run(steps)
+    # Replayed in timestamp order, as they would arrive
+    return sorted((decode_record(data) for _, data in sink.records), key=lambda payload: payload["timestamp"])
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--steps", type=int, default=30, help="Pings per device")
+    parser.add_argument("--delay", type=float, default=10.0, help="Seconds between two pings of a device")
+    parser.add_argument("--windows", default="0,10,60,300", help="Comma-separated flush windows in seconds")
+    args = parser.parse_args(argv)
+
+    pings = _pings(args.devices, args.steps, args.delay)
+    per_1k = 1000 / len(pings)
+    results = [{"window": "full", "pings": len(pings), "items_written": len(pings),
+                "write_units_per_1k": round(sum(write_units(p) for p in pings) * per_1k, 1),
+                "bytes_per_1k": round(sum(item_bytes(p) for p in pings) * per_1k)}]
+    for window in [float(w) for w in args.windows.split(",")]:
+        store = StateStore(MemoryTable(), window=window)
+        start = time.perf_counter()
+        for payload in pings:
+            store.record(payload)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        stats = store.stats
+        results.append({"window": window, "pings": stats["pings"], "items_written": stats["items_written"],
+                        "write_units_per_1k": round(store.write_units_per_1k_pings(), 1),
+                        "bytes_per_1k": round(stats["delta_bytes"] * per_1k), "batches": stats["batches"],
+                        "coalesced": stats["coalesced"], "unchanged": stats["unchanged"],
+                        "pings_per_s": round(len(pings) / elapsed)})
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
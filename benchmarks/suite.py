@@ -0,0 +1,324 @@
+"""Runs the simulator benchmarks across fleet sizes and sinks and saves them as one JSON file.
+
+Sections:
+  * micro: heading_to_vector, update_location_vector / advance_location, every payload
+    encoder and simulate_step of each device class, in ns per call
+  * fleet: an in-process fleet of each --sizes, built and run under a virtual clock as fast
+    as possible into each --sinks (null, file, local = the Kinesis stand-in of
+    src/util/kinesis_local.py), for at most --max-steps device steps. Reports steps, bytes
+    and wall time per second, RSS per device and per-tick latency (wall time of one
+    scheduler tick, i.e. every device due in the same 10 ms)
+  * producer: --records pre-encoded payloads put straight into each sink
+  * launcher: `python -m src.ec2.iot_devices.main N --steps 1 --virtual-clock --sink null`
+    in a subprocess (start-up, build and one step per device), wall time and peak RSS
+
+Fleet and producer cases run in a fresh process each, so memory figures and the stand-in
+(which shares that process and its GIL) do not leak from one case into the next.
+
+Results carry the commit they were measured at. --compare BASELINE.json prints the change
+of every metric against an earlier file and exits with status 1 if one got worse by more
+than --threshold percent; with --current the two files are compared without running.
+
+Usage:
+    python -m benchmarks.suite [--sizes 1000 10000 100000 1000000] [--sinks null file local]
+                               [--max-steps N] [--records N] [--output PATH]
+                               [--compare BASELINE.json [--current RESULTS.json]] [--threshold PCT]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from typing import Callable, Dict, List
+
+from src.ec2.iot_devices.fleet import DEVICE_CLASSES, FleetRunner, build_fleet
+from src.util.clock import VirtualClock
+from src.util.encoders import ENCODERS
+from src.util.scheduler import LatenessStats
+from src.util.sim_functions import heading_to_vector, update_location_vector, advance_location
+from src.util.sinks import get_sink
+
+# Constants
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+SINKS = ["null", "file", "local"]
+MAX_STEPS = 100_000  # Device steps per fleet case; large fleets do not get round to every device
+RECORDS = 20_000  # Records per producer case
+MICRO_CALLS = 200_000
+LOCAL_SHARDS = 64  # Stand-in shards, so its 1000 records/s per shard limit stays out of the way
+DELAY = 60.0  # Seconds between two pings of the same device
+START = 1704067200  # 2024-01-01 UTC, the simulated start of every fleet case
+TICK_RESOLUTION = 0.0001  # 0.1 ms buckets for per-tick latency
+HIGHER_IS_BETTER = ("_per_sec",)
+LOWER_IS_BETTER = ("ns_per_call", "_ms", "_s", "bytes_per_device", "rss_mb")
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def environment() -> Dict[str, object]:
+    """Where and at which commit the results were measured."""
+    return {
+        "commit": _git("rev-parse", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def _rss_bytes() -> int:
+    """Current resident set size, from /proc (Linux only)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def _peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # KB on Linux
+
+def _ns_per_call(name: str, calls: int, fn: Callable[[int], object]) -> Dict[str, object]:
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return {"name": f"micro/{name}", "calls": calls,
+            "ns_per_call": round((time.perf_counter() - start) / calls * 1e9, 1)}
+
+def bench_micro(calls: int) -> List[Dict[str, object]]:
+    """ns per call of the movement helpers, every encoder and each device class's step."""
+    headings = [0.0, 90.0, 180.0, 270.0, 45.0]
+    vector = heading_to_vector(90.0, 60)
+    location = [-1.292076, 36.821948, 0.0]
+    results = [
+        _ns_per_call("heading_to_vector", calls, lambda i: heading_to_vector(headings[i % 5], 60)),
+        _ns_per_call("update_location_vector", calls, lambda i: update_location_vector(location, vector, 0.0, 60)),
+        _ns_per_call("advance_location", calls, lambda i: advance_location(location, vector, 0.0, 60)),
+    ]
+
+    random.seed(0)
+    sink = get_sink("null")
+    devices = build_fleet(1000, test=False, producer=sink)
+    for device in devices:
+        device.simulate_step()  # Moves off the 6-digit start grid, like a running fleet
+    for name, encoder in ENCODERS.items():
+        results.append(_ns_per_call(f"encode/{name}", calls,
+                                    lambda i: encoder.encode(devices[i % 1000], START)))
+    for prefix in DEVICE_CLASSES:
+        group = [device for device in devices if device.device_id.startswith(prefix)]
+        results.append(_ns_per_call(f"simulate_step/{prefix}", calls,
+                                    lambda i: group[i % len(group)].simulate_step()))
+    return results
+
+def _time_ticks(scheduler) -> LatenessStats:
+    """Wraps scheduler.run_due to record the wall time of every tick that fired something."""
+    stats = LatenessStats(resolution=TICK_RESOLUTION)
+    run_due = scheduler.run_due
+
+    def timed(now: float) -> int:
+        started = time.perf_counter()
+        fired = run_due(now)
+        if fired:
+            stats.record(time.perf_counter() - started)
+        return fired
+
+    scheduler.run_due = timed
+    return stats
+
+def _open_sink(name: str, directory: str):
+    """Builds a sink for a case; "local" starts a Kinesis stand-in in this process."""
+    if name == "file":
+        return get_sink(f"file:{os.path.join(directory, 'records.ndjson')}")
+    if name == "local":
+        from src.util.kinesis_local import LocalKinesis, start_server
+        server = start_server(kinesis=LocalKinesis(shards=LOCAL_SHARDS))
+        # The stand-in does not check signatures, but botocore needs something to sign with
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+        return get_sink(f"kinesis:http://127.0.0.1:{server.server_address[1]}")
+    return get_sink(name)
+
+def bench_fleet(size: int, sink_name: str, max_steps: int) -> Dict[str, object]:
+    """Builds `size` devices into `sink_name` and runs them under a virtual clock."""
+    logging.getLogger().setLevel(logging.WARNING)
+    directory = tempfile.mkdtemp(prefix="nairobi-bench-")
+    try:
+        sink = _open_sink(sink_name, directory)
+        random.seed(size)  # The same fleet for every sink
+        clock = VirtualClock(start=START)
+        before = _rss_bytes()
+        started = time.perf_counter()
+        devices = build_fleet(size, test=False, producer=sink, clock=clock)
+        build_s = time.perf_counter() - started
+        bytes_per_device = (_rss_bytes() - before) / size
+
+        runner = FleetRunner(devices, DELAY, clock=clock)
+        ticks = _time_ticks(runner.scheduler)
+        # First ticks are spread over one interval, so this much simulated time makes ~max_steps steps
+        started = time.perf_counter()
+        runner.run(duration=DELAY * max_steps / size)
+        sink.close()
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    summary = ticks.summary()
+    return {
+        "name": f"fleet/{size}/{sink_name}",
+        "devices": size,
+        "sink": sink_name,
+        "steps": runner.steps_run,
+        "records": sink.stats["records_sent"],
+        "dropped": sink.stats["dropped"],
+        "build_s": round(build_s, 2),
+        "run_s": round(elapsed, 3),
+        "steps_per_sec": round(runner.steps_run / elapsed, 1),
+        "payloads_per_sec": round(sink.stats["records_sent"] / elapsed, 1),
+        "bytes_per_sec": round(sink.stats["bytes_sent"] / elapsed, 1),
+        "bytes_per_device": round(bytes_per_device, 1),
+        "rss_mb": _peak_rss_mb(),
+        "ticks": summary["ticks"],
+        "tick_p50_ms": summary["p50_ms"],
+        "tick_p99_ms": summary["p99_ms"],
+        "tick_max_ms": summary["max_ms"],
+    }
+
+def bench_producer(sink_name: str, records: int) -> Dict[str, object]:
+    """Puts `records` pre-encoded payloads into `sink_name` and closes it."""
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(0)
+    devices = build_fleet(1000, test=True)
+    encoder = ENCODERS["template"]
+    payloads = [(encoder.encode(devices[i % 1000], START + i), devices[i % 1000].device_id) for i in range(records)]
+    directory = tempfile.mkdtemp(prefix="nairobi-bench-")
+    try:
+        sink = _open_sink(sink_name, directory)
+        started = time.perf_counter()
+        for data, key in payloads:
+            sink.put(data, key)
+        sink.close()
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {
+        "name": f"producer/{sink_name}",
+        "sink": sink_name,
+        "records": sink.stats["records_sent"],
+        "dropped": sink.stats["dropped"],
+        "resent": sink.stats.get("resent", 0),
+        "run_s": round(elapsed, 3),
+        "payloads_per_sec": round(sink.stats["records_sent"] / elapsed, 1),
+        "bytes_per_sec": round(sink.stats["bytes_sent"] / elapsed, 1),
+    }
+
+def bench_launcher(size: int) -> Dict[str, object]:
+    """Starts the launcher for one virtual step of `size` devices into the null sink."""
+    command = [sys.executable, "-m", "src.ec2.iot_devices.main", str(size), "--steps", "1",
+               "--delay", str(DELAY), "--virtual-clock", "--sink", "null", "--seed", "1"]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError(f"{' '.join(command)} exited with {process.returncode}")
+    return {
+        "name": f"launcher/{size}",
+        "devices": size,
+        "run_s": round(elapsed, 3),
+        "devices_per_sec": round(size / elapsed, 1),
+        "rss_mb": round(usage.ru_maxrss / 1024, 1),
+    }
+
+def _isolated(fn: Callable[..., Dict[str, object]], *args) -> Dict[str, object]:
+    """Runs one case in a freshly spawned process."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(fn, args)
+
+def run_suite(sizes: List[int], sinks: List[str], max_steps: int = MAX_STEPS, records: int = RECORDS,
+              micro_calls: int = MICRO_CALLS) -> Dict[str, object]:
+    """Runs every section and returns {"environment": ..., "results": [...]}."""
+    results = bench_micro(micro_calls)
+    for size in sizes:
+        for sink_name in sinks:
+            results.append(_isolated(bench_fleet, size, sink_name, max_steps))
+            logging.info("%s", results[-1])
+    for sink_name in sinks:
+        results.append(_isolated(bench_producer, sink_name, records))
+    for size in sizes:
+        results.append(bench_launcher(size))
+    return {"environment": environment(), "results": results}
+
+def _direction(metric: str) -> int:
+    """+1 if a higher value is better, -1 if lower is better, 0 if the metric is not compared."""
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+def compare(baseline: Dict[str, object], current: Dict[str, object],
+            threshold: float = 10.0) -> List[Dict[str, object]]:
+    """Changes of every comparable metric of the cases both result files share.
+
+    A change is a regression when the metric got worse by more than `threshold` percent.
+    """
+    before = {result["name"]: result for result in baseline["results"]}
+    changes = []
+    for result in current["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        for metric, value in result.items():
+            direction = _direction(metric)
+            if not direction or not old.get(metric):
+                continue
+            change = (value - old[metric]) / old[metric] * 100
+            changes.append({"name": result["name"], "metric": metric, "baseline": old[metric],
+                            "current": value, "change_pct": round(change, 1),
+                            "regressed": change * direction < -threshold})
+    return changes
+
+def _load(path: str) -> Dict[str, object]:
+    with open(path) as f:
+        return json.load(f)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--sinks", nargs="+", choices=SINKS, default=SINKS)
+    parser.add_argument("--max-steps", type=int, default=MAX_STEPS, help="Device steps per fleet case")
+    parser.add_argument("--records", type=int, default=RECORDS, help="Records per producer case")
+    parser.add_argument("--micro-calls", type=int, default=MICRO_CALLS)
+    parser.add_argument("--output", help="Results file (default: bench-<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Earlier results file to compare against")
+    parser.add_argument("--current", help="With --compare, compare this file instead of running the suite")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.current:
+        current = _load(args.current)
+    else:
+        current = run_suite(args.sizes, args.sinks, args.max_steps, args.records, args.micro_calls)
+        output = args.output or f"bench-{(current['environment']['commit'] or 'unknown')[:12]}.json"
+        with open(output, "w") as f:
+            json.dump(current, f, indent=2)
+        logging.info("Results written to %s", output)
+    if not args.compare:
+        print(json.dumps(current["results"], indent=2))
+        return
+
+    changes = compare(_load(args.compare), current, args.threshold)
+    print(json.dumps(changes, indent=2))
+    if any(change["regressed"] for change in changes):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,10 +1,10 @@
-import time
-import json
 import sys
 import random
 import logging
 from typing import List
-from src.util.sim_functions import parse_3d, heading_to_vector, update_location_vector, send_to_kinesis
+from src.util.sim_functions import parse_3d, heading_to_vector, advance_location, send_to_kinesis
+from src.util.encoders import TemplateJsonEncoder
+from src.util.clock import REAL_CLOCK
 # from ....src.util.sim_functions import parse_3d, heading_to_vector, update_location_vector, send_to_kinesis
 
 # Constants
@@ -17,25 +17,47 @@ GAS_REFILL_AMOUNT = 100.0  # Gas refill amount
 logging.basicConfig(level=logging.INFO)
 
 class Car:
-    def __init__(self, device_id: str, location: List[float], heading: float, test: bool = True):
+    # Fixed attribute slots and no instance __dict__ keep a device small (see DEVICE_BYTES_BUDGET in fleet.py)
+    __slots__ = ("device_id", "location", "heading", "test", "producer", "encoder", "rng", "clock",
+                 "speed_kmh", "total_distance_km", "gas", "spatial_index", "emission")
+
+    DEVICE_TYPE = "car"
+    LEVEL_FIELD = "gas"  # Payload key of the battery/gas level
+    ENCODER = TemplateJsonEncoder()  # Same bytes as json.dumps(get_payload()), without the dict
+
+    def __init__(self, device_id: str, location: List[float], heading: float, test: bool = True,
+                 producer=None, encoder=None, rng=None, clock=None, spatial_index=None,
+                 emission=None):
         self.device_id = device_id
         self.location = location
         self.heading = heading
         self.test = test
+        self.producer = producer  # Shared KinesisProducer, None sends each record on its own
+        self.encoder = encoder if encoder is not None else self.ENCODER
+        # Per-device DeviceRandom stream; the random module itself when unseeded
+        self.rng = rng if rng is not None else random
+        # RealClock by default; a VirtualClock runs the device in simulated time
+        self.clock = clock if clock is not None else REAL_CLOCK
+        # FleetIndex (src/util/spatial_index.py) kept current by update_location, None for no index
+        self.spatial_index = spatial_index
+        if spatial_index is not None:
+            spatial_index.update(device_id, location)
+        # Shared emission policy (src/util/emission.py) that may suppress predictable records
+        self.emission = emission
         # Random speed between 30-90 km/h on initialization
-        self.speed_kmh = random.randint(30, 90)
+        self.speed_kmh = self.rng.randint(30, 90)
         self.total_distance_km = 0.0
         self.gas = GAS_REFILL_AMOUNT
 
     def update_heading(self):
         """Randomly update the heading (1 in 5 chance)."""
-        if random.randint(1, 5) == 1:
-            self.heading = random.choice([0, 90, 180, 270])
+        if self.rng.randint(1, 5) == 1:
+            self.heading = self.rng.choice([0, 90, 180, 270])
 
     def update_gas(self):
         """Update gas level: refill if below threshold (with chance) and then consume gas."""
         did_refill = False
-        if self.gas <= GAS_REFILL_THRESHOLD and random.randint(1, 10) == 1:
+        if self.gas <= GAS_REFILL_THRESHOLD and self.rng.randint(1, 10) == 1:
             self.gas = GAS_REFILL_AMOUNT
             did_refill = True
     
@@ -46,43 +68,64 @@ class Car:
     def update_location(self):
         """Update location and total distance based on current heading and speed."""
         velocity_vector = heading_to_vector(self.heading, self.speed_kmh)
-        self.location, self.total_distance_km = update_location_vector(
+        self.total_distance_km = advance_location(
             self.location, velocity_vector, self.total_distance_km, self.speed_kmh
         )
+        if self.spatial_index is not None:
+            self.spatial_index.update(self.device_id, self.location)
+
+    @property
+    def status(self) -> str:
+        """Status string reported in the payload."""
+        return "ping"
+
+    @property
+    def level(self) -> float:
+        """Gas level as reported in the payload."""
+        return self.gas
 
     def get_payload(self):
         """Construct and return the payload dictionary."""
         payload = {
             "deviceId": self.device_id,
-            "timestamp": int(time.time()),
-            "status": "ping",
-            "location": self.location,
-            "gas": self.gas,
+            "timestamp": int(self.clock.time()),
+            "status": self.status,
+            "location": self.location[:],
+            "gas": self.level,
         }
         return payload
 
     def simulate_step(self):
-        """Simulate a single step: update heading, gas, location and send/log payload."""
+        """Simulate a single step: update heading, gas, location and send/log payload.
+
+        Returns the payload dict in TEST mode, else the encoded record (None when the emission policy holds it back).
+        """
         self.update_heading()
         self.update_gas()
         self.update_location()
-        payload = self.get_payload()
         if self.test:
+            payload = self.get_payload()
             logging.info("Simulation payload: %s", payload)
+            return payload
+        timestamp = int(self.clock.time())
+        if self.emission is not None and not self.emission.should_send(self, timestamp):
+            return None
+        data_bytes = self.encoder.encode(self, timestamp)
+        if self.producer is not None:
+            self.producer.put(data_bytes, self.device_id)
         else:
-            data_bytes = json.dumps(payload).encode("utf-8")
             send_to_kinesis(data=data_bytes, key=self.device_id)
-        return payload
+        return data_bytes
 
     def simulate(self, steps: int = 0, delay: float = 60.0):
         """Run the simulation for a given number of steps."""
         if steps == 0:
             while True:
                 self.simulate_step()
-                time.sleep(delay)
+                self.clock.sleep(delay)
         for _ in range(steps):
             self.simulate_step()
-            time.sleep(delay)
+            self.clock.sleep(delay)
 
 if __name__ == "__main__":
     if len(sys.argv) not in [4, 5]:
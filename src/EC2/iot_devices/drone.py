@@ -1,10 +1,10 @@
-import time
-import json
 import sys
 import random
 import logging
 from typing import List
-from src.util.sim_functions import parse_3d, heading_to_vector, update_location_vector, send_to_kinesis
+from src.util.sim_functions import parse_3d, heading_to_vector, advance_location, send_to_kinesis
+from src.util.encoders import TemplateJsonEncoder
+from src.util.clock import REAL_CLOCK
 
 # Constants
 DEGREES_PER_KM = 0.009  # Nairobi (not explicitly used here)
@@ -18,12 +18,34 @@ DESCENT_RATE = 0.3  # Altitude loss per second during descent
 logging.basicConfig(level=logging.INFO)
 
 class Drone:
-    def __init__(self, device_id: str, location: List[float], heading: float, test: bool = True):
+    # Fixed attribute slots and no instance __dict__ keep a device small (see DEVICE_BYTES_BUDGET in fleet.py)
+    __slots__ = ("device_id", "location", "heading", "test", "producer", "encoder", "rng", "clock",
+                 "speed_kmh", "total_distance_km", "battery", "is_descending", "is_landed", "spatial_index", "emission")
+
+    DEVICE_TYPE = "drone"
+    LEVEL_FIELD = "battery"  # Payload key of the battery/gas level
+    ENCODER = TemplateJsonEncoder()  # Same bytes as json.dumps(get_payload()), without the dict
+
+    def __init__(self, device_id: str, location: List[float], heading: float, test: bool = True,
+                 producer=None, encoder=None, rng=None, clock=None, spatial_index=None,
+                 emission=None):
         self.device_id = device_id
         self.location = location
         self.heading = heading
         self.test = test
-        self.speed_kmh = random.randint(20, 60)
+        self.producer = producer  # Shared KinesisProducer, None sends each record on its own
+        self.encoder = encoder if encoder is not None else self.ENCODER
+        # Per-device DeviceRandom stream; the random module itself when unseeded
+        self.rng = rng if rng is not None else random
+        # RealClock by default; a VirtualClock runs the device in simulated time
+        self.clock = clock if clock is not None else REAL_CLOCK
+        # FleetIndex (src/util/spatial_index.py) kept current by update_location, None for no index
+        self.spatial_index = spatial_index
+        if spatial_index is not None:
+            spatial_index.update(device_id, location)
+        # Shared emission policy (src/util/emission.py) that may suppress predictable records
+        self.emission = emission
+        self.speed_kmh = self.rng.randint(20, 60)
         self.total_distance_km = 0.0
         self.battery = 100.0
         self.is_descending = False
@@ -60,45 +82,65 @@ class Drone:
                     velocity_vector = (0.0, 0.0, 0.0)
             else:
                 velocity_vector = heading_to_vector(self.heading, self.speed_kmh)
-                altitude_change = random.uniform(-ALTITUDE_CHANGE_RATE, ALTITUDE_CHANGE_RATE)
+                altitude_change = self.rng.uniform(-ALTITUDE_CHANGE_RATE, ALTITUDE_CHANGE_RATE)
                 velocity_vector = (velocity_vector[0], velocity_vector[1], altitude_change)
-        self.location, self.total_distance_km = update_location_vector(
+        self.total_distance_km = advance_location(
             self.location, velocity_vector, self.total_distance_km, self.speed_kmh
         )
+        if self.spatial_index is not None:
+            self.spatial_index.update(self.device_id, self.location)
+
+    @property
+    def status(self) -> str:
+        """Status string reported in the payload."""
+        return "landed" if self.is_landed else "descending" if self.is_descending else "flying"
+
+    @property
+    def level(self) -> float:
+        """Battery level as reported in the payload."""
+        return round(self.battery, 1)
 
     def get_payload(self):
         """Construct the payload dictionary for the current state."""
-        status = "landed" if self.is_landed else "descending" if self.is_descending else "flying"
         payload = {
             "deviceId": self.device_id,
-            "timestamp": int(time.time()),
-            "status": status,
-            "location": self.location,
-            "battery": round(self.battery, 1),
+            "timestamp": int(self.clock.time()),
+            "status": self.status,
+            "location": self.location[:],
+            "battery": self.level,
         }
         return payload
 
     def simulate_step(self):
-        """Perform a single simulation step: update battery, movement and send/log payload."""
+        """Perform a single simulation step: update battery, movement and send/log payload.
+
+        Returns the payload dict in TEST mode, else the encoded record (None when the emission policy holds it back).
+        """
         self.update_battery()
         self.update_movement()
-        payload = self.get_payload()
         if self.test:
+            payload = self.get_payload()
             logging.info("Drone payload: %s", payload)
+            return payload
+        timestamp = int(self.clock.time())
+        if self.emission is not None and not self.emission.should_send(self, timestamp):
+            return None
+        data_bytes = self.encoder.encode(self, timestamp)
+        if self.producer is not None:
+            self.producer.put(data_bytes, self.device_id)
         else:
-            data_bytes = json.dumps(payload).encode("utf-8")
             send_to_kinesis(data=data_bytes, key=self.device_id)
-        return payload
+        return data_bytes
 
     def simulate(self, steps: int = 0, delay: float = 60.0):
         """Run the simulation for a specified number of steps."""
         if steps == 0:
             while True:
                 self.simulate_step()
-                time.sleep(delay)
+                self.clock.sleep(delay)
         for _ in range(steps):
             self.simulate_step()
-            time.sleep(delay)
+            self.clock.sleep(delay)
 
 if __name__ == "__main__":
     if len(sys.argv) not in [4, 5]:
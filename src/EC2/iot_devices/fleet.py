@@ -0,0 +1,472 @@
+import time
+import queue
+import random
+import hashlib
+import threading
+import multiprocessing
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from src.ec2.iot_devices.phone import Phone
+from src.ec2.iot_devices.car import Car
+from src.ec2.iot_devices.drone import Drone
+from src.util.encoders import get_encoder
+from src.util.rng import DeviceRandom
+from src.util.sinks import get_sink
+from src.util.background_sender import BackgroundSender
+from src.util.kinesis_producer import KinesisProducer
+from src.util.scheduler import TickScheduler
+from src.util.clock import VirtualClock, process_age
+from src.util.spatial_index import NAIROBI_LAT_RANGE, NAIROBI_LON_RANGE
+from src.util.emission import DeadReckoning
+from src.ec2.iot_devices.snapshot import FleetSnapshots, restore_devices
+from src.util.metrics import REGISTRY, Counter, Gauge, lateness_histogram, start_metrics_server
+
+# Constants
+PHONE_SHARE = 0.55  # 55% phones
+CAR_SHARE = 0.35    # 35% cars, the remaining 10% are drones
+DEFAULT_DELAY = 60.0  # Seconds between two pings of the same device
+REPORT_INTERVAL = 10.0  # Seconds between two health reports of a shard worker
+DEFAULT_SINK = "kinesis"  # Where records go outside TEST mode, see src.util.sinks
+DEVICE_BYTES_BUDGET = 400  # Bytes per object device (id, location, state); a 1M-device city in under 0.5 GB
+DEVICE_CLASSES = {"phone": Phone, "car": Car, "drone": Drone}
+
+logging.basicConfig(level=logging.INFO)
+
+def random_coordinates(rng=random) -> List[float]:
+    """Returns a random location within the square of Nairobi."""
+    return [
+        round(rng.uniform(*NAIROBI_LAT_RANGE), 6),  # Latitude
+        round(rng.uniform(*NAIROBI_LON_RANGE), 6),  # Longitude
+        0.000000  # Altitude
+    ]
+
+def random_seven_digit_integer(rng=random) -> int:
+    """Returns a random 7-digit integer."""
+    return rng.randint(1000000, 9999999)
+
+def random_heading(rng=random) -> float:
+    """Returns a random heading in degrees (0 = North, 90 = East, etc.)."""
+    return rng.choice([0, 90, 180, 270])
+
+def fleet_mix(num_devices: int) -> Tuple[int, int, int]:
+    """Splits a device count into (phones, cars, drones) using the 55/35/10 mix."""
+    phones = int(num_devices * PHONE_SHARE)
+    cars = int(num_devices * CAR_SHARE)
+    drones = num_devices - phones - cars
+    return phones, cars, drones
+
+def fleet_specs(num_devices: int, seed: Optional[int] = None) -> List[Tuple[str, List[float], float]]:
+    """Draws (device_id, location, heading) for a fleet with the 55/35/10 mix.
+
+    With a `seed` the same fleet is drawn on every run.
+    """
+    rng = random.Random(seed) if seed is not None else random
+    phones, cars, drones = fleet_mix(num_devices)
+    specs = []
+    for prefix, count in (("phone", phones), ("car", cars), ("drone", drones)):
+        for _ in range(count):
+            specs.append((f"{prefix}-{random_seven_digit_integer(rng)}", random_coordinates(rng),
+                          random_heading(rng)))
+    return specs
+
+def build_devices(specs: List[Tuple[str, List[float], float]], test: bool = True,
+                  producer: KinesisProducer = None, encoder: Optional[str] = None,
+                  seed: Optional[int] = None, clock=None, spatial_index=None, emission=None) -> List[object]:
+    """Builds Phone, Car and Drone objects from (device_id, location, heading) specs.
+
+    `encoder` names a wire format from src.util.encoders; None keeps each type's default.
+    With a `seed` every device gets its own DeviceRandom stream keyed by the seed and its id.
+    `clock` is shared by every device (and should be the runner's), the real clock by default.
+    A `spatial_index` (src.util.spatial_index.FleetIndex) is filled here and kept current as devices move.
+    An `emission` policy (src.util.emission.DeadReckoning) is shared by every device.
+    """
+    chosen = get_encoder(encoder) if encoder else None
+    devices = []
+    for device_id, location, heading in specs:
+        rng = DeviceRandom(seed, device_id) if seed is not None else None
+        devices.append(DEVICE_CLASSES[device_id.split("-", 1)[0]](
+            device_id, location, heading, test, producer, chosen, rng, clock, spatial_index, emission))
+    return devices
+
+def build_fleet(num_devices: int, test: bool = True, producer: KinesisProducer = None,
+                encoder: Optional[str] = None, seed: Optional[int] = None, clock=None,
+                spatial_index=None, emission=None) -> List[object]:
+    """Builds Phone, Car and Drone objects in-process with random ids, positions and headings.
+
+    All devices share `producer`, so their records leave in PutRecords batches.
+    """
+    return build_devices(fleet_specs(num_devices, seed), test, producer, encoder, seed, clock, spatial_index,
+                         emission)
+
+def restore_fleet(snapshots: FleetSnapshots, test: bool = True, producer: KinesisProducer = None,
+                  encoder: Optional[str] = None, seed: Optional[int] = None, clock=None,
+                  spatial_index=None, emission=None) -> Optional[List[object]]:
+    """Rebuilds the fleet saved by `snapshots`, or returns None if nothing was saved yet.
+
+    Devices keep their ids, positions, headings, levels, state and distance; with
+    a `seed` their random streams continue where the snapshot left them. A
+    VirtualClock is moved to the time the snapshot was taken, so simulated
+    time resumes where the saved fleet left it.
+    """
+    started = time.perf_counter()
+    loaded = snapshots.load()
+    if loaded is None:
+        return None
+    records, timestamp = loaded
+    devices = restore_devices(records, DEVICE_CLASSES, test, producer, encoder, seed, clock, spatial_index, emission)
+    if isinstance(clock, VirtualClock):
+        clock.now = timestamp
+    logging.info("Restored %d devices from %s (saved at %.0f) in %.3f s", len(devices), snapshots.path,
+                 timestamp, time.perf_counter() - started)
+    return devices
+
+def shard_for(device_id: str, num_shards: int) -> int:
+    """Stable shard of a device: the MD5 of its id, the hash Kinesis applies to the partition key."""
+    return int(hashlib.md5(device_id.encode("utf-8")).hexdigest(), 16) % num_shards
+
+class FleetRunner:
+    """Drives a whole fleet of devices from one asyncio scheduler.
+
+    Instead of one sleeping thread (and process) per device, every device is
+    a timer on a single timing wheel. Each device type can emit at its own
+    interval, and first ticks get random phase offsets so they spread out.
+
+    Args:
+        devices: Phone, Car and Drone objects.
+        delay: Default seconds between two pings of the same device.
+        intervals: Optional per-type intervals, e.g. {"drone": 10.0}, keyed by id prefix.
+        clock: The devices' clock; a VirtualClock runs the fleet in simulated time.
+        snapshots: Optional FleetSnapshots, saved every `snapshots.interval` seconds
+            of a run without a step limit (in the background, between ticks) and
+            once when any run ends.
+
+    `boot` records, in real seconds since the process started, when the fleet
+    was scheduled ("fleet_ready"), when the first device sent ("first_record")
+    and when every device had sent once ("full_fleet"). The last one includes
+    the phase spread, up to one interval by design.
+    """
+
+    def __init__(self, devices: List[object], delay: float = DEFAULT_DELAY,
+                 intervals: Optional[Dict[str, float]] = None, clock=None,
+                 snapshots: Optional[FleetSnapshots] = None):
+        self.devices = devices
+        self.delay = delay
+        self.intervals = intervals or {}
+        self.scheduler = TickScheduler(clock=clock)
+        self.snapshots = snapshots
+        self.snapshot_ticks = 0  # Scheduler firings that were snapshots, not device steps
+        self._saving: Optional[asyncio.Task] = None  # Periodic save in progress
+        self.boot: Dict[str, float] = {}
+
+    @property
+    def steps_run(self) -> int:
+        return self.scheduler.fired - self.snapshot_ticks
+
+    def interval_for(self, device: object) -> float:
+        return self.intervals.get(device.device_id.split("-", 1)[0], self.delay)
+
+    def save_snapshot(self) -> None:
+        self.snapshots.save(self.devices, self.scheduler.clock.time())
+
+    def _periodic_snapshot(self) -> None:
+        self.snapshot_ticks += 1
+        if self._saving is not None and not self._saving.done():
+            self.snapshots.stats["skipped"] += 1
+            logging.warning("Skipping a snapshot: the previous one is still being saved")
+            return
+        self._saving = asyncio.get_running_loop().create_task(self._save_in_background(self.scheduler.clock.time()))
+
+    async def _save_in_background(self, timestamp: float) -> None:
+        try:
+            await self.snapshots.save_in_background(self.devices, timestamp)
+        except Exception as e:
+            logging.error("Periodic snapshot failed: %s", e)
+
+    async def _run(self, duration: float) -> None:
+        await self.scheduler.run(duration)
+        if self._saving is not None:
+            await self._saving  # A periodic save still in progress lands before the final one
+
+    def _milestone(self, name: str) -> None:
+        self.boot[name] = round(process_age(), 3)
+        logging.info("Boot: %s %.3f s after the process started", name, self.boot[name])
+
+    def _reaching(self, device: object, names: Tuple[str, ...]):
+        """simulate_step of `device` that also records `names` on its first tick."""
+        def tick():
+            result = device.simulate_step()
+            if names[0] not in self.boot:
+                for name in names:
+                    self._milestone(name)
+            return result
+        return tick
+
+    def run(self, steps: int = 0, duration: float = 0.0) -> int:
+        """Run every device for `steps` ticks (0 = forever). Returns the number of device steps."""
+        start = self.scheduler.time_fn()
+        intervals = [self.interval_for(device) for device in self.devices]
+        # The phase comes from the device's own stream so seeded runs tick in the same order
+        phases = [device.rng.uniform(0, interval) for device, interval in zip(self.devices, intervals)]
+        # Only the first and the last device to tick carry the boot milestones, every other tick stays as it was
+        milestones: Dict[int, Tuple[str, ...]] = {}
+        if phases:
+            milestones[phases.index(min(phases))] = ("first_record",)
+            last = phases.index(max(phases))
+            milestones[last] = milestones.get(last, ()) + ("full_fleet",)
+        for index, (device, interval, phase) in enumerate(zip(self.devices, intervals, phases)):
+            callback = self._reaching(device, milestones[index]) if index in milestones else device.simulate_step
+            self.scheduler.add(callback, interval, count=steps, phase=phase, start=start)
+        self._milestone("fleet_ready")
+        if self.snapshots is not None and not steps:
+            # A timer that never runs out would keep a run with a step limit going forever
+            interval = self.snapshots.interval
+            self.scheduler.add(self._periodic_snapshot, interval, phase=interval, start=start)
+        try:
+            asyncio.run(self._run(duration))
+        finally:
+            if self.snapshots is not None:
+                self.save_snapshot()
+        logging.info("Tick lateness: %s", self.scheduler.lateness.summary())
+        logging.info("Boot (seconds after the process started): %s", self.boot)
+        return self.steps_run
+
+def open_producer(test: bool, sink: str = DEFAULT_SINK, background: Optional[Dict[str, object]] = None):
+    """The fleet's shared producer: None in TEST mode, else the sink for `sink`.
+
+    With `background` (BackgroundSender options, e.g. {"capacity": 100000,
+    "overflow": "spill"}) devices only queue records and sender threads deliver them.
+    """
+    if test:
+        return None
+    producer = get_sink(sink)
+    return BackgroundSender(producer, **background) if background is not None else producer
+
+def fleet_metrics(runner: FleetRunner, producer=None, labels: Optional[Dict[str, str]] = None) -> List[object]:
+    """Builds the fleet's metrics from counters it keeps anyway, so they cost nothing per record.
+
+    Register it with REGISTRY.add_collector(lambda: fleet_metrics(runner, producer)).
+    """
+    labels = labels or {}
+    metrics = [
+        Gauge("nairobi_devices", "Devices run by this process", labels, len(runner.devices)),
+        Counter("nairobi_device_steps_total", "Device simulation steps", labels, runner.steps_run),
+        lateness_histogram("nairobi_tick_lateness_seconds", "How late device ticks fired",
+                           runner.scheduler.lateness, labels),
+    ]
+    for milestone, seconds in runner.boot.items():
+        metrics.append(Gauge("nairobi_boot_seconds", "Seconds from process start to a boot milestone",
+                             {**labels, "milestone": milestone}, seconds))
+    if producer is not None:
+        stats = producer.stats
+        metrics += [
+            Counter("nairobi_records_sent_total", "Records accepted by the sink", labels, stats["records_sent"]),
+            Counter("nairobi_bytes_sent_total", "Payload bytes accepted by the sink", labels, stats["bytes_sent"]),
+            Counter("nairobi_records_dropped_total", "Records given up on", labels, stats["dropped"]),
+        ]
+        if "resent" in stats:
+            metrics.append(Counter("nairobi_records_resent_total", "Records sent again after a failure",
+                                   labels, stats["resent"]))
+        for key, name, help in (("retried", "nairobi_sender_retried_total", "Records queued for a delayed retry"),
+                                ("spilled", "nairobi_sender_spilled_total", "Records spilled to disk on overflow"),
+                                ("overflow_dropped", "nairobi_sender_overflow_dropped_total",
+                                 "Records dropped from a full sender queue")):
+            if key in stats:
+                metrics.append(Counter(name, help, labels, stats[key]))
+        if "batches" in stats:
+            metrics.append(Counter("nairobi_put_records_batches_total", "Successful PutRecords calls",
+                                   labels, stats["batches"]))
+        if hasattr(producer, "queue_depth"):
+            metrics.append(Gauge("nairobi_producer_queue_depth", "Records waiting for the next batch",
+                                 labels, producer.queue_depth))
+        router = getattr(producer, "router", None)
+        if router is not None:
+            hot = {router.shard_ids[shard] for shard in router.hot}
+            for shard_id, (bytes_rate, records_rate) in router.shard_rates().items():
+                shard_labels = {**labels, "shard_id": shard_id}
+                metrics += [
+                    Gauge("nairobi_shard_bytes_per_second", "Bytes routed to a shard in the last window",
+                          shard_labels, bytes_rate),
+                    Gauge("nairobi_shard_records_per_second", "Records routed to a shard in the last window",
+                          shard_labels, records_rate),
+                    Gauge("nairobi_shard_hot", "1 if the shard ran hot in the last window", shard_labels,
+                          int(shard_id in hot)),
+                ]
+        limiter = getattr(producer, "limiter", None)
+        if limiter is not None:
+            for shard_id, rate in limiter.shard_rates().items():
+                metrics.append(Gauge("nairobi_shard_allowed_records_per_second",
+                                     "Records/s the client-side limiter currently allows a shard",
+                                     {**labels, "shard_id": shard_id}, rate))
+    return metrics
+
+def _serve_metrics(runner: FleetRunner, producer, port: Optional[int], labels: Optional[Dict[str, str]] = None):
+    """Starts the /metrics endpoint for this process's fleet; returns (server, collector) or None."""
+    if port is None:
+        return None
+    collector = lambda: fleet_metrics(runner, producer, labels)
+    REGISTRY.add_collector(collector)
+    return start_metrics_server(port), collector
+
+def _stop_metrics(serving) -> None:
+    if serving is not None:
+        server, collector = serving
+        server.shutdown()
+        server.server_close()
+        REGISTRY.remove_collector(collector)
+
+def run_fleet(num_devices: int, steps: int = 0, delay: float = DEFAULT_DELAY, test: bool = True,
+              intervals: Optional[Dict[str, float]] = None, encoder: Optional[str] = None,
+              seed: Optional[int] = None, clock=None, sink: str = DEFAULT_SINK,
+              metrics_port: Optional[int] = None, background: Optional[Dict[str, object]] = None,
+              emission: Optional[Dict[str, object]] = None, snapshot: Optional[Dict[str, object]] = None) -> int:
+    """Builds a fleet and runs it in the current process.
+
+    Outside TEST mode records go to `sink`, a spec for src.util.sinks.get_sink,
+    through a BackgroundSender if `background` options are given.
+    With a `metrics_port` the process serves Prometheus metrics on it (0 picks a free port).
+    With `emission` options (e.g. {"position_m": 10.0}) a DeadReckoning policy holds back predictable records.
+    With `snapshot` options (e.g. {"path": "fleet.snap"}) the fleet saved in that file is restored
+    instead of building `num_devices` new ones, and the running fleet is saved to it periodically.
+    """
+    producer = open_producer(test, sink, background)
+    policy = DeadReckoning(**emission) if emission is not None else None
+    snapshots = FleetSnapshots(**snapshot) if snapshot is not None else None
+    devices = restore_fleet(snapshots, test, producer, encoder, seed, clock, emission=policy) if snapshots else None
+    if devices is None:
+        devices = build_fleet(num_devices, test, producer, encoder, seed, clock, emission=policy)
+    logging.info("Running %d devices in-process (mix %s)", len(devices), fleet_mix(len(devices)))
+    runner = FleetRunner(devices, delay, intervals, clock, snapshots)
+    serving = _serve_metrics(runner, producer, metrics_port)
+    try:
+        return runner.run(steps)
+    finally:
+        if producer is not None:
+            producer.close()
+        _stop_metrics(serving)
+        if policy is not None:
+            logging.info("Emission policy: %s", policy.stats)
+
+def _shard_report(index: int, runner: FleetRunner, producer: KinesisProducer, started: float,
+                  done: bool) -> Dict[str, object]:
+    stats = dict(producer.stats) if producer is not None else {}
+    return {
+        "shard": index,
+        "devices": len(runner.devices),
+        "steps": runner.steps_run,
+        # In TEST mode every step emits (logs) one record
+        "records": stats.get("records_sent", runner.steps_run),
+        "dropped": stats.get("dropped", 0),
+        "elapsed": time.time() - started,
+        "lateness": runner.scheduler.lateness.summary(),
+        "boot": dict(runner.boot),
+        "done": done,
+    }
+
+def _shard_worker(index: int, specs: List[Tuple[str, List[float], float]], steps: int, delay: float,
+                  test: bool, intervals: Optional[Dict[str, float]], encoder: Optional[str],
+                  seed: Optional[int], reports: multiprocessing.Queue, report_interval: float,
+                  clock=None, sink: str = DEFAULT_SINK, metrics_port: Optional[int] = None,
+                  background: Optional[Dict[str, object]] = None, emission: Optional[Dict[str, object]] = None,
+                  snapshot: Optional[Dict[str, object]] = None) -> None:
+    """Runs one shard of the fleet with its own producer and reports its health to the parent.
+
+    A VirtualClock arrives as a copy, so every shard starts at the same simulated time.
+    Shard i serves its metrics on `metrics_port` + i and keeps its snapshot in "<path>.<i>".
+    """
+    producer = open_producer(test, sink, background)
+    policy = DeadReckoning(**emission) if emission is not None else None
+    snapshots = FleetSnapshots(**dict(snapshot, path=f"{snapshot['path']}.{index}")) if snapshot is not None else None
+    devices = restore_fleet(snapshots, test, producer, encoder, seed, clock, emission=policy) if snapshots else None
+    if devices is None:
+        devices = build_devices(specs, test, producer, encoder, seed, clock, emission=policy)
+    runner = FleetRunner(devices, delay, intervals, clock, snapshots)
+    serving = _serve_metrics(runner, producer, metrics_port + index if metrics_port else metrics_port,
+                             {"shard": str(index)})
+    started = time.time()
+    finished = threading.Event()
+
+    def report_loop():
+        while not finished.wait(report_interval):
+            reports.put(_shard_report(index, runner, producer, started, False))
+
+    reporter = threading.Thread(target=report_loop, daemon=True)
+    reporter.start()
+    try:
+        runner.run(steps)
+    finally:
+        finished.set()
+        if producer is not None:
+            producer.close()
+        _stop_metrics(serving)
+        if policy is not None:
+            logging.info("Shard %d emission policy: %s", index, policy.stats)
+        reports.put(_shard_report(index, runner, producer, started, True))
+
+def aggregate_reports(reports: Dict[int, Dict[str, object]]) -> Dict[str, object]:
+    """Sums the latest report of every shard into fleet-wide health and throughput figures."""
+    elapsed = max((r["elapsed"] for r in reports.values()), default=0.0) or 1.0
+    records = sum(r["records"] for r in reports.values())
+    full = [r["boot"].get("full_fleet") for r in reports.values()]
+    return {
+        "shards": len(reports),
+        "shards_done": sum(r["done"] for r in reports.values()),
+        "devices": sum(r["devices"] for r in reports.values()),
+        "steps": sum(r["steps"] for r in reports.values()),
+        "records": records,
+        "dropped": sum(r["dropped"] for r in reports.values()),
+        "records_per_sec": round(records / elapsed, 1),
+        "worst_p99_lateness_ms": max((r["lateness"]["p99_ms"] for r in reports.values()), default=0.0),
+        # The fleet is only full once its slowest shard is; None until every shard is
+        "full_fleet_s": max(full) if full and None not in full else None,
+    }
+
+def run_sharded(num_devices: int, processes: int, steps: int = 0, delay: float = DEFAULT_DELAY,
+                test: bool = True, intervals: Optional[Dict[str, float]] = None, encoder: Optional[str] = None,
+                seed: Optional[int] = None, report_interval: float = REPORT_INTERVAL,
+                clock=None, sink: str = DEFAULT_SINK, metrics_port: Optional[int] = None,
+                background: Optional[Dict[str, object]] = None,
+                emission: Optional[Dict[str, object]] = None,
+                snapshot: Optional[Dict[str, object]] = None) -> Dict[str, object]:
+    """Splits the fleet across `processes` workers by the stable hash of each deviceId.
+
+    Every worker runs its shard on its own scheduler and producer; the parent
+    only collects their periodic reports and logs the aggregate. With a
+    `metrics_port` worker i serves its own /metrics on metrics_port + i.
+    With `snapshot` options worker i restores and saves its shard in "<path>.<i>",
+    so a restart has to use the same number of processes.
+    """
+    shards: List[List[Tuple[str, List[float], float]]] = [[] for _ in range(processes)]
+    for spec in fleet_specs(num_devices, seed):
+        shards[shard_for(spec[0], processes)].append(spec)
+
+    report_queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_shard_worker, name=f"fleet-shard-{i}", daemon=True,
+                                args=(i, shard, steps, delay, test, intervals, encoder, seed, report_queue,
+                                      report_interval, clock, sink, metrics_port, background, emission, snapshot))
+        for i, shard in enumerate(shards)
+    ]
+    for worker in workers:
+        worker.start()
+    logging.info("Running %d devices across %d processes", num_devices, processes)
+
+    latest: Dict[int, Dict[str, object]] = {}
+    while len([r for r in latest.values() if r["done"]]) < processes:
+        try:
+            report = report_queue.get(timeout=report_interval)
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                logging.error("All shard workers exited before reporting completion")
+                break
+            continue
+        latest[report["shard"]] = report
+        if not report["done"]:
+            alive = sum(worker.is_alive() for worker in workers)
+            logging.info("Fleet health (%d/%d workers alive): %s", alive, processes, aggregate_reports(latest))
+    for worker in workers:
+        worker.join()
+    summary = aggregate_reports(latest)
+    logging.info("Fleet finished: %s", summary)
+    return summary
@@ -0,0 +1,319 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from src.util.sim_functions import DEGREES_PER_KM
+from src.ec2.iot_devices import phone, car, drone
+
+# Constants
+HEADINGS = np.array([0.0, 90.0, 180.0, 270.0])
+HEADING_CHANGE_CHANCE = 0.2  # random.randint(1, 5) == 1
+REFILL_CHANCE = 0.1  # random.randint(1, 10) == 1
+SPLITTER = 134217729.0  # 2**27 + 1, Dekker split constant
+
+def round_like_python(values: np.ndarray, digits: int) -> np.ndarray:
+    """Vectorized equivalent of Python's round(value, digits).
+
+    np.round scales, rounds and unscales, so a product that lands exactly on
+    .5 is rounded half-to-even even when the true decimal value was slightly
+    above or below. The fixed per-second deltas of the simulators hit those
+    ties constantly; for them the exact product error (Dekker's two-product)
+    decides the direction the way Python does.
+    """
+    scale = 10.0 ** digits
+    scaled = values * scale
+    rounded = np.rint(scaled)
+    ties = np.flatnonzero(scaled - np.floor(scaled) == 0.5)
+    if ties.size:
+        tied = values[ties]
+        hi = SPLITTER * tied
+        v_hi = hi - (hi - tied)
+        v_lo = tied - v_hi
+        hi = SPLITTER * scale
+        s_hi = hi - (hi - scale)
+        s_lo = scale - s_hi
+        error = ((v_hi * s_hi - scaled[ties]) + v_hi * s_lo + v_lo * s_hi) + v_lo * s_lo
+        floor = np.floor(scaled[ties])
+        rounded[ties] = np.where(error > 0.0, floor + 1.0, np.where(error < 0.0, floor, rounded[ties]))
+    return rounded / scale
+
+class FleetArrays(ABC):
+    """Struct-of-arrays state for every device of one type.
+
+    Each attribute of the object model (location, heading, speed, battery/gas,
+    state flags) is held in one contiguous NumPy array, so a whole fleet is
+    advanced with a handful of vectorized operations per tick. Subclasses
+    mirror the update order and state machine of Phone, Car and Drone, and
+    must implement every abstract hook to be instantiated.
+    """
+
+    prefix = "device"
+    level_name = "battery"
+
+    def __init__(self, ids: np.ndarray, lat: np.ndarray, lon: np.ndarray, alt: np.ndarray,
+                 heading: np.ndarray, speed: np.ndarray, level: np.ndarray):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.alt = np.asarray(alt, dtype=np.float64)
+        self.heading = np.asarray(heading, dtype=np.float64)
+        self.speed = np.asarray(speed, dtype=np.float64)
+        self.level = np.asarray(level, dtype=np.float64)
+        self.total_distance_km = np.zeros(len(self.ids), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def random(cls, count: int, rng: np.random.Generator) -> "FleetArrays":
+        """Creates `count` devices with the same random ranges as the fleet launcher."""
+        return cls(
+            ids=rng.integers(1000000, 10000000, count),
+            lat=np.round(rng.uniform(-1.307963, -1.282735, count), 6),
+            lon=np.round(rng.uniform(36.808427, 36.844133, count), 6),
+            alt=np.zeros(count),
+            heading=rng.choice(HEADINGS, count),
+            speed=cls.random_speed(count, rng),
+            level=np.full(count, 100.0),
+        )
+
+    @classmethod
+    def from_devices(cls, devices: List[object]) -> "FleetArrays":
+        """Packs Phone/Car/Drone objects of one type into arrays."""
+        arrays = cls(
+            ids=[int(d.device_id.rsplit("-", 1)[1]) for d in devices],
+            lat=[d.location[0] for d in devices],
+            lon=[d.location[1] for d in devices],
+            alt=[d.location[2] for d in devices],
+            heading=[d.heading for d in devices],
+            speed=[d.speed_kmh for d in devices],
+            level=[getattr(d, cls.level_name) for d in devices],
+        )
+        arrays.total_distance_km[:] = [d.total_distance_km for d in devices]
+        return arrays
+
+    @staticmethod
+    @abstractmethod
+    def random_speed(count: int, rng: np.random.Generator) -> np.ndarray:
+        """Initial speeds (km/h) of `count` new devices."""
+
+    def device_id(self, index: int) -> str:
+        return f"{self.prefix}-{self.ids[index]}"
+
+    @abstractmethod
+    def statuses(self) -> np.ndarray:
+        """Returns the payload status string of every device."""
+
+    @abstractmethod
+    def status(self, index: int) -> str:
+        """Returns the payload status string of one device."""
+
+    @abstractmethod
+    def step(self, rng: np.random.Generator) -> None:
+        """One tick for every device, in the object model's simulate_step order."""
+
+    def move(self, mask: Optional[np.ndarray], delta_alt: Optional[np.ndarray] = None) -> None:
+        """Vectorized heading_to_vector + update_location_vector; devices outside `mask` stand still."""
+        heading_rad = np.radians(self.heading)
+        delta_lat = self.speed * np.cos(heading_rad) * DEGREES_PER_KM / 3600
+        delta_lon = self.speed * np.sin(heading_rad) * DEGREES_PER_KM / 3600
+        if mask is not None:
+            delta_lat = np.where(mask, delta_lat, 0.0)
+            delta_lon = np.where(mask, delta_lon, 0.0)
+        self.lat = round_like_python(self.lat + delta_lat, 6)
+        self.lon = round_like_python(self.lon + delta_lon, 6)
+        if delta_alt is not None:
+            self.alt = round_like_python(self.alt + delta_alt, 6)
+
+    def reorder(self, order: np.ndarray) -> None:
+        """Permutes every per-device array, e.g. to sort the fleet by phase."""
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray) and len(value) == len(order):
+                setattr(self, name, value[order])
+
+    def take(self, index) -> "FleetArrays":
+        """The devices at `index`, e.g. to step only the ones due: a copy for an index array, views for a slice."""
+        subset = object.__new__(type(self))
+        for name, value in vars(self).items():
+            setattr(subset, name, value[index] if isinstance(value, np.ndarray) and len(value) == len(self)
+                    else value)
+        return subset
+
+    def put(self, index, subset: "FleetArrays") -> None:
+        """Writes the state of a take() (or any fleet of the same type) back to the devices at `index`."""
+        for name, value in vars(subset).items():
+            if isinstance(value, np.ndarray):
+                getattr(self, name)[index] = value
+
+    def ndjson(self, timestamps: np.ndarray, bounds: Sequence[int]) -> Iterator[bytes]:
+        """Yields the NDJSON records of devices bounds[i]..bounds[i+1], one chunk per range.
+
+        Device i is stamped timestamps[i]; the lines are the bytes TemplateJsonEncoder
+        (and json.dumps(payload)) produce for the same state.
+        """
+        template = ('{"deviceId": "' + self.prefix + '-%d", "timestamp": %d, "status": "%s", '
+                    '"location": [%r, %r, %r], "' + self.level_name + '": %r}\n')
+        statuses = self.statuses()
+        levels = round_like_python(self.level, 1)
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            rows = zip(self.ids[lo:hi].tolist(), timestamps[lo:hi].tolist(), statuses[lo:hi].tolist(),
+                       self.lat[lo:hi].tolist(), self.lon[lo:hi].tolist(), self.alt[lo:hi].tolist(),
+                       levels[lo:hi].tolist())
+            yield "".join(map(template.__mod__, rows)).encode("utf-8")
+
+    def payload(self, index: int, timestamp: Optional[int] = None) -> Dict[str, object]:
+        """Builds the same payload dictionary as the object model's get_payload."""
+        return {
+            "deviceId": self.device_id(index),
+            "timestamp": int(time.time()) if timestamp is None else timestamp,
+            "status": self.status(index),
+            "location": [float(self.lat[index]), float(self.lon[index]), float(self.alt[index])],
+            self.level_name: round(float(self.level[index]), 1),
+        }
+
+class PhoneArrays(FleetArrays):
+    """Vectorized Phone: drain/charge battery, random heading change, walk unless charging."""
+
+    prefix = "phone"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_charging = np.zeros(len(self.ids), dtype=bool)
+
+    @classmethod
+    def from_devices(cls, devices: List[object]) -> "PhoneArrays":
+        arrays = super().from_devices(devices)
+        arrays.is_charging[:] = [d.is_charging for d in devices]
+        return arrays
+
+    @staticmethod
+    def random_speed(count: int, rng: np.random.Generator) -> np.ndarray:
+        return np.full(count, phone.WALKING_SPEED_KMH)
+
+    def statuses(self) -> np.ndarray:
+        return np.where(self.is_charging, "charging", "moving")
+
+    def status(self, index: int) -> str:
+        return "charging" if self.is_charging[index] else "moving"
+
+    def update_battery(self) -> None:
+        charging = self.is_charging
+        low = ~charging & (self.level <= phone.LOW_BATTERY_THRESHOLD)
+        draining = ~charging & ~low
+        self.level = np.where(charging, np.minimum(100.0, self.level + phone.CHARGE_RATE), self.level)
+        self.level = np.where(draining, np.maximum(0.0, self.level - phone.BATTERY_DECREMENT), self.level)
+        self.is_charging = (charging & (self.level < 95.0)) | low
+
+    def update_heading(self, rng: np.random.Generator) -> None:
+        change = ~self.is_charging & (rng.random(len(self)) < HEADING_CHANGE_CHANCE)
+        self.heading = np.where(change, rng.choice(HEADINGS, len(self)), self.heading)
+
+    def update_location(self) -> None:
+        moving = ~self.is_charging
+        self.move(moving)
+        self.total_distance_km += np.where(moving, self.speed / 3600, 0.0)
+
+    def step(self, rng: np.random.Generator) -> None:
+        """One tick for every phone, in Phone.simulate_step order."""
+        self.update_battery()
+        self.update_heading(rng)
+        self.update_location()
+
+class CarArrays(FleetArrays):
+    """Vectorized Car: random heading change, gas consumption/refill, always moving."""
+
+    prefix = "car"
+    level_name = "gas"
+
+    @staticmethod
+    def random_speed(count: int, rng: np.random.Generator) -> np.ndarray:
+        return rng.integers(30, 91, count).astype(np.float64)
+
+    def statuses(self) -> np.ndarray:
+        return np.full(len(self), "ping")
+
+    def status(self, index: int) -> str:
+        return "ping"
+
+    def update_heading(self, rng: np.random.Generator) -> None:
+        change = rng.random(len(self)) < HEADING_CHANGE_CHANCE
+        self.heading = np.where(change, rng.choice(HEADINGS, len(self)), self.heading)
+
+    def update_gas(self, rng: np.random.Generator) -> None:
+        refill = (self.level <= car.GAS_REFILL_THRESHOLD) & (rng.random(len(self)) < REFILL_CHANCE)
+        consumed = np.minimum(car.GAS_REFILL_AMOUNT,
+                              np.maximum(round_like_python(self.level - car.GAS_DECREMENT, 1), 0.0))
+        self.level = np.where(refill, car.GAS_REFILL_AMOUNT, consumed)
+
+    def update_location(self) -> None:
+        self.move(None)
+        self.total_distance_km += self.speed / 3600
+
+    def step(self, rng: np.random.Generator) -> None:
+        """One tick for every car, in Car.simulate_step order."""
+        self.update_heading(rng)
+        self.update_gas(rng)
+        self.update_location()
+
+class DroneArrays(FleetArrays):
+    """Vectorized Drone: fly/descend/land/charge state machine with altitude jitter."""
+
+    prefix = "drone"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_descending = np.zeros(len(self.ids), dtype=bool)
+        self.is_landed = np.zeros(len(self.ids), dtype=bool)
+
+    @classmethod
+    def from_devices(cls, devices: List[object]) -> "DroneArrays":
+        arrays = super().from_devices(devices)
+        arrays.is_descending[:] = [d.is_descending for d in devices]
+        arrays.is_landed[:] = [d.is_landed for d in devices]
+        return arrays
+
+    @staticmethod
+    def random_speed(count: int, rng: np.random.Generator) -> np.ndarray:
+        return rng.integers(20, 61, count).astype(np.float64)
+
+    def statuses(self) -> np.ndarray:
+        return np.where(self.is_landed, "landed", np.where(self.is_descending, "descending", "flying"))
+
+    def status(self, index: int) -> str:
+        return "landed" if self.is_landed[index] else "descending" if self.is_descending[index] else "flying"
+
+    def update_battery(self) -> None:
+        landed = self.is_landed
+        start_descent = ~landed & (self.level <= drone.LOW_BATTERY_THRESHOLD) & ~self.is_descending
+        descending = ~landed & ~start_descent & self.is_descending
+        flying = ~landed & ~start_descent & ~descending
+
+        level = np.where(landed, np.minimum(100.0, self.level + drone.CHARGE_RATE), self.level)
+        level = np.where(descending, np.maximum(0.0, level - drone.BATTERY_DECREMENT * 2), level)
+        self.level = np.where(flying, np.maximum(0.0, level - drone.BATTERY_DECREMENT), level)
+
+        recharged = landed & (self.level >= 95.0)
+        self.is_landed = landed & ~recharged
+        self.is_descending = (self.is_descending & ~recharged) | start_descent
+
+    def update_movement(self, rng: np.random.Generator) -> None:
+        airborne = ~self.is_landed
+        touching_down = airborne & self.is_descending & (self.alt <= 0.0)
+        descending = airborne & self.is_descending & ~touching_down
+        flying = airborne & ~self.is_descending
+
+        jitter = rng.uniform(-drone.ALTITUDE_CHANGE_RATE, drone.ALTITUDE_CHANGE_RATE, len(self))
+        delta_alt = np.where(flying, jitter, np.where(descending, -drone.DESCENT_RATE, 0.0))
+        self.is_landed = self.is_landed | touching_down
+        self.move(flying, delta_alt)
+        # update_location_vector always adds the distance, even while landed
+        self.total_distance_km += self.speed / 3600
+
+    def step(self, rng: np.random.Generator) -> None:
+        """One tick for every drone, in Drone.simulate_step order."""
+        self.update_battery()
+        self.update_movement(rng)
+
+ARRAY_CLASSES = {"phone": PhoneArrays, "car": CarArrays, "drone": DroneArrays}  # Keyed like fleet.DEVICE_CLASSES
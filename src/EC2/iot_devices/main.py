@@ -1,33 +1,27 @@
-import random
+import os
+import argparse
 import threading
 import subprocess
-import sys
-from typing import List
+from datetime import datetime
+from src.util.clock import VirtualClock
+from src.util.sinks import SINKS
+from src.util.encoders import ENCODERS
+from src.util.background_sender import OVERFLOW_POLICIES
+from src.util.emission import HEARTBEAT, LEVEL_STEP, POSITION_ERROR_M
+from src.ec2.iot_devices.snapshot import SNAPSHOT_INTERVAL
+from src.ec2.iot_devices.fleet import (
+    DEFAULT_DELAY, fleet_mix, random_coordinates, random_seven_digit_integer, random_heading, run_fleet, run_sharded
+)
 
 # Constants
 NAIROBI_COORDINATES = [-1.292076, 36.821948, 0.000000]
 
-def random_coordinates() -> List[float]:
-    """Returns a random location within the square of Nairobi."""
-    return [
-        round(random.uniform(-1.307963, -1.282735), 6),  # Latitude
-        round(random.uniform(36.808427, 36.844133), 6),  # Longitude
-        0.000000  # Altitude
-    ]
-
-def random_seven_digit_integer() -> int:
-    """Returns a random 7-digit integer."""
-    return random.randint(1000000, 9999999)
-
-def random_heading() -> float:
-    """Returns a random heading in degrees (0 = North, 90 = East, etc.)."""
-    return random.choice([0, 90, 180, 270])
-
-def run_script(module_name: str) -> None:
+def run_script(module_name: str, test: bool = False) -> None:
     """Runs a device simulation module with random arguments.
     
     module_name: the module path without the .py extension,
                  e.g. "src.ec2.iot_devices.phone"
+    test: pass TEST to the device so it logs instead of sending to Kinesis
     """
     number_arg = random_seven_digit_integer()
     coords = random_coordinates()
@@ -41,30 +35,29 @@ def run_script(module_name: str) -> None:
         "python", "-m", module_name,
         str(number_arg), coords_str, str(heading)
     ]
+    if test:
+        command.append("TEST")
     subprocess.run(command)
 
-def spawn_threads(num_threads: int) -> None:
-    """Spawns threads to simulate multiple devices concurrently."""
-    max_threads = num_threads
-    phone_threads = int(max_threads * 0.55)  # 55% phones
-    car_threads = int(max_threads * 0.35)    # 35% cars
-    drone_threads = max_threads - phone_threads - car_threads  # 10% drones
+def spawn_threads(num_threads: int, test: bool = False) -> None:
+    """Spawns threads to simulate multiple devices concurrently, one subprocess per device."""
+    phone_threads, car_threads, drone_threads = fleet_mix(num_threads)  # 55/35/10
 
     threads = []
 
     # Simulate phones
     for _ in range(phone_threads):
-        thread = threading.Thread(target=run_script, args=("src.ec2.iot_devices.phone",))
+        thread = threading.Thread(target=run_script, args=("src.ec2.iot_devices.phone", test))
         threads.append(thread)
 
     # Simulate cars
     for _ in range(car_threads):
-        thread = threading.Thread(target=run_script, args=("src.ec2.iot_devices.car",))
+        thread = threading.Thread(target=run_script, args=("src.ec2.iot_devices.car", test))
         threads.append(thread)
 
     # Simulate drones
     for _ in range(drone_threads):
-        thread = threading.Thread(target=run_script, args=("src.ec2.iot_devices.drone",))
+        thread = threading.Thread(target=run_script, args=("src.ec2.iot_devices.drone", test))
         threads.append(thread)
 
     # Start and join threads
@@ -73,9 +66,118 @@ def spawn_threads(num_threads: int) -> None:
     for thread in threads:
         thread.join()
 
+def positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+    return number
+
+def process_count(value: str) -> int:
+    """argparse type for --processes: a positive count, or 0 / "auto" for one per core."""
+    if value == "auto":
+        return os.cpu_count() or 1
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"expected a process count, 0 or auto, got {value}")
+    return number or os.cpu_count() or 1
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parses the launcher command line; the positional device count keeps the old CLI working."""
+    parser = argparse.ArgumentParser(description="Simulate a fleet of phones, cars and drones.")
+    parser.add_argument("num_devices", nargs="?", type=int, default=25,
+                        help="Number of simulated devices (default: 25)")
+    parser.add_argument("--launcher", choices=["fleet", "subprocess"], default="fleet",
+                        help="fleet: all devices in this process; subprocess: one interpreter per device")
+    parser.add_argument("--processes", type=process_count, default=1,
+                        help="Shard the fleet across N worker processes (0 or auto: one per core)")
+    parser.add_argument("--steps", type=int, default=0, help="Ticks per device, 0 runs forever")
+    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY, help="Seconds between pings")
+    parser.add_argument("--phone-delay", type=float, help="Seconds between phone pings (default: --delay)")
+    parser.add_argument("--car-delay", type=float, help="Seconds between car pings (default: --delay)")
+    parser.add_argument("--drone-delay", type=float, help="Seconds between drone pings (default: --delay)")
+    parser.add_argument("--encoder", choices=sorted(ENCODERS),
+                        help="Wire format for every device (default: each device type's own)")
+    parser.add_argument("--sink", default="kinesis",
+                        help=f"Where records go: {', '.join(SINKS)}, optionally with an argument, "
+                             "e.g. file:out.ndjson, udp:127.0.0.1:9999, kinesis:http://localhost:4567 "
+                             "or state:dynamodb:TABLE")
+    parser.add_argument("--seed", type=int, help="Fleet seed for reproducible devices and random draws")
+    parser.add_argument("--virtual-clock", action="store_true",
+                        help="Run in simulated time, as fast as possible unless --speedup is given")
+    parser.add_argument("--speedup", type=float,
+                        help="Simulated seconds per real second, e.g. 60 (implies --virtual-clock)")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="Simulated start time in ISO format, e.g. 2024-01-01T00:00:00+00:00 (default: now)")
+    parser.add_argument("--sender-queue", type=positive_int,
+                        help="Queue up to N records for background sender threads instead of sending from the ticks")
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default="block",
+                        help="What a full --sender-queue does with a new record")
+    parser.add_argument("--spill-path", help="Spill file for --overflow spill (default: a temporary file)")
+    parser.add_argument("--sender-workers", type=positive_int, default=1, help="Background sender threads")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics "
+                             "(with --processes, shard i uses PORT + i)")
+    parser.add_argument("--dead-reckoning", action="store_true",
+                        help="Send a record only when consumers could not predict it from the last two")
+    parser.add_argument("--position-error", type=float, default=POSITION_ERROR_M,
+                        help="Meters of predicted position error that force a --dead-reckoning record")
+    parser.add_argument("--level-step", type=float, default=LEVEL_STEP,
+                        help="Battery/gas points of predicted level error that force a --dead-reckoning record")
+    parser.add_argument("--heartbeat", type=float, default=HEARTBEAT,
+                        help="Longest gap in seconds between two --dead-reckoning records of a device")
+    parser.add_argument("--ignore-heading", action="store_true",
+                        help="Do not send a --dead-reckoning record for a heading change alone")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Restore the fleet saved in PATH if it exists and keep saving it there "
+                             "(with --processes, shard i uses PATH.i)")
+    parser.add_argument("--snapshot-interval", type=float, default=SNAPSHOT_INTERVAL,
+                        help="Seconds between two --snapshot saves of a fleet that runs forever")
+    parser.add_argument("--test", action="store_true", help="Log payloads instead of sending them")
+    return parser.parse_args(argv)
+
+def make_clock(args: argparse.Namespace):
+    """VirtualClock for --virtual-clock/--speedup runs, None (the real clock) otherwise."""
+    if not (args.virtual_clock or args.speedup):
+        return None
+    start = args.start.timestamp() if args.start else None
+    return VirtualClock(start=start, speedup=args.speedup)
+
+def make_background(args: argparse.Namespace):
+    """BackgroundSender options for --sender-queue runs, None (send from the ticks) otherwise."""
+    if args.sender_queue is None:
+        return None
+    return {"capacity": args.sender_queue, "overflow": args.overflow, "workers": args.sender_workers,
+            "spill_path": args.spill_path}
+
+def make_emission(args: argparse.Namespace):
+    """DeadReckoning options for --dead-reckoning runs, None (send every tick) otherwise."""
+    if not args.dead_reckoning:
+        return None
+    return {"position_m": args.position_error, "level_step": args.level_step, "heartbeat": args.heartbeat,
+            "on_heading": not args.ignore_heading}
+
+def make_snapshot(args: argparse.Namespace):
+    """FleetSnapshots options for --snapshot runs, None (a new fleet on every start) otherwise."""
+    if args.snapshot is None:
+        return None
+    return {"path": args.snapshot, "interval": args.snapshot_interval}
+
 if __name__ == "__main__":
-    if (len(sys.argv) not in [1, 2]):
-        print(f"Usage: {sys.argv[0]} [NUM_THREADS]")
-        sys.exit(1)
-    num_threads = int(sys.argv[1]) if len(sys.argv) == 2 else 25
-    spawn_threads(num_threads)
\ No newline at end of file
+    args = parse_args()
+    if args.launcher == "subprocess":
+        spawn_threads(args.num_devices, args.test)
+    else:
+        intervals = {name: getattr(args, f"{name}_delay") for name in ("phone", "car", "drone")
+                     if getattr(args, f"{name}_delay") is not None}
+        clock = make_clock(args)
+        if args.processes > 1:
+            run_sharded(args.num_devices, args.processes, steps=args.steps, delay=args.delay, test=args.test,
+                        intervals=intervals, encoder=args.encoder, seed=args.seed, clock=clock, sink=args.sink,
+                        metrics_port=args.metrics_port, background=make_background(args),
+                        emission=make_emission(args), snapshot=make_snapshot(args))
+        else:
+            run_fleet(args.num_devices, steps=args.steps, delay=args.delay, test=args.test, intervals=intervals,
+                      encoder=args.encoder, seed=args.seed, clock=clock, sink=args.sink,
+                      metrics_port=args.metrics_port, background=make_background(args),
+                      emission=make_emission(args), snapshot=make_snapshot(args))
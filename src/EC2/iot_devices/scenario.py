@@ -0,0 +1,470 @@
+import json
+import math
+import time
+import logging
+import argparse
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.util.clock import REAL_CLOCK
+from src.util.load_controller import TOLERANCE, LoadController
+from src.util.spatial_index import meters_to_degrees
+from src.ec2.iot_devices.fleet import CAR_SHARE, DEFAULT_DELAY, DEFAULT_SINK, PHONE_SHARE, open_producer
+from src.ec2.iot_devices.fleet_arrays import ARRAY_CLASSES, FleetArrays
+from src.ec2.iot_devices.main import make_clock
+
+# Constants
+DEFAULT_MIX = {"phone": PHONE_SHARE, "car": CAR_SHARE, "drone": 1.0 - PHONE_SHARE - CAR_SHARE}
+DEFAULT_TICK = 1.0
+REPORT_INTERVAL = 60.0  # Scenario seconds between two timeline entries
+FIRST_ID = 1000000  # Device ids are FIRST_ID + slot, unique per type across all pools
+MAX_DEVICES_PER_TYPE = 9000000  # Seven-digit ids, like the fleet launcher's
+CHUNK_RECORDS = 65536  # Records formatted per chunk
+SCENARIO_KEYS = {"name", "duration", "tick", "population", "mix", "interval", "rate", "hotspots", "bursts", "target"}
+TARGET_UNITS = {"records_per_s": "records", "bytes_per_s": "bytes"}
+CONTROL_INTERVAL = 5.0  # Scenario seconds between two controller updates
+MAX_RATE_SCALE = 10.0  # With every device active, pings come at most 10x as often as their interval
+THROTTLE_STATS = ("throttled", "overflow_dropped")  # Sink counters of records refused for lack of capacity
+
+logging.basicConfig(level=logging.INFO)
+
+Curve = Callable[[np.ndarray], np.ndarray]
+
+def parse_curve(spec: object, start: float = 0.0) -> Curve:
+    """Vectorized curve of scenario seconds from a number, keyframes or a diurnal spec.
+
+    Args:
+        spec: The curve as written in the scenario file.
+        start: Epoch seconds of scenario time 0, which diurnal curves are anchored to.
+
+    Raises:
+        ValueError: The spec is none of the three forms, or keyframe times decrease.
+    """
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        value = float(spec)
+        return lambda times: np.full(np.shape(times), value)
+    if isinstance(spec, list) and spec and all(isinstance(k, list) and len(k) == 2 for k in spec):
+        xs, ys = (np.array(column, dtype=np.float64) for column in zip(*spec))
+        if (np.diff(xs) < 0).any():
+            raise ValueError(f"Keyframe times must not decrease: {spec}")
+        return lambda times: np.interp(times, xs, ys)
+    if isinstance(spec, dict) and set(spec) == {"diurnal"}:
+        low, high, peak = (float(spec["diurnal"][key]) for key in ("min", "max", "peak"))
+        return lambda times: low + (high - low) * (1 + np.cos(
+            2 * math.pi * (((start + np.asarray(times)) / 3600.0) % 24 - peak) / 24)) / 2
+    raise ValueError(f"Invalid curve: {spec!r}")
+
+class Hotspot:
+    """A disc that a share of the devices joining while it is open are placed in."""
+
+    def __init__(self, name: str, lat: float, lon: float, radius_m: float, weight: float = 1.0,
+                 types: Optional[List[str]] = None, start: float = 0.0, end: float = math.inf):
+        if not 0.0 <= weight <= 1.0:
+            raise ValueError(f"Hotspot {name} weight must be within 0-1, got {weight}")
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.radius_m = radius_m
+        self.weight = weight
+        self.types = set(types or ARRAY_CLASSES)
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_spec(cls, spec: Dict[str, object]) -> "Hotspot":
+        return cls(spec["name"], spec["lat"], spec["lon"], spec["radius_m"], spec.get("weight", 1.0),
+                   spec.get("types"), spec.get("from", 0.0), spec.get("until", math.inf))
+
+    def is_open(self, now: float) -> bool:
+        return self.start <= now < self.end
+
+    def gathering(self) -> "Hotspot":
+        """The same disc, open all the time and taking every joining device, for a burst that gathers in it."""
+        return Hotspot(self.name, self.lat, self.lon, self.radius_m)
+
+    def place(self, count: int, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+        """Uniform positions (rounded like random_coordinates) in the disc."""
+        radius = meters_to_degrees(self.radius_m) * np.sqrt(rng.random(count))
+        angle = rng.uniform(0, 2 * math.pi, count)
+        return np.round(self.lat + radius * np.cos(angle), 6), np.round(self.lon + radius * np.sin(angle), 6)
+
+class DevicePool:
+    """Preallocated devices of one type whose first `active` slots are in the scenario.
+
+    grow() re-initializes the next slots with new random devices (placed in
+    the open hotspots) and spreads their first pings over one interval;
+    shrink() only lowers the counter, so the last devices to join leave first.
+    Each slot keeps its device id, so a device that leaves and comes back
+    reuses its id and the key space stays bounded.
+
+    Args:
+        name: Type name, or the burst's name.
+        device_type: Key of ARRAY_CLASSES.
+        capacity: Most devices ever active at once.
+        interval: Seconds between two pings at rate 1.
+        rate: Emission rate multiplier curve.
+        hotspots: Hotspots devices of this pool may be placed in when joining.
+        rng: Random generator of this pool.
+        first_id: Id of slot 0.
+    """
+
+    def __init__(self, name: str, device_type: str, capacity: int, interval: float, rate: Curve,
+                 hotspots: List[Hotspot], rng: np.random.Generator, first_id: int = FIRST_ID):
+        self.name = name
+        self.device_type = device_type
+        self.interval = interval
+        self.rate = rate
+        self.hotspots = [h for h in hotspots if device_type in h.types]
+        self.rng = rng
+        self.arrays: FleetArrays = ARRAY_CLASSES[device_type].random(capacity, rng)
+        self.arrays.ids = np.arange(first_id, first_id + capacity, dtype=np.int64)
+        self.next_due = np.full(capacity, np.inf)
+        self.active = 0
+        self.joined = 0
+        self.left = 0
+        self.scale = 1.0  # Rate multiplier set by a load controller
+
+    @property
+    def capacity(self) -> int:
+        return len(self.arrays)
+
+    def period(self, now: float) -> float:
+        return self.interval / max(float(self.rate(np.array(now))) * self.scale, 1e-9)
+
+    def resize(self, target: int, now: float) -> None:
+        target = min(max(0, target), self.capacity)
+        if target > self.active:
+            self.grow(target, now)
+        else:
+            self.shrink(target)
+
+    def grow(self, target: int, now: float) -> None:
+        lo, count = self.active, target - self.active
+        fresh = type(self.arrays).random(count, self.rng)
+        fresh.ids = self.arrays.ids[lo:target]
+        placed = lo
+        for hotspot in self.hotspots:
+            if hotspot.is_open(now):
+                n = min(int(round(count * hotspot.weight)), target - placed)
+                fresh.lat[placed - lo:placed - lo + n], fresh.lon[placed - lo:placed - lo + n] = hotspot.place(
+                    n, self.rng)
+                placed += n
+        self.arrays.put(slice(lo, target), fresh)
+        self.next_due[lo:target] = now + self.rng.uniform(0, self.period(now), count)
+        self.active = target
+        self.joined += count
+
+    def shrink(self, target: int) -> None:
+        self.left += self.active - target
+        self.active = target
+
+    def tick(self, now: float) -> Optional[Tuple[FleetArrays, np.ndarray]]:
+        """Steps the active devices due by `now`; returns them and their due times, or None.
+
+        A device pings at most once per tick: when the period drops below the
+        tick, or after a rate change, late devices fire now instead of catching up.
+        """
+        due = np.flatnonzero(self.next_due[:self.active] <= now)
+        if not due.size:
+            return None
+        fired = self.next_due[due]
+        devices = self.arrays.take(due)
+        devices.step(self.rng)
+        self.arrays.put(due, devices)
+        self.next_due[due] = np.maximum(fired + self.period(now), now)
+        return devices, fired
+
+def _per_type(spec: object, default: object) -> Dict[str, object]:
+    if isinstance(spec, dict) and set(spec) <= set(ARRAY_CLASSES):
+        return {name: spec.get(name, default) for name in ARRAY_CLASSES}
+    return {name: default if spec is None else spec for name in ARRAY_CLASSES}
+
+class Scenario:
+    """A parsed, validated scenario file; build_pools() turns it into device pools.
+
+    Raises:
+        ValueError: Unknown keys or device types, invalid curves, or a type that exceeds MAX_DEVICES_PER_TYPE.
+    """
+
+    def __init__(self, spec: Dict[str, object]):
+        unknown = set(spec) - SCENARIO_KEYS
+        if unknown:
+            raise ValueError(f"Unknown scenario keys: {sorted(unknown)}")
+        if "population" not in spec or "duration" not in spec:
+            raise ValueError("A scenario needs a duration and a population")
+        self.spec = spec
+        self.name = spec.get("name", "scenario")
+        self.duration = float(spec["duration"])
+        self.tick = float(spec.get("tick", DEFAULT_TICK))
+        if self.duration <= 0 or self.tick <= 0:
+            raise ValueError("duration and tick must be positive")
+        mix = spec.get("mix", DEFAULT_MIX)
+        if not set(mix) <= set(ARRAY_CLASSES):
+            raise ValueError(f"Unknown device types in mix: {sorted(set(mix) - set(ARRAY_CLASSES))}")
+        self.mix = {name: mix.get(name, 0.0) for name in ARRAY_CLASSES}
+        self.intervals = {name: float(value) for name, value in _per_type(spec.get("interval"), DEFAULT_DELAY).items()}
+        self.rates = _per_type(spec.get("rate"), 1.0)
+        self.hotspots = [Hotspot.from_spec(h) for h in spec.get("hotspots", [])]
+        self.bursts = spec.get("bursts", [])
+        self.target = spec.get("target")
+        if self.target is not None:
+            units = set(self.target) & set(TARGET_UNITS)
+            if len(units) != 1 or not set(self.target) <= set(TARGET_UNITS) | {"tolerance", "control_interval"}:
+                raise ValueError(f"A target needs exactly one of {sorted(TARGET_UNITS)}: {self.target}")
+            self.controller()  # Validates the value
+        names = {h.name for h in self.hotspots}
+        for burst in self.bursts:
+            if burst.get("type") not in ARRAY_CLASSES:
+                raise ValueError(f"Burst {burst.get('name')} has an unknown device type: {burst.get('type')}")
+            if burst.get("hotspot") is not None and burst["hotspot"] not in names:
+                raise ValueError(f"Burst {burst.get('name')} refers to an unknown hotspot: {burst['hotspot']}")
+        self.build_pools(0.0, np.random.default_rng(0), allocate=False)  # Validates curves and sizes
+
+    @classmethod
+    def load(cls, path: str, target: Optional[Dict[str, float]] = None) -> "Scenario":
+        """Reads a scenario file; `target` replaces the file's own target if given."""
+        with open(path) as f:
+            spec = json.load(f)
+        if target:
+            spec["target"] = target
+        return cls(spec)
+
+    def controller(self) -> Optional[LoadController]:
+        """A new LoadController for the scenario's target, or None without one."""
+        if self.target is None:
+            return None
+        key = next(key for key in TARGET_UNITS if key in self.target)
+        return LoadController(self.target[key], TARGET_UNITS[key], self.target.get("tolerance", TOLERANCE))
+
+    @property
+    def control_interval(self) -> float:
+        return float((self.target or {}).get("control_interval", CONTROL_INTERVAL))
+
+    def times(self) -> np.ndarray:
+        """Scenario seconds of every tick."""
+        return np.arange(0.0, self.duration, self.tick)
+
+    def targets(self, start: float) -> Dict[str, Curve]:
+        """Active devices of every type over time: population split by the normalized mix."""
+        population = parse_curve(self.spec["population"], start)
+        shares = {name: parse_curve(spec, start) for name, spec in self.mix.items()}
+
+        def target(name: str) -> Curve:
+            def curve(times: np.ndarray) -> np.ndarray:
+                total = sum(share(times) for share in shares.values())
+                share = np.divide(shares[name](times), total, out=np.zeros(np.shape(times)), where=total > 0)
+                return np.rint(np.maximum(population(times), 0.0) * share)
+            return curve
+        return {name: target(name) for name in ARRAY_CLASSES}
+
+    def burst_target(self, burst: Dict[str, object]) -> Curve:
+        at, devices = float(burst["at"]), float(burst["devices"])
+        end = at + float(burst.get("duration", self.duration - at))
+        ramp = max(float(burst.get("ramp", self.tick)), 1e-9)
+        ramp = min(ramp, (end - at) / 2)
+        keyframes = [[at, 0.0], [at + ramp, devices], [end - ramp, devices], [end, 0.0]]
+        return lambda times: np.rint(parse_curve(keyframes)(times))
+
+    def build_pools(self, start: float, rng: np.random.Generator,
+                    allocate: bool = True) -> List[Tuple[DevicePool, Curve]]:
+        """One pool per device type and per burst, each sized for the peak of its target curve."""
+        times = self.times()
+        groups = [(name, name, curve, self.intervals[name], parse_curve(self.rates[name], start), self.hotspots)
+                  for name, curve in self.targets(start).items()]
+        spots = {h.name: h for h in self.hotspots}
+        for index, burst in enumerate(self.bursts):
+            device_type = burst["type"]
+            hotspots = [spots[burst["hotspot"]].gathering()] if burst.get("hotspot") else []
+            groups.append((burst.get("name", f"burst-{index}"), device_type, self.burst_target(burst),
+                           float(burst.get("interval", self.intervals[device_type])),
+                           parse_curve(burst.get("rate", 1.0), start), hotspots))
+
+        pools, next_id = [], {name: FIRST_ID for name in ARRAY_CLASSES}
+        for name, device_type, curve, interval, rate, hotspots in groups:
+            capacity = int(curve(times).max()) if times.size else 0
+            rate(times)  # Fails on a bad curve before anything runs
+            if next_id[device_type] + capacity > FIRST_ID + MAX_DEVICES_PER_TYPE:
+                raise ValueError(f"More than {MAX_DEVICES_PER_TYPE} {device_type} devices at once")
+            if allocate:
+                pool_rng = np.random.default_rng(rng.integers(2 ** 63))
+                pools.append((DevicePool(name, device_type, capacity, interval, rate, hotspots, pool_rng,
+                                         next_id[device_type]), curve))
+            next_id[device_type] += capacity
+        return pools
+
+class ScenarioRunner:
+    """Plays a Scenario tick by tick into a producer (or only counts records in TEST mode).
+
+    Each tick every pool is resized to its target, then the devices due are
+    stepped and their records sent with the device id as partition key. Ticks
+    are paced on `clock`, so a VirtualClock runs the scenario as fast as the
+    CPU allows or at a speedup.
+
+    A scenario with a target is steered by its LoadController every control
+    interval (see steer()). Delivered records and bytes come from the
+    producer's stats, or are the records emitted in TEST mode.
+
+    Args:
+        scenario: The scenario to play.
+        producer: Sink records are put to; None counts them without formatting.
+        clock: RealClock or VirtualClock; records are stamped with its time.
+        seed: Seed of every random draw, for reproducible runs.
+        report_interval: Scenario seconds per timeline entry.
+    """
+
+    def __init__(self, scenario: Scenario, producer=None, clock=None, seed: Optional[int] = None,
+                 report_interval: float = REPORT_INTERVAL):
+        self.scenario = scenario
+        self.producer = producer
+        self.clock = clock or REAL_CLOCK
+        self.start = self.clock.time()
+        self.pools = scenario.build_pools(self.start, np.random.default_rng(seed))
+        self.report_interval = report_interval
+        self.records = 0
+        self.bytes = 0
+        self.peak_devices = 0
+        self.timeline: List[Dict[str, object]] = []
+        self.base = self.pools[:len(ARRAY_CLASSES)]  # One pool per type, before the bursts
+        self.controller = scenario.controller()
+        self.fraction = 1.0
+        self.scale = 1.0
+        self._measured = (0.0, 0, 0.0, 0)  # (time, emitted, delivered, throttled) at the last control update
+        if self.controller is not None and self.controller.unit == "bytes" and producer is None:
+            raise ValueError("A bytes_per_s target needs a producer, TEST mode does not format records")
+
+    @property
+    def active(self) -> int:
+        return sum(pool.active for pool, _ in self.pools)
+
+    def emit(self, devices: FleetArrays, fired: np.ndarray) -> None:
+        self.records += len(devices)
+        if self.producer is None:
+            return
+        timestamps = (self.start + fired).astype(np.int64)
+        bounds = list(range(0, len(devices), CHUNK_RECORDS)) + [len(devices)]
+        keys = iter(devices.ids.tolist())
+        prefix = devices.prefix + "-"
+        for chunk in devices.ndjson(timestamps, bounds):
+            self.bytes += len(chunk)
+            for line in chunk.split(b"\n")[:-1]:
+                self.producer.put(line, prefix + str(next(keys)))
+
+    def delivered(self) -> Tuple[int, float, int]:
+        """Records emitted, units delivered and records pushed back by the sink, so far."""
+        if self.producer is None:
+            return self.records, float(self.records), 0
+        stats = self.producer.stats
+        return (self.records, float(stats.get(f"{self.controller.unit}_sent", 0)),
+                sum(stats.get(name, 0) for name in THROTTLE_STATS))
+
+    def control(self, now: float) -> None:
+        """Feeds the last control interval's measurements to the controller and steers by its answer."""
+        emitted, delivered, throttled = self.delivered()
+        since, before, before_delivered, before_throttled = self._measured
+        if now > since:
+            self.controller.update(now, now - since, emitted - before, delivered - before_delivered,
+                                   throttled - before_throttled)
+        self._measured = (now, emitted, delivered, throttled)
+        self.steer(self.controller.setpoint, now)
+
+    def steer(self, setpoint: float, now: float) -> None:
+        """Sets `fraction` and `scale` so the steady emission rate is `setpoint` records/s.
+
+        `fraction` is the share of every type's population to activate and,
+        once that is all of it, `scale` multiplies every type's rate.
+        """
+        times = np.array(now)
+        bursts = sum(pool.active / pool.period(now) for pool, _ in self.pools[len(ARRAY_CLASSES):])
+        full = sum(float(curve(times)) * float(pool.rate(times)) / pool.interval for pool, curve in self.base)
+        need = max(0.0, setpoint - bursts)
+        self.fraction = min(1.0, need / full) if full > 0 else 0.0
+        self.scale = min(MAX_RATE_SCALE, need / full) if full > 0 and need > full else 1.0
+        for pool, _ in self.base:
+            pool.scale = self.scale
+
+    def ticks(self) -> Iterator[float]:
+        """Scenario seconds of every tick, waiting on the clock until each one is due."""
+        started = self.clock.monotonic()
+        for now in self.scenario.times().tolist():
+            self.clock.sleep(max(0.0, started + now - self.clock.monotonic()))
+            yield now
+
+    def run(self) -> Dict[str, object]:
+        """Plays the whole scenario and returns its summary (the timeline included)."""
+        wall = time.perf_counter()
+        window_records, next_report, next_control = 0, 0.0, 0.0
+        controlled = {id(pool) for pool, _ in self.base} if self.controller is not None else set()
+        for now in self.ticks():
+            if self.controller is not None and now >= next_control:
+                self.control(now)
+                next_control = now + self.scenario.control_interval
+            before = self.records
+            for pool, target in self.pools:
+                size = float(target(np.array(now)))
+                pool.resize(int(round(size * self.fraction)) if id(pool) in controlled else int(size), now)
+                due = pool.tick(now)
+                if due is not None:
+                    self.emit(*due)
+            self.peak_devices = max(self.peak_devices, self.active)
+            window_records += self.records - before
+            if now >= next_report:
+                self.report(now, window_records)
+                window_records, next_report = 0, now + self.report_interval
+        if self.producer is not None:
+            self.producer.flush()
+        elapsed = time.perf_counter() - wall
+        summary = {
+            "scenario": self.scenario.name,
+            "ticks": len(self.scenario.times()),
+            "records": self.records,
+            "bytes": self.bytes,
+            "peak_devices": self.peak_devices,
+            "joined": sum(pool.joined for pool, _ in self.pools),
+            "left": sum(pool.left for pool, _ in self.pools),
+            "elapsed_s": round(elapsed, 2),
+            "records_per_s": round(self.records / elapsed) if elapsed else 0,
+        }
+        if self.controller is not None:
+            summary["controller"] = dict(self.controller.report(), devices=self.active, rate_scale=self.scale)
+        logging.info("Scenario finished: %s", summary)
+        return dict(summary, timeline=self.timeline)
+
+    def report(self, now: float, window_records: int) -> None:
+        entry = {"t": now, "devices": {pool.name: pool.active for pool, _ in self.pools},
+                 "records": window_records}
+        self.timeline.append(entry)
+        logging.info("t=%.0fs devices=%d records=%d", now, self.active, window_records)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Play a scenario file: fleet size, mix, emission rates, "
+                                                 "hotspots and bursts over time.")
+    parser.add_argument("scenario", help="Scenario JSON file, see docs/scenarios/README.md")
+    parser.add_argument("--sink", default=DEFAULT_SINK, help="Where records go, see src.util.sinks")
+    parser.add_argument("--test", action="store_true", help="Count records without formatting or sending them")
+    parser.add_argument("--seed", type=int, help="Seed for a reproducible run")
+    parser.add_argument("--virtual-clock", action="store_true",
+                        help="Run in simulated time, as fast as possible unless --speedup is given")
+    parser.add_argument("--speedup", type=float,
+                        help="Simulated seconds per real second, e.g. 60 (implies --virtual-clock)")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="Simulated start time in ISO format, e.g. 2024-01-01T00:00:00+00:00 (default: now)")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--target-records-per-s", type=float,
+                        help="Steer the fleet to deliver this many records/s (replaces the file's target)")
+    target.add_argument("--target-bytes-per-s", type=float, help="Steer the fleet to deliver this many bytes/s")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    clock = make_clock(args) or REAL_CLOCK
+    producer = open_producer(args.test, args.sink)
+    try:
+        target = ({"records_per_s": args.target_records_per_s} if args.target_records_per_s else
+                  {"bytes_per_s": args.target_bytes_per_s} if args.target_bytes_per_s else None)
+        summary = ScenarioRunner(Scenario.load(args.scenario, target), producer, clock, args.seed).run()
+    finally:
+        if producer is not None:
+            producer.close()
+    print(json.dumps({key: value for key, value in summary.items() if key != "timeline"}, indent=2))
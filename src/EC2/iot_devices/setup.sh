@@ -1,2 +1,2 @@
 # Install necessary modules for python scripts
-pip install boto3 pytest tenacity typing
+pip install boto3 numpy pytest tenacity typing
@@ -0,0 +1,245 @@
+import gc
+import os
+import time
+import random
+import struct
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.ec2.iot_devices.fleet_arrays import ARRAY_CLASSES, FleetArrays
+from src.util.encoders import DEVICE_TYPES, get_encoder
+from src.util.rng import DeviceRandom
+
+# Constants
+SNAPSHOT_INTERVAL = 300.0  # Seconds between two periodic snapshots of a running fleet
+PACK_CHUNK = 20000  # Devices a periodic save packs per turn of the event loop, about 0.1 s of work
+MAGIC = b"NBSNAP1\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQd")  # Magic, version, record size, device count, fleet time of the snapshot
+HEADER_BYTES = 64  # The header is padded so the records start aligned
+# One fixed-size little-endian record per device; floats are stored exactly, so a restore loses nothing
+SNAPSHOT_DTYPE = np.dtype([
+    ("type", "u1"),  # src.util.encoders.DEVICE_TYPES code
+    ("flags", "u1"),  # Bit i is STATE_FLAGS[type][i]
+    ("rng_position", "<u2"),  # DeviceRandom position in its current block
+    ("rng_counter", "<u4"),  # DeviceRandom Philox counter
+    ("id", "<i8"),  # The number after "<type>-" in the deviceId
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("alt", "<f8"),
+    ("heading", "<f8"),
+    ("speed", "<f8"),
+    ("level", "<f8"),  # Battery or gas
+    ("distance", "<f8"),
+])
+STATE_FLAGS = {"phone": ("is_charging",), "car": (), "drone": ("is_descending", "is_landed")}
+TYPE_NAMES = {code: name for name, code in DEVICE_TYPES.items()}
+
+def save_snapshot(path: str, records: np.ndarray, timestamp: float) -> int:
+    """Writes snapshot records to `path` through a memory map and returns the file size.
+
+    The file is written next to `path` and renamed over it, so a crash while
+    saving leaves the previous snapshot intact.
+    """
+    size = HEADER_BYTES + len(records) * SNAPSHOT_DTYPE.itemsize
+    partial = f"{path}.tmp"
+    header = HEADER.pack(MAGIC, VERSION, SNAPSHOT_DTYPE.itemsize, len(records), timestamp)
+    with open(partial, "wb") as f:
+        f.write(header.ljust(HEADER_BYTES, b"\0"))
+        f.truncate(size)
+    if len(records):
+        mapped = np.memmap(partial, SNAPSHOT_DTYPE, mode="r+", offset=HEADER_BYTES, shape=(len(records),))
+        mapped[:] = records
+        mapped.flush()
+        del mapped
+    os.replace(partial, path)
+    return size
+
+def load_snapshot(path: str) -> Tuple[np.ndarray, float]:
+    """Maps a snapshot file read-only; returns (records, timestamp) without reading the records.
+
+    Raises:
+        ValueError: If the file is not a snapshot of this version or is truncated.
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_BYTES)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is not a fleet snapshot ({len(header)} bytes)")
+    magic, version, record_size, count, timestamp = HEADER.unpack_from(header)
+    if magic != MAGIC or version != VERSION or record_size != SNAPSHOT_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a version {VERSION} fleet snapshot")
+    if os.path.getsize(path) < HEADER_BYTES + count * record_size:
+        raise ValueError(f"{path} is truncated: expected {count} devices")
+    if not count:
+        return np.zeros(0, SNAPSHOT_DTYPE), timestamp
+    return np.memmap(path, SNAPSHOT_DTYPE, mode="r", offset=HEADER_BYTES, shape=(count,)), timestamp
+
+def _flags(device) -> int:
+    return sum(getattr(device, name) << bit for bit, name in enumerate(STATE_FLAGS[device.DEVICE_TYPE]))
+
+def device_records(devices: List[object]) -> np.ndarray:
+    """Packs the state of Phone, Car and Drone objects into snapshot records, column by column."""
+    records = np.zeros(len(devices), SNAPSHOT_DTYPE)
+    if not devices:
+        return records
+    records["type"] = [DEVICE_TYPES[d.DEVICE_TYPE] for d in devices]
+    records["flags"] = [_flags(d) for d in devices]
+    # Unseeded devices draw from the random module, which has no stream to save
+    records["rng_position"] = [getattr(d.rng, "position", 0) for d in devices]
+    records["rng_counter"] = [getattr(d.rng, "counter", 0) for d in devices]
+    records["id"] = [int(d.device_id.rsplit("-", 1)[1]) for d in devices]
+    locations = np.array([d.location for d in devices], dtype=np.float64)
+    records["lat"], records["lon"], records["alt"] = locations.T
+    records["heading"] = [d.heading for d in devices]
+    records["speed"] = [d.speed_kmh for d in devices]
+    records["level"] = [getattr(d, d.LEVEL_FIELD) for d in devices]
+    records["distance"] = [d.total_distance_km for d in devices]
+    return records
+
+class _SavedSpeed:
+    """Random stream a device is built with on restore: the speed its __init__ draws is replaced anyway."""
+
+    @staticmethod
+    def randint(a: int, b: int) -> int:
+        return a
+
+def restore_devices(records: np.ndarray, classes: Dict[str, type], test: bool = True, producer=None,
+                    encoder: Optional[str] = None, seed: Optional[int] = None, clock=None, spatial_index=None,
+                    emission=None) -> List[object]:
+    """Rebuilds Phone, Car and Drone objects from snapshot records, one pass per device type.
+
+    Takes the arguments of fleet.build_devices plus `classes`, the device
+    class per type (fleet.DEVICE_CLASSES). Devices are built and then get
+    their saved state column by column, with the cyclic garbage collector
+    paused: it would otherwise rescan the growing fleet many times over while
+    millions of objects are allocated. With a `seed` every random stream
+    continues at its saved position.
+    """
+    chosen = get_encoder(encoder) if encoder else None
+    devices: List[object] = [None] * len(records)
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for code in np.unique(records["type"]).tolist():
+            name = TYPE_NAMES[code]
+            cls = classes[name]
+            index = np.flatnonzero(records["type"] == code)
+            rows = records[index]
+            ids = [f"{name}-{number}" for number in rows["id"].tolist()]
+            locations = np.stack([rows["lat"], rows["lon"], rows["alt"]], axis=1).tolist()
+            built = [cls(device_id, location, heading, test, producer, chosen, _SavedSpeed, clock, spatial_index,
+                         emission) for device_id, location, heading in zip(ids, locations, rows["heading"].tolist())]
+            if seed is not None:
+                rngs = [DeviceRandom(seed, device_id) for device_id in ids]
+                for rng, counter, position in zip(rngs, rows["rng_counter"].tolist(), rows["rng_position"].tolist()):
+                    rng.seek(counter, position)
+            else:
+                rngs = [random] * len(ids)  # Unseeded devices draw from the random module
+            level = cls.LEVEL_FIELD
+            for device, rng, speed, value, distance in zip(built, rngs, rows["speed"].tolist(),
+                                                           rows["level"].tolist(), rows["distance"].tolist()):
+                device.rng = rng
+                device.speed_kmh = speed
+                setattr(device, level, value)
+                device.total_distance_km = distance
+            for bit, flag in enumerate(STATE_FLAGS[name]):
+                for device, value in zip(built, (rows["flags"] >> bit & 1).astype(bool).tolist()):
+                    setattr(device, flag, value)
+            for position, device in zip(index.tolist(), built):
+                devices[position] = device
+    finally:
+        if collecting:
+            gc.enable()
+    return devices
+
+def array_records(fleets: Iterable[FleetArrays]) -> np.ndarray:
+    """Packs FleetArrays into snapshot records with whole-column copies."""
+    fleets = list(fleets)
+    records = np.zeros(sum(map(len, fleets)), SNAPSHOT_DTYPE)
+    start = 0
+    for arrays in fleets:
+        rows = records[start:start + len(arrays)]
+        rows["type"] = DEVICE_TYPES[arrays.prefix]
+        for bit, name in enumerate(STATE_FLAGS[arrays.prefix]):
+            rows["flags"] |= getattr(arrays, name).astype(np.uint8) << bit
+        for field, name in (("id", "ids"), ("lat", "lat"), ("lon", "lon"), ("alt", "alt"), ("heading", "heading"),
+                            ("speed", "speed"), ("level", "level"), ("distance", "total_distance_km")):
+            rows[field] = getattr(arrays, name)
+        start += len(arrays)
+    return records
+
+def restore_arrays(records: np.ndarray) -> Dict[str, FleetArrays]:
+    """Rebuilds one FleetArrays per device type in the snapshot, vectorized."""
+    fleets = {}
+    for name, cls in ARRAY_CLASSES.items():
+        rows = records[records["type"] == DEVICE_TYPES[name]]
+        if not len(rows):
+            continue
+        arrays = cls(ids=rows["id"], lat=rows["lat"], lon=rows["lon"], alt=rows["alt"], heading=rows["heading"],
+                     speed=rows["speed"], level=rows["level"])
+        arrays.total_distance_km = rows["distance"].astype(np.float64)
+        for bit, flag in enumerate(STATE_FLAGS[name]):
+            setattr(arrays, flag, (rows["flags"] >> bit & 1).astype(bool))
+        fleets[name] = arrays
+    return fleets
+
+class FleetSnapshots:
+    """Periodic snapshots of one process's fleet in a single file, and the restore on boot.
+
+    A save started later always wins: an older save that reaches the file
+    after a newer one leaves it alone.
+
+    Args:
+        path: Snapshot file; replaced atomically by every save.
+        interval: Seconds between two snapshots of a fleet that runs forever.
+    """
+
+    def __init__(self, path: str, interval: float = SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.stats: Dict[str, float] = {"saves": 0, "last_save_s": 0.0, "bytes": 0, "skipped": 0}
+        self._lock = threading.Lock()
+        self._started = 0  # Saves begun
+        self._written = 0  # Number of the newest save on disk
+
+    def load(self) -> Optional[Tuple[np.ndarray, float]]:
+        """(records, timestamp) of the saved snapshot, or None if there is none yet."""
+        if not os.path.exists(self.path):
+            return None
+        return load_snapshot(self.path)
+
+    def save(self, devices: List[object], timestamp: float) -> None:
+        """Snapshots Phone, Car and Drone objects."""
+        started = time.perf_counter()
+        self._started += 1
+        self._write(device_records(devices), timestamp, self._started, started)
+
+    async def save_in_background(self, devices: List[object], timestamp: float) -> None:
+        """Snapshots Phone, Car and Drone objects without holding up the event loop for more than PACK_CHUNK devices.
+
+        Ticks keep firing between the chunks, so a device may be saved a tick
+        or two after `timestamp`; the file is written from a worker thread.
+        """
+        started = time.perf_counter()
+        self._started += 1
+        save = self._started
+        records = np.zeros(len(devices), SNAPSHOT_DTYPE)
+        for start in range(0, len(devices), PACK_CHUNK):
+            records[start:start + PACK_CHUNK] = device_records(devices[start:start + PACK_CHUNK])
+            await asyncio.sleep(0)
+        await asyncio.to_thread(self._write, records, timestamp, save, started)
+
+    def _write(self, records: np.ndarray, timestamp: float, save: int, started: float) -> None:
+        with self._lock:
+            if save < self._written:
+                return
+            self._written = save
+            self.stats["bytes"] = save_snapshot(self.path, records, timestamp)
+            self.stats["saves"] += 1
+            self.stats["last_save_s"] = round(time.perf_counter() - started, 3)
+        logging.info("Saved a snapshot of %d devices to %s in %.3f s", len(records), self.path,
+                     self.stats["last_save_s"])
@@ -28,4 +28,4 @@ cd ..
 
 chmod +x ./src/ec2/iot_devices/setup.sh
 ./src/ec2/iot_devices/setup.sh
-python src/ec2/iot_devices/main.py
\ No newline at end of file
+python -m src.ec2.iot_devices.main
\ No newline at end of file
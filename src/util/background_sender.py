@@ -0,0 +1,257 @@
+import os
+import time
+import heapq
+import struct
+import logging
+import tempfile
+import itertools
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Constants
+QUEUE_CAPACITY = 100_000  # Records queued in memory before the overflow policy applies
+SENDER_WORKERS = 1
+BATCH_RECORDS = 500  # Records a worker takes at once from sinks without their own limit
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 0.05  # Seconds before the first retry of a record, doubled on every further one
+OVERFLOW_POLICIES = ("block", "drop-oldest", "spill")
+SPILL_HEADER = struct.Struct("<HI")  # Key length, data length
+SPILL_CHUNK = 10_000  # Records read back from the spill file at once
+
+logging.basicConfig(level=logging.INFO)
+
+class _Spill:
+    """Append-only overflow file of (data, key) records, read back in order.
+
+    Only used under BackgroundSender's lock. The file is truncated whenever
+    it has been read back completely, and removed on close.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="nairobi-spill-", suffix=".bin")
+            os.close(fd)
+        self.path = path
+        self.count = 0
+        self._file = open(path, "w+b")
+        self._read_at = 0
+
+    def append(self, data: bytes, key: str) -> None:
+        encoded = key.encode("utf-8")
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(SPILL_HEADER.pack(len(encoded), len(data)) + encoded + data)
+        self.count += 1
+
+    def read(self, limit: int) -> List[Tuple[bytes, str]]:
+        self._file.seek(self._read_at)
+        records = []
+        while self.count and len(records) < limit:
+            key_length, data_length = SPILL_HEADER.unpack(self._file.read(SPILL_HEADER.size))
+            key = self._file.read(key_length).decode("utf-8")
+            records.append((self._file.read(data_length), key))
+            self.count -= 1
+        self._read_at = self._file.tell()
+        if not self.count:
+            self._file.seek(0)
+            self._file.truncate()
+            self._read_at = 0
+        return records
+
+    def close(self) -> None:
+        self._file.close()
+        os.remove(self.path)
+
+class BackgroundSender:
+    """Decouples simulation from delivery: put() only queues, sender threads deliver.
+
+    Devices call put() from their tick as with any sink; worker threads take
+    batches from a bounded queue and hand them to `sink`. Records that fail
+    go to a delayed retry queue (exponential backoff) instead of holding up
+    either side, and are dropped after `max_attempts`. A KinesisProducer is
+    driven one PutRecords attempt at a time (send_once), so its per-record
+    failures are retried here; other sinks get put() calls and a record is
+    retried when put() raises.
+
+    When the queue is full, `overflow` decides: "block" makes put() wait for
+    room, "drop-oldest" drops the oldest queued record, and "spill" appends
+    to a file (`spill_path`, a temporary file by default) that is read back,
+    in order, once the queue has room.
+
+    Args:
+        sink: Any sink with put/flush/close and a `stats` dict.
+        capacity: Records queued in memory.
+        overflow: One of OVERFLOW_POLICIES.
+        workers: Sender threads.
+        spill_path: Spill file for overflow="spill".
+        max_attempts: Delivery attempts per record before it is dropped.
+        retry_backoff: Seconds before the first retry, doubled on every further one.
+    """
+
+    def __init__(self, sink, capacity: int = QUEUE_CAPACITY, overflow: str = "block", workers: int = SENDER_WORKERS,
+                 spill_path: Optional[str] = None, max_attempts: int = MAX_ATTEMPTS,
+                 retry_backoff: float = RETRY_BACKOFF):
+        if capacity < 1:
+            raise ValueError(f"Queue capacity must be at least 1, got {capacity}")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.sink = sink
+        # Passed through so fleet metrics see the sink's routing and rate limits
+        self.router = getattr(sink, "router", None)
+        self.limiter = getattr(sink, "limiter", None)
+        self.capacity = capacity
+        self.overflow = overflow
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.counts: Dict[str, int] = {"queued": 0, "overflow_dropped": 0, "spilled": 0, "retried": 0, "failed": 0}
+        self._queue: Deque[Tuple[bytes, str, int]] = deque()  # (data, key, attempts so far)
+        self._retries: List[Tuple[float, int, bytes, str, int]] = []  # Heap of (due, seq, data, key, attempts)
+        self._sequence = itertools.count()
+        self._spill = _Spill(spill_path) if overflow == "spill" else None
+        self._send_once = getattr(sink, "send_once", None)
+        self._batch_records = getattr(sink, "max_records", BATCH_RECORDS)
+        self._batch_bytes = getattr(sink, "max_bytes", None)
+        self._in_flight = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        self._workers = [threading.Thread(target=self._run, name=f"sender-{i}", daemon=True) for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """The sink's stats plus the queue's own counts; `dropped` includes records dropped here."""
+        stats = dict(self.sink.stats)
+        stats.update(self.counts)
+        stats["dropped"] = stats.get("dropped", 0) + self.counts["overflow_dropped"] + self.counts["failed"]
+        return stats
+
+    @property
+    def queue_depth(self) -> int:
+        """Records queued, spilled or waiting for a retry."""
+        return len(self._queue) + len(self._retries) + (self._spill.count if self._spill is not None else 0)
+
+    def put(self, data: bytes, key: str) -> None:
+        """Queues one record; only blocks with overflow="block" and a full queue."""
+        with self._cond:
+            if self._spill is not None and self._spill.count:
+                self._spill.append(data, key)  # Behind what is already spilled, to keep the order
+                self.counts["spilled"] += 1
+            elif len(self._queue) < self.capacity:
+                self._queue.append((data, key, 0))
+            elif self.overflow == "block":
+                while len(self._queue) >= self.capacity:
+                    self._cond.wait()
+                self._queue.append((data, key, 0))
+            elif self.overflow == "drop-oldest":
+                self._queue.popleft()
+                self.counts["overflow_dropped"] += 1
+                self._queue.append((data, key, 0))
+            else:
+                self._spill.append(data, key)
+                self.counts["spilled"] += 1
+            self.counts["queued"] += 1
+            self._cond.notify_all()  # flush() may be waiting too, so notify() could miss the workers
+
+    def flush(self) -> None:
+        """Waits until everything queued so far (retries included) is delivered or dropped."""
+        with self._cond:
+            while self._pending() or self._in_flight:
+                self._cond.wait(self.retry_backoff)
+        self.sink.flush()
+
+    def close(self) -> None:
+        """Delivers what is queued, stops the workers and closes the sink."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self.sink.close()
+        if self._spill is not None:
+            self._spill.close()
+
+    def _pending(self) -> bool:
+        return bool(self._queue or self._retries or (self._spill is not None and self._spill.count))
+
+    def _take(self, now: float) -> List[Tuple[bytes, str, int]]:
+        """Up to one batch of due retries first, then queued records; call with the lock held."""
+        batch, size = [], 0
+        while self._retries and self._retries[0][0] <= now and len(batch) < self._batch_records:
+            _, _, data, key, attempts = self._retries[0]
+            if self._over_bytes(batch, size, data, key):
+                break
+            heapq.heappop(self._retries)
+            batch.append((data, key, attempts))
+            size += len(data) + len(key)
+        if self._spill is not None and self._spill.count and len(self._queue) <= self.capacity // 2:
+            self._queue.extend((data, key, 0) for data, key in
+                               self._spill.read(min(SPILL_CHUNK, self.capacity - len(self._queue))))
+        while self._queue and len(batch) < self._batch_records:
+            data, key, attempts = self._queue[0]
+            if self._over_bytes(batch, size, data, key):
+                break
+            self._queue.popleft()
+            batch.append((data, key, attempts))
+            size += len(data) + len(key)
+        return batch
+
+    def _over_bytes(self, batch: List[Tuple[bytes, str, int]], size: int, data: bytes, key: str) -> bool:
+        """Whether adding a record would take a non-empty batch over the sink's byte limit."""
+        return bool(batch) and self._batch_bytes is not None and size + len(data) + len(key) > self._batch_bytes
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    batch = self._take(now)
+                    if batch:
+                        break
+                    if self._closing and not self._pending() and not self._in_flight:
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(self._retries[0][0] - now if self._retries else None)
+                self._in_flight += 1
+                self._cond.notify_all()  # Room for blocked put() calls
+            failed = batch
+            try:
+                failed = self._deliver(batch)
+            finally:
+                self._finish(failed)
+
+    def _deliver(self, batch: List[Tuple[bytes, str, int]]) -> List[Tuple[bytes, str, int]]:
+        """Hands a batch to the sink; returns the records that failed."""
+        if self._send_once is not None:
+            try:
+                return [batch[i] for i in self._send_once([(data, key) for data, key, _ in batch])]
+            except Exception as e:
+                logging.warning("Sending %d records failed: %s", len(batch), e)
+                return batch
+        failed = []
+        for record in batch:
+            try:
+                self.sink.put(record[0], record[1])
+            except Exception as e:
+                logging.warning("Sending a record for %s failed: %s", record[1], e)
+                failed.append(record)
+        return failed
+
+    def _finish(self, failed: List[Tuple[bytes, str, int]]) -> None:
+        """Queues the failed records of a batch for a delayed retry, or drops them after max_attempts."""
+        now = time.monotonic()
+        dropped = 0
+        with self._cond:
+            for data, key, attempts in failed:
+                if attempts + 1 >= self.max_attempts:
+                    dropped += 1
+                    continue
+                due = now + self.retry_backoff * 2 ** attempts
+                heapq.heappush(self._retries, (due, next(self._sequence), data, key, attempts + 1))
+            self.counts["retried"] += len(failed) - dropped
+            self.counts["failed"] += dropped
+            # Retries are queued before the batch stops counting as in flight, so close() waits for them
+            self._in_flight -= 1
+            self._cond.notify_all()
+        if dropped:
+            logging.error("Dropped %d records after %d attempts", dropped, self.max_attempts)
@@ -0,0 +1,101 @@
+import os
+import time
+import asyncio
+from typing import Optional, Tuple
+
+def _started_monotonic() -> float:
+    """time.monotonic() at the moment this process started, from /proc where there is one.
+
+    Without /proc the start is taken to be now, the import of this module.
+    """
+    now = time.monotonic()
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])  # starttime: clock ticks after boot
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return now
+    return now - max(0.0, uptime - ticks / os.sysconf("SC_CLK_TCK"))
+
+PROCESS_STARTED = _started_monotonic()
+
+def process_age() -> float:
+    """Real seconds since this process started, interpreter start-up and imports included."""
+    return time.monotonic() - PROCESS_STARTED
+
+class RealClock:
+    """Wall-clock time: what the simulators used before clocks were pluggable."""
+
+    def time(self) -> float:
+        """Epoch seconds stamped on payloads."""
+        return time.time()
+
+    def monotonic(self) -> float:
+        """Time the scheduler measures intervals with."""
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    async def wait_until(self, when: float) -> None:
+        """Wait until monotonic() reaches `when`."""
+        await asyncio.sleep(max(0.0, when - time.monotonic()))
+
+class VirtualClock:
+    """Simulated time that only moves when the simulation waits.
+
+    With no speedup every wait returns immediately, so a fleet runs as fast
+    as the CPU allows; with a speedup (e.g. 60) waits last delay/speedup real
+    seconds. Timestamps follow simulated time from `start` (epoch seconds).
+
+    Args:
+        start: Simulated epoch time to start at; defaults to now.
+        speedup: Simulated seconds per real second, None for as fast as possible.
+    """
+
+    def __init__(self, start: Optional[float] = None, speedup: Optional[float] = None):
+        self.now = time.time() if start is None else float(start)
+        self.speedup = speedup
+        self.anchor: Optional[Tuple[float, float]] = None  # (simulated, real) time pacing started at
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        """Move simulated time forward without waiting."""
+        self.now += max(0.0, seconds)
+
+    def start_pacing(self) -> None:
+        """Anchor pacing at the first wait, not at construction (building a fleet takes time)."""
+        if self.speedup and self.anchor is None:
+            self.anchor = (self.now, time.monotonic())
+
+    def pace(self) -> float:
+        """Real seconds to wait so simulated time runs at `speedup` x real time.
+
+        Pacing is measured from a fixed anchor, so oversleeping on one wait is
+        made up on the next ones instead of accumulating.
+        """
+        if not self.speedup:
+            return 0.0
+        simulated, real = self.anchor
+        return max(0.0, real + (self.now - simulated) / self.speedup - time.monotonic())
+
+    def sleep(self, seconds: float) -> None:
+        self.start_pacing()
+        self.advance(seconds)
+        delay = self.pace()
+        if delay:
+            time.sleep(delay)
+
+    async def wait_until(self, when: float) -> None:
+        self.start_pacing()
+        self.advance(when - self.now)
+        # Yield to the loop even when not pacing, so other tasks still run
+        await asyncio.sleep(self.pace())
+
+REAL_CLOCK = RealClock()
@@ -0,0 +1,232 @@
+import os
+import logging
+from typing import Dict, List, Optional, Sequence
+
+from src.util.encoders import LEVEL_FIELDS, STATUSES
+from src.util.partitions import partition_dir
+from src.util.state_store import decode_record
+
+# Constants
+BATCH_ROWS = 65536  # Rows per row group (Parquet) or record batch (Arrow IPC); bounds memory per device type
+COMPRESSION = "zstd"
+FORMATS = {"parquet": "parquet", "arrow": "arrow"}  # Format -> file extension
+STATUS_VALUES = sorted(STATUSES, key=STATUSES.get)  # Shared status dictionary, in the binary format's code order
+
+def _arrow():
+    # Imported here so the NDJSON archive and the simulator do not need pyarrow
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+    import pyarrow.parquet
+    return pyarrow
+
+def archive_schema(device_type: str):
+    """Typed columns of one device type's archive: the payload keys, flattened."""
+    pa = _arrow()
+    return pa.schema([
+        ("deviceId", pa.string()),
+        ("timestamp", pa.timestamp("s", tz="UTC")),
+        ("status", pa.dictionary(pa.int8(), pa.string())),
+        ("lat", pa.float64()),
+        ("lon", pa.float64()),
+        ("alt", pa.float64()),
+        (LEVEL_FIELDS[device_type], pa.float64()),
+    ])
+
+class _Partition:
+    __slots__ = ("hour", "path", "writer", "rows", "batches", "buffered")
+
+    def __init__(self, hour: int, path: str, writer):
+        self.hour = hour
+        self.path = path
+        self.writer = writer
+        self.rows: Dict[str, list] = {}  # Column -> values of payloads not yet in a batch
+        self.batches: list = []
+        self.buffered = 0
+
+class ColumnarWriter:
+    """Micro-batches device payloads into Parquet or Arrow IPC files partitioned by type, date and hour.
+
+    The layout and part numbering follow PartitionedWriter, so a columnar
+    archive sits next to (or replaces) the NDJSON one. Each file holds typed
+    columns: lat/lon/alt and battery/gas as float64, timestamps as UTC
+    seconds and status dictionary-encoded against one fixed dictionary.
+    Payloads are buffered per partition and written as one row group (or
+    record batch) every `batch_rows` rows. Only the current hour of each type
+    is open, so memory stays bounded by `batch_rows` rows per device type.
+    Parquet files cannot be appended to, so an hour reopened within a run
+    gets another part file.
+
+    As a sink it takes records in any wire format of src.util.encoders and
+    reports the sink stats: records_sent, bytes_sent (file bytes, counted as
+    each file is closed) and dropped (undecodable records), plus files and
+    batches.
+
+    Args:
+        root: Output directory.
+        part: Part number in the file names, one per writing process.
+        file_format: "parquet" or "arrow" (Arrow IPC file).
+        batch_rows: Rows per row group / record batch.
+        compression: Parquet or IPC codec, e.g. "zstd", "lz4" or None.
+    """
+
+    def __init__(self, root: str, part: int = 0, file_format: str = "parquet", batch_rows: int = BATCH_ROWS,
+                 compression: Optional[str] = COMPRESSION):
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown archive format {file_format!r}, expected one of {sorted(FORMATS)}")
+        self.pa = _arrow()
+        self.root = root
+        self.part = part
+        self.file_format = file_format
+        self.batch_rows = batch_rows
+        self.compression = compression
+        self.stats: Dict[str, int] = {"records_sent": 0, "bytes_sent": 0, "dropped": 0, "files": 0, "batches": 0}
+        self._open: Dict[str, _Partition] = {}
+        self._schemas: Dict[str, object] = {}
+        self._reopened: Dict[str, int] = {}
+        self._statuses = self.pa.array(STATUS_VALUES)
+
+    def put(self, data: bytes, key: str) -> None:
+        """Producer interface for devices: one record of any encoder, partitioned by its own timestamp."""
+        try:
+            payload = decode_record(data)
+        except ValueError as e:
+            self.stats["dropped"] += 1
+            logging.warning("Not archiving record for %s: %s", key, e)
+            return
+        self.write_payload(payload)
+
+    def write_payload(self, payload: Dict[str, object]) -> None:
+        """Buffers one payload as built by get_payload."""
+        device_type = payload["deviceId"].split("-", 1)[0]
+        partition = self._partition(device_type, payload["timestamp"])
+        rows = partition.rows
+        if not rows:
+            rows.update((name, []) for name in self._schema(device_type).names)
+        lat, lon, alt = payload["location"]
+        for name, value in (("deviceId", payload["deviceId"]), ("timestamp", payload["timestamp"]),
+                            ("status", payload["status"]), ("lat", lat), ("lon", lon), ("alt", alt),
+                            (LEVEL_FIELDS[device_type], payload[LEVEL_FIELDS[device_type]])):
+            rows[name].append(value)
+        partition.buffered += 1
+        self.stats["records_sent"] += 1
+        if partition.buffered >= self.batch_rows:
+            self._flush(partition)
+
+    def write_columns(self, device_type: str, prefix_ids: Sequence[int], timestamps: Sequence[int],
+                      statuses: Sequence[str], lat: Sequence[float], lon: Sequence[float], alt: Sequence[float],
+                      levels: Sequence[float]) -> None:
+        """Buffers whole columns (e.g. NumPy arrays of a FleetArrays tick) that all fall in one hour.
+
+        `prefix_ids` are the numbers after "<type>-" in the device ids.
+        """
+        if len(timestamps) == 0:
+            return
+        pa = self.pa
+        partition = self._partition(device_type, int(timestamps[0]))
+        self._batch_rows(partition)
+        ids = pa.compute.binary_join_element_wise(device_type + "-", pa.array(prefix_ids).cast(pa.string()), "")
+        partition.batches.append(self._record_batch(device_type, ids, timestamps, statuses, lat, lon, alt, levels))
+        partition.buffered += len(timestamps)
+        self.stats["records_sent"] += len(timestamps)
+        if partition.buffered >= self.batch_rows:
+            self._flush(partition)
+
+    def _schema(self, device_type: str):
+        schema = self._schemas.get(device_type)
+        if schema is None:
+            schema = self._schemas[device_type] = archive_schema(device_type)
+        return schema
+
+    def _record_batch(self, device_type: str, ids, timestamps, statuses, lat, lon, alt, levels):
+        pa = self.pa
+        schema = self._schema(device_type)
+        codes = pa.compute.index_in(pa.array(statuses, pa.string()), value_set=self._statuses).cast(pa.int8())
+        return pa.RecordBatch.from_arrays([
+            pa.array(ids, pa.string()),
+            pa.array(timestamps, pa.int64()).cast(schema.field("timestamp").type),
+            pa.DictionaryArray.from_arrays(codes, self._statuses),
+            pa.array(lat, pa.float64()),
+            pa.array(lon, pa.float64()),
+            pa.array(alt, pa.float64()),
+            pa.array(levels, pa.float64()),
+        ], schema=schema)
+
+    def _partition(self, device_type: str, timestamp: int) -> _Partition:
+        hour = timestamp // 3600
+        partition = self._open.get(device_type)
+        if partition is None or partition.hour != hour:
+            if partition is not None:
+                self._close(partition)
+            partition = self._open[device_type] = self._start(device_type, timestamp)
+        return partition
+
+    def _start(self, device_type: str, timestamp: int) -> _Partition:
+        directory = partition_dir(self.root, device_type, timestamp)
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{self.part:05d}"
+        count = self._reopened[directory] = self._reopened.get(directory, -1) + 1
+        if count:
+            name += f"-{count}"
+        path = os.path.join(directory, f"{name}.{FORMATS[self.file_format]}")
+        schema = self._schema(device_type)
+        if self.file_format == "parquet":
+            writer = self.pa.parquet.ParquetWriter(path, schema, compression=self.compression or "none")
+        else:
+            options = self.pa.ipc.IpcWriteOptions(compression=self.compression)
+            writer = self.pa.ipc.new_file(path, schema, options=options)
+        self.stats["files"] += 1
+        return _Partition(timestamp // 3600, path, writer)
+
+    def _batch_rows(self, partition: _Partition) -> None:
+        """Turns the buffered payload rows into a record batch."""
+        rows = partition.rows
+        if rows and rows["deviceId"]:
+            device_type = rows["deviceId"][0].split("-", 1)[0]
+            partition.batches.append(self._record_batch(device_type, *rows.values()))
+            partition.rows = {}
+
+    def _flush(self, partition: _Partition) -> None:
+        self._batch_rows(partition)
+        if not partition.batches:
+            return
+        table = self.pa.Table.from_batches(partition.batches).combine_chunks()
+        if self.file_format == "parquet":
+            partition.writer.write_table(table, row_group_size=len(table))
+        else:
+            for batch in table.to_batches(max_chunksize=len(table)):
+                partition.writer.write_batch(batch)
+        partition.batches = []
+        partition.buffered = 0
+        self.stats["batches"] += 1
+
+    def _close(self, partition: _Partition) -> None:
+        self._flush(partition)
+        partition.writer.close()
+        self.stats["bytes_sent"] += os.path.getsize(partition.path)
+
+    def flush(self) -> None:
+        """Writes the open micro-batch of every partition as a row group / record batch of its own."""
+        for partition in self._open.values():
+            self._flush(partition)
+
+    def close(self) -> None:
+        """Flushes and closes every open partition."""
+        for partition in self._open.values():
+            self._close(partition)
+        self._open = {}
+
+def read_archive(root: str, device_type: str, columns: Optional[List[str]] = None):
+    """Reads every Parquet and Arrow IPC file of one device type under `root` into one pyarrow Table."""
+    pa = _arrow()
+    tables = []
+    for directory, _, files in sorted(os.walk(os.path.join(root, f"type={device_type}"))):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if name.endswith(".parquet"):
+                tables.append(pa.parquet.read_table(path, columns=columns))
+            elif name.endswith(".arrow"):
+                with pa.OSFile(path, "rb") as source:
+                    table = pa.ipc.open_file(source).read_all()
+                tables.append(table.select(columns) if columns else table)
+    return pa.concat_tables(tables) if tables else archive_schema(device_type).empty_table()
@@ -0,0 +1,134 @@
+import math
+from typing import Dict, List, Optional, Tuple
+
+from src.util.encoders import LEVEL_FIELDS
+from src.util.sim_functions import DEGREES_PER_KM
+
+# Constants
+POSITION_ERROR_M = 10.0  # Meters between the actual and the predicted position that force a record
+LEVEL_STEP = 5.0  # Battery/gas points between the actual and the predicted level that force a record
+HEARTBEAT = 600.0  # Seconds after which a device sends even if it is fully predictable
+TRIGGERS = ("first", "status", "heading", "level", "position", "heartbeat")
+
+# A sent sample: (timestamp, lat, lon, alt, level)
+Sample = Tuple[float, float, float, float, float]
+
+def extrapolate(last: Sample, prev: Optional[Sample], timestamp: float) -> Sample:
+    """Predicts a device's state at `timestamp` from its last two sent samples, at constant rates.
+
+    With one sample (or two at the same time) the device is predicted to stay
+    where it was. Levels are kept within 0-100. The emitter and consumers
+    share this model, so what is suppressed is exactly what consumers predict.
+    """
+    if prev is None or last[0] == prev[0]:
+        return (timestamp,) + last[1:]
+    ratio = (timestamp - last[0]) / (last[0] - prev[0])
+    lat, lon, alt, level = (value + (value - before) * ratio for value, before in zip(last[1:], prev[1:]))
+    return timestamp, lat, lon, alt, min(100.0, max(0.0, level))
+
+def error_meters(a: Sample, b: Sample) -> float:
+    """Distance between the positions of two samples; altitudes are already in meters."""
+    return math.sqrt(((a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2) * (1000 / DEGREES_PER_KM) ** 2 + (a[3] - b[3]) ** 2)
+
+class DeadReckoning:
+    """Emission policy that suppresses the records consumers can predict.
+
+    A device sends only when its status or heading changed, its level or
+    position drifted from extrapolate() of its last two sent records by more
+    than `level_step` / `position_m`, or `heartbeat` seconds passed since its
+    last record. One policy is shared by a whole fleet and keeps the last two
+    samples per device; a status change starts the history over, since rates
+    of one status (moving, charging, descending) say nothing about the next.
+
+    Args:
+        position_m: Position error in meters that forces a record.
+        level_step: Battery/gas error in points that forces a record.
+        heartbeat: Longest gap in seconds between two records of a device.
+        on_heading: Whether a heading change alone forces a record; without it
+            turns are caught by the position error one tick later.
+    """
+
+    def __init__(self, position_m: float = POSITION_ERROR_M, level_step: float = LEVEL_STEP,
+                 heartbeat: float = HEARTBEAT, on_heading: bool = True):
+        self.position_m = position_m
+        self.level_step = level_step
+        self.heartbeat = heartbeat
+        self.on_heading = on_heading
+        # deviceId -> (last sample, previous sample, status, heading) as of its last record
+        self.sent: Dict[str, Tuple[Sample, Optional[Sample], str, float]] = {}
+        self.stats: Dict[str, int] = dict({"sent": 0, "suppressed": 0}, **{trigger: 0 for trigger in TRIGGERS})
+
+    def trigger(self, device, timestamp: float) -> Optional[str]:
+        """Why `device` must send at `timestamp`, or None if consumers can predict its state."""
+        state = self.sent.get(device.device_id)
+        if state is None:
+            return "first"
+        last, prev, status, heading = state
+        if device.status != status:
+            return "status"
+        if self.on_heading and device.heading != heading:
+            return "heading"
+        if timestamp - last[0] >= self.heartbeat:
+            return "heartbeat"
+        predicted = extrapolate(last, prev, timestamp)
+        if abs(device.level - predicted[4]) > self.level_step:
+            return "level"
+        location = device.location
+        if error_meters((timestamp, location[0], location[1], location[2], 0.0), predicted) > self.position_m:
+            return "position"
+        return None
+
+    def should_send(self, device, timestamp: float) -> bool:
+        """Decides on one tick of `device` and remembers the sample if it is sent."""
+        reason = self.trigger(device, timestamp)
+        if reason is None:
+            self.stats["suppressed"] += 1
+            return False
+        state = self.sent.get(device.device_id)
+        location = device.location
+        sample = (timestamp, location[0], location[1], location[2], device.level)
+        prev = state[0] if state is not None and state[2] == device.status else None
+        self.sent[device.device_id] = (sample, prev, device.status, device.heading)
+        self.stats["sent"] += 1
+        self.stats[reason] += 1
+        return True
+
+def _sample(payload: Dict[str, object], level_field: str) -> Sample:
+    lat, lon, alt = payload["location"]
+    return payload["timestamp"], lat, lon, alt, payload[level_field]
+
+def reconstruct(records: List[Dict[str, object]], interval: float,
+                end: Optional[float] = None) -> List[Dict[str, object]]:
+    """Rebuilds the full ping series of one device from the records a DeadReckoning policy let through.
+
+    Between two records (and after the last one, up to `end`) a payload is
+    predicted every `interval` seconds with extrapolate(). Predicted payloads
+    carry "predicted": True.
+
+    Args:
+        records: Payload dicts of one device in timestamp order, e.g. decoded with
+            src.util.state_store.decode_record.
+        interval: The device's seconds between pings.
+        end: Last timestamp to predict up to (default: the last record's).
+    """
+    if not records:
+        return []
+    level_field = LEVEL_FIELDS[records[0]["deviceId"].split("-", 1)[0]]
+    series = []
+    prev = None
+    for i, record in enumerate(records):
+        series.append(record)
+        if i and record["status"] != records[i - 1]["status"]:
+            prev = None  # As DeadReckoning does on a status change
+        last = _sample(record, level_field)
+        until = records[i + 1]["timestamp"] if i + 1 < len(records) else (end if end is not None else last[0])
+        timestamp = last[0] + interval
+        # Half an interval of slack absorbs the whole-second timestamps of real ticks
+        while timestamp < until - interval / 2 or (i + 1 == len(records) and timestamp <= until):
+            _, lat, lon, alt, level = extrapolate(last, prev, timestamp)
+            series.append({"deviceId": record["deviceId"], "timestamp": int(timestamp), "status": record["status"],
+                           "location": [round(lat, 6), round(lon, 6), round(alt, 6)],
+                           level_field: round(level, 1), "predicted": True})
+            timestamp += interval
+        prev = last
+    return series
@@ -0,0 +1,92 @@
+import json
+import struct
+from typing import Dict
+
+# Binary wire format, version 1 (little endian, 25 bytes):
+#   version u8 | device type u8 | device number u32 | timestamp u32 |
+#   lat i32 (microdegrees) | lon i32 (microdegrees) | alt i32 (millimetres) |
+#   status u8 | battery/gas u16 (tenths of a percent)
+BINARY_VERSION = 1
+BINARY_RECORD = struct.Struct("<BBIIiiiBH")
+DEVICE_TYPES = {"phone": 1, "car": 2, "drone": 3}
+LEVEL_FIELDS = {"phone": "battery", "car": "gas", "drone": "battery"}
+STATUSES = {"moving": 0, "charging": 1, "ping": 2, "flying": 3, "descending": 4, "landed": 5}
+DEVICE_TYPE_NAMES = {code: name for name, code in DEVICE_TYPES.items()}
+STATUS_NAMES = {code: name for name, code in STATUSES.items()}
+
+class JsonEncoder:
+    """Reference encoder: builds the payload dict and runs it through json.dumps."""
+
+    name = "json"
+
+    def encode(self, device, timestamp: int) -> bytes:
+        payload = {
+            "deviceId": device.device_id,
+            "timestamp": timestamp,
+            "status": device.status,
+            "location": device.location,
+            device.LEVEL_FIELD: device.level,
+        }
+        return json.dumps(payload).encode("utf-8")
+
+class TemplateJsonEncoder:
+    """Writes the same bytes as JsonEncoder from a fixed template, without building a dict.
+
+    Device ids are generated as "<type>-<digits>" and statuses come from a
+    fixed set, so neither needs JSON escaping; floats use repr like json.dumps.
+    """
+
+    name = "template"
+    template = '{"deviceId": "%s", "timestamp": %d, "status": "%s", "location": [%r, %r, %r], "%s": %r}'
+
+    def encode(self, device, timestamp: int) -> bytes:
+        location = device.location
+        return (self.template % (device.device_id, timestamp, device.status, location[0], location[1],
+                                 location[2], device.LEVEL_FIELD, device.level)).encode("utf-8")
+
+class BinaryEncoder:
+    """Versioned 25-byte record: fixed-point coordinates, enum status, packed battery/gas."""
+
+    name = "binary"
+
+    def encode(self, device, timestamp: int) -> bytes:
+        device_type, number = device.device_id.split("-", 1)
+        lat, lon, alt = device.location
+        return BINARY_RECORD.pack(
+            BINARY_VERSION,
+            DEVICE_TYPES[device_type],
+            int(number),
+            timestamp,
+            round(lat * 1_000_000),
+            round(lon * 1_000_000),
+            round(alt * 1000),
+            STATUSES[device.status],
+            round(device.level * 10),
+        )
+
+def decode_binary(data: bytes) -> Dict[str, object]:
+    """Decodes a binary record back into the payload dictionary consumers expect.
+
+    Raises:
+        ValueError: If the record has an unknown version or the wrong size.
+    """
+    if len(data) != BINARY_RECORD.size or data[0] != BINARY_VERSION:
+        raise ValueError(f"Not a version {BINARY_VERSION} binary record ({len(data)} bytes)")
+    _, device_type, number, timestamp, lat, lon, alt, status, level = BINARY_RECORD.unpack(data)
+    name = DEVICE_TYPE_NAMES[device_type]
+    return {
+        "deviceId": f"{name}-{number}",
+        "timestamp": timestamp,
+        "status": STATUS_NAMES[status],
+        "location": [lat / 1_000_000, lon / 1_000_000, alt / 1000],
+        LEVEL_FIELDS[name]: level / 10,
+    }
+
+ENCODERS = {encoder.name: encoder for encoder in (JsonEncoder(), TemplateJsonEncoder(), BinaryEncoder())}
+
+def get_encoder(name: str):
+    """Returns the encoder registered under `name` ("json", "template" or "binary")."""
+    try:
+        return ENCODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown encoder {name!r}, expected one of {sorted(ENCODERS)}") from None
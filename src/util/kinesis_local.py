@@ -0,0 +1,337 @@
+import json
+import time
+import base64
+import bisect
+import hashlib
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# Per-shard write limits of a provisioned Kinesis stream
+SHARD_BYTES_PER_SEC = 1024 * 1024  # Data + partition key
+SHARD_RECORDS_PER_SEC = 1000
+HASH_KEY_SPACE = 2 ** 128
+DEFAULT_SHARDS = 4
+DEFAULT_PORT = 4567
+DEFAULT_RETAIN = 100_000  # Records kept per shard for GetRecords
+TRIM_SLACK = 0.1  # Trim once a shard holds 10% more than `retain`, not on every put
+DEFAULT_GET_LIMIT = 10000
+TARGET_PREFIX = "Kinesis_20131202."
+
+logging.basicConfig(level=logging.INFO)
+
+class KinesisError(Exception):
+    """Error returned to the client as {"__type": code, "message": ...} with HTTP 400."""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+
+class _Bucket:
+    """Token bucket holding one second of capacity, refilled continuously."""
+
+    __slots__ = ("rate", "tokens", "updated")
+
+    def __init__(self, rate: float, now: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class Shard:
+    """One shard: its hash key range, write limits and the records it retains."""
+
+    def __init__(self, index: int, count: int, retain: int, now: float):
+        self.shard_id = f"shardId-{index:012d}"
+        self.start_hash = index * HASH_KEY_SPACE // count
+        self.end_hash = (index + 1) * HASH_KEY_SPACE // count - 1
+        self.retain = retain
+        self.records: List[Tuple[int, float, str, bytes]] = []  # (sequence, arrival, key, data)
+        self.trimmed = 0  # Sequence number of records[0]
+        self.records_limit = _Bucket(SHARD_RECORDS_PER_SEC, now)
+        self.bytes_limit = _Bucket(SHARD_BYTES_PER_SEC, now)
+        self.throttled = 0
+
+    def append(self, key: str, data: bytes, now: float) -> Optional[int]:
+        """Stores a record and returns its sequence number, or None if the shard is over its limits."""
+        size = len(data) + len(key.encode("utf-8"))
+        self.records_limit.refill(now)
+        self.bytes_limit.refill(now)
+        if self.records_limit.tokens < 1 or self.bytes_limit.tokens < size:
+            self.throttled += 1
+            return None
+        self.records_limit.tokens -= 1
+        self.bytes_limit.tokens -= size
+        sequence = self.trimmed + len(self.records)
+        self.records.append((sequence, now, key, data))
+        if len(self.records) > self.retain * (1 + TRIM_SLACK):
+            drop = len(self.records) - self.retain
+            del self.records[:drop]
+            self.trimmed += drop
+        return sequence
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "ShardId": self.shard_id,
+            "HashKeyRange": {"StartingHashKey": str(self.start_hash), "EndingHashKey": str(self.end_hash)},
+            "SequenceNumberRange": {"StartingSequenceNumber": format_sequence(self.trimmed)},
+        }
+
+class Stream:
+    """A named stream whose shards split the 128-bit hash key space evenly."""
+
+    def __init__(self, name: str, count: int, retain: int, now: float):
+        self.name = name
+        self.shards = [Shard(i, count, retain, now) for i in range(count)]
+        self.starts = [shard.start_hash for shard in self.shards]
+
+    def shard_for(self, record: Dict[str, object]) -> Shard:
+        explicit = record.get("ExplicitHashKey")
+        value = int(explicit) if explicit is not None else hash_key(record["PartitionKey"])
+        return self.shards[bisect.bisect_right(self.starts, value) - 1]
+
+    def shard(self, shard_id: str) -> Shard:
+        for shard in self.shards:
+            if shard.shard_id == shard_id:
+                return shard
+        raise KinesisError("ResourceNotFoundException", f"Shard {shard_id} not found in stream {self.name}")
+
+def format_sequence(sequence: int) -> str:
+    return f"{sequence:056d}"
+
+def hash_key(partition_key: str) -> int:
+    """The 128-bit hash Kinesis maps a partition key to: the MD5 of the key."""
+    return int(hashlib.md5(partition_key.encode("utf-8")).hexdigest(), 16)
+
+class LocalKinesis:
+    """In-memory Kinesis Data Streams with provisioned per-shard write limits.
+
+    Implements the operations the simulator and its consumers use, with the
+    request and response shapes of the JSON 1.1 protocol boto3 speaks. Writes
+    beyond 1 MB/s or 1000 records/s on a shard are refused with
+    ProvisionedThroughputExceededException, like a real provisioned stream.
+
+    Args:
+        shards: Shard count of streams created implicitly or without ShardCount.
+        retain: Records kept per shard; older ones are trimmed.
+        auto_create: Create unknown streams on first use instead of raising.
+        time_fn: Clock for the rate limits and arrival timestamps.
+    """
+
+    def __init__(self, shards: int = DEFAULT_SHARDS, retain: int = DEFAULT_RETAIN, auto_create: bool = True,
+                 time_fn=time.time):
+        self.default_shards = shards
+        self.retain = retain
+        self.auto_create = auto_create
+        self.time_fn = time_fn
+        self.streams: Dict[str, Stream] = {}
+        self.lock = threading.Lock()
+
+    def client(self) -> "LocalClient":
+        """A boto3-shaped client calling this stream directly, without HTTP."""
+        return LocalClient(self)
+
+    def handle(self, operation: str, request: Dict[str, object]) -> Dict[str, object]:
+        """Runs one API operation, e.g. handle("PutRecords", {...}).
+
+        Raises:
+            KinesisError: For unknown operations or streams and throttled single puts.
+        """
+        method = getattr(self, "op_" + operation, None)
+        if method is None:
+            raise KinesisError("UnknownOperationException", f"Operation {operation} is not supported")
+        with self.lock:
+            return method(request)
+
+    def _stream(self, request: Dict[str, object]) -> Stream:
+        name = request.get("StreamName") or str(request.get("StreamARN", "")).rpartition("/")[2]
+        if name not in self.streams:
+            if not self.auto_create:
+                raise KinesisError("ResourceNotFoundException", f"Stream {name} not found")
+            self._create(name, self.default_shards)
+        return self.streams[name]
+
+    def _create(self, name: str, count: int) -> None:
+        self.streams[name] = Stream(name, count, self.retain, self.time_fn())
+
+    def op_CreateStream(self, request: Dict[str, object]) -> Dict[str, object]:
+        if request["StreamName"] in self.streams:
+            raise KinesisError("ResourceInUseException", f"Stream {request['StreamName']} already exists")
+        self._create(request["StreamName"], int(request.get("ShardCount") or self.default_shards))
+        return {}
+
+    def op_DescribeStreamSummary(self, request: Dict[str, object]) -> Dict[str, object]:
+        stream = self._stream(request)
+        return {"StreamDescriptionSummary": {
+            "StreamName": stream.name,
+            "StreamARN": f"arn:aws:kinesis:local:000000000000:stream/{stream.name}",
+            "StreamStatus": "ACTIVE",
+            "OpenShardCount": len(stream.shards),
+            "RetentionPeriodHours": 24,
+            "StreamCreationTimestamp": 0,
+            "EnhancedMonitoring": [],
+        }}
+
+    def op_ListShards(self, request: Dict[str, object]) -> Dict[str, object]:
+        return {"Shards": [shard.describe() for shard in self._stream(request).shards]}
+
+    def op_PutRecord(self, request: Dict[str, object]) -> Dict[str, object]:
+        shard = self._stream(request).shard_for(request)
+        sequence = shard.append(request["PartitionKey"], base64.b64decode(request["Data"]), self.time_fn())
+        if sequence is None:
+            raise KinesisError("ProvisionedThroughputExceededException",
+                               f"Rate exceeded for shard {shard.shard_id}")
+        return {"ShardId": shard.shard_id, "SequenceNumber": format_sequence(sequence)}
+
+    def op_PutRecords(self, request: Dict[str, object]) -> Dict[str, object]:
+        stream = self._stream(request)
+        now = self.time_fn()
+        results = []
+        failed = 0
+        for record in request["Records"]:
+            shard = stream.shard_for(record)
+            sequence = shard.append(record["PartitionKey"], base64.b64decode(record["Data"]), now)
+            if sequence is None:
+                failed += 1
+                results.append({"ErrorCode": "ProvisionedThroughputExceededException",
+                                "ErrorMessage": f"Rate exceeded for shard {shard.shard_id}"})
+            else:
+                results.append({"ShardId": shard.shard_id, "SequenceNumber": format_sequence(sequence)})
+        return {"FailedRecordCount": failed, "Records": results, "EncryptionType": "NONE"}
+
+    def op_GetShardIterator(self, request: Dict[str, object]) -> Dict[str, object]:
+        stream = self._stream(request)
+        shard = stream.shard(request["ShardId"])
+        kind = request["ShardIteratorType"]
+        if kind == "TRIM_HORIZON":
+            position = shard.trimmed
+        elif kind == "LATEST":
+            position = shard.trimmed + len(shard.records)
+        elif kind == "AT_SEQUENCE_NUMBER":
+            position = int(request["StartingSequenceNumber"])
+        elif kind == "AFTER_SEQUENCE_NUMBER":
+            position = int(request["StartingSequenceNumber"]) + 1
+        elif kind == "AT_TIMESTAMP":
+            arrivals = [record[1] for record in shard.records]
+            position = shard.trimmed + bisect.bisect_left(arrivals, float(request["Timestamp"]))
+        else:
+            raise KinesisError("InvalidArgumentException", f"Unknown ShardIteratorType {kind}")
+        return {"ShardIterator": _iterator(stream.name, shard.shard_id, position)}
+
+    def op_GetRecords(self, request: Dict[str, object]) -> Dict[str, object]:
+        stream, shard_id, position = _parse_iterator(request["ShardIterator"])
+        shard = self._stream({"StreamName": stream}).shard(shard_id)
+        limit = int(request.get("Limit") or DEFAULT_GET_LIMIT)
+        start = max(position, shard.trimmed) - shard.trimmed
+        batch = shard.records[start:start + limit]
+        records = [{
+            "SequenceNumber": format_sequence(sequence),
+            "ApproximateArrivalTimestamp": arrival,
+            "Data": base64.b64encode(data).decode("ascii"),
+            "PartitionKey": key,
+        } for sequence, arrival, key, data in batch]
+        next_position = shard.trimmed + start + len(batch)
+        behind = 0 if not batch or next_position >= shard.trimmed + len(shard.records) else \
+            int((self.time_fn() - batch[-1][1]) * 1000)
+        return {"Records": records, "NextShardIterator": _iterator(stream, shard_id, next_position),
+                "MillisBehindLatest": behind}
+
+class LocalClient:
+    """The subset of boto3's Kinesis client the simulator and consumers call, over a LocalKinesis.
+
+    Takes and returns raw bytes for Data like boto3 does. Errors are raised
+    as KinesisError, whose `code` is the boto3 ClientError's error code.
+    """
+
+    def __init__(self, kinesis: LocalKinesis):
+        self.kinesis = kinesis
+
+    def list_shards(self, **request) -> Dict[str, object]:
+        return self.kinesis.handle("ListShards", request)
+
+    def put_record(self, **request) -> Dict[str, object]:
+        request["Data"] = base64.b64encode(request["Data"]).decode("ascii")
+        return self.kinesis.handle("PutRecord", request)
+
+    def put_records(self, **request) -> Dict[str, object]:
+        request["Records"] = [dict(record, Data=base64.b64encode(record["Data"]).decode("ascii"))
+                              for record in request["Records"]]
+        return self.kinesis.handle("PutRecords", request)
+
+    def get_shard_iterator(self, **request) -> Dict[str, object]:
+        return self.kinesis.handle("GetShardIterator", request)
+
+    def get_records(self, **request) -> Dict[str, object]:
+        response = self.kinesis.handle("GetRecords", request)
+        for record in response["Records"]:
+            record["Data"] = base64.b64decode(record["Data"])
+        return response
+
+def _iterator(stream: str, shard_id: str, position: int) -> str:
+    return base64.b64encode(json.dumps([stream, shard_id, position]).encode("utf-8")).decode("ascii")
+
+def _parse_iterator(iterator: str) -> Tuple[str, str, int]:
+    try:
+        stream, shard_id, position = json.loads(base64.b64decode(iterator))
+    except ValueError:
+        raise KinesisError("InvalidArgumentException", "Invalid ShardIterator") from None
+    return stream, shard_id, int(position)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, as boto3 pools its connections
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+    def do_POST(self) -> None:
+        target = self.headers.get("X-Amz-Target", "")
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            if not target.startswith(TARGET_PREFIX):
+                raise KinesisError("UnknownOperationException", f"Unknown target {target!r}")
+            response = self.server.kinesis.handle(target[len(TARGET_PREFIX):], json.loads(body or b"{}"))
+            status = 200
+        except KinesisError as e:
+            response, status = {"__type": e.code, "message": str(e)}, 400
+        except (KeyError, ValueError) as e:
+            response, status = {"__type": "InvalidArgumentException", "message": str(e)}, 400
+        payload = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args) -> None:
+        pass  # One line per request would swamp benchmark output
+
+def start_server(port: int = 0, host: str = "127.0.0.1",
+                 kinesis: Optional[LocalKinesis] = None) -> ThreadingHTTPServer:
+    """Serves `kinesis` (a new LocalKinesis by default) on a daemon thread.
+
+    Port 0 picks a free port; the endpoint URL is
+    f"http://{host}:{server.server_address[1]}". Stop it with server.shutdown().
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.kinesis = kinesis if kinesis is not None else LocalKinesis()
+    threading.Thread(target=server.serve_forever, name="local-kinesis", daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Kinesis Data Streams with per-shard limits.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS, help="Shards of implicitly created streams")
+    parser.add_argument("--retain", type=int, default=DEFAULT_RETAIN, help="Records kept per shard")
+    args = parser.parse_args()
+    server = start_server(args.port, args.host, LocalKinesis(args.shards, args.retain))
+    logging.info("Local Kinesis listening on http://%s:%d (%d shards per stream)", args.host, args.port,
+                 args.shards)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
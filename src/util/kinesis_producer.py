@@ -0,0 +1,224 @@
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from src.util.sim_functions import STREAM_NAME, get_kinesis_client
+from src.util.metrics import BATCH_BUCKETS, REGISTRY
+
+# Kinesis PutRecords limits
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 5 * 1024 * 1024  # Data + partition keys of one request
+MAX_RECORD_BYTES = 1024 * 1024
+DEFAULT_LINGER = 0.1  # Seconds a record may wait for its batch to fill
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 0.05  # Seconds, doubled on every resend of the same records
+THROTTLED = "ProvisionedThroughputExceededException"
+
+# Per-call metrics; per-record counts are exported from `stats` by the fleet's collector
+PUT_LATENCY = REGISTRY.histogram("nairobi_put_records_seconds", "Latency of one PutRecords call")
+BATCH_RECORDS = REGISTRY.histogram("nairobi_put_records_batch_records", "Records per PutRecords call",
+                                   BATCH_BUCKETS)
+THROTTLES = REGISTRY.counter("nairobi_put_records_throttled_total",
+                             "Records (or whole calls) refused with ProvisionedThroughputExceededException")
+
+class KinesisProducer:
+    """Buffers records and ships them with PutRecords.
+
+    A batch is flushed as soon as it reaches 500 records or 5 MB, or when its
+    oldest record has waited `linger` seconds. Records rejected inside a
+    partially failed response are resent on their own (with a short
+    backoff) instead of replaying the whole batch.
+
+    Args:
+        stream: Kinesis stream name.
+        client: boto3 Kinesis client; defaults to the pooled client.
+        max_records: Flush once this many records are buffered.
+        max_bytes: Flush once the buffered data + keys reach this size.
+        linger: Maximum seconds a record waits before its batch is flushed.
+        max_attempts: PutRecords attempts per record before it is dropped.
+        router: Optional ShardRouter; records then carry an ExplicitHashKey
+            that balances bytes over the shards instead of the MD5 of their key.
+        limiter: Optional ShardRateLimiter; batches then wait for per-shard
+            capacity before PutRecords, and resends are paced by it instead
+            of a fixed backoff.
+    """
+
+    def __init__(self, stream: str = STREAM_NAME, client=None, max_records: int = MAX_BATCH_RECORDS,
+                 max_bytes: int = MAX_BATCH_BYTES, linger: float = DEFAULT_LINGER,
+                 max_attempts: int = MAX_ATTEMPTS, router=None, limiter=None):
+        self.stream = stream
+        self.client = client if client is not None else get_kinesis_client()
+        self.max_records = min(max_records, MAX_BATCH_RECORDS)
+        self.max_bytes = min(max_bytes, MAX_BATCH_BYTES)
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.router = router
+        self.limiter = limiter
+        self.stats: Dict[str, int] = {
+            "records_sent": 0, "bytes_sent": 0, "batches": 0, "resent": 0, "dropped": 0,
+            "throttled": 0,  # Failed with ProvisionedThroughputExceeded, a subset of the failures resent
+        }
+        self._buffer: List[Dict[str, object]] = []
+        self._buffer_bytes = 0
+        self._oldest = 0.0
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def put(self, data: bytes, key: str) -> None:
+        """Queue one record; flushes synchronously when a size limit is reached."""
+        size = len(data) + len(key.encode("utf-8"))
+        if size > MAX_RECORD_BYTES:
+            raise ValueError(f"Record of {size} bytes exceeds the 1 MB Kinesis limit")
+        if self._flusher is None:
+            self._start_flusher()
+
+        with self._lock:
+            if self._buffer and self._buffer_bytes + size > self.max_bytes:
+                batch = self._take()
+            else:
+                batch = None
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(self._record(data, key, size))
+            self._buffer_bytes += size
+            if len(self._buffer) >= self.max_records:
+                full = self._take()
+            else:
+                full = None
+
+        if batch:
+            self._send(batch)
+        if full:
+            self._send(full)
+
+    @property
+    def queue_depth(self) -> int:
+        """Records buffered and not yet handed to PutRecords."""
+        return len(self._buffer)
+
+    def flush(self) -> None:
+        """Send everything that is buffered."""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def close(self) -> None:
+        """Flush the buffer and stop the linger thread."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _record(self, data: bytes, key: str, size: int) -> Dict[str, object]:
+        """PutRecords entry for one record; call with _lock held so a key's records keep their order."""
+        record = {"Data": data, "PartitionKey": key}
+        if self.router is not None:
+            record["ExplicitHashKey"] = self.router.route(key, size)
+        return record
+
+    def _take(self) -> List[Dict[str, object]]:
+        batch, self._buffer, self._buffer_bytes = self._buffer, [], 0
+        return batch
+
+    def _start_flusher(self) -> None:
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._linger_loop, daemon=True)
+                self._flusher.start()
+
+    def _linger_loop(self) -> None:
+        """Flushes batches whose oldest record has waited longer than `linger`."""
+        while not self._closed.wait(self.linger / 2):
+            try:
+                with self._lock:
+                    expired = self._buffer and time.monotonic() - self._oldest >= self.linger
+                    batch = self._take() if expired else None
+                if batch:
+                    self._send(batch)
+            except Exception:
+                # Nothing else flushes lingering batches, so this thread must outlive any error
+                logging.exception("Flushing a lingering batch failed")
+
+    def _slow_down(self, throttled: List[Dict[str, object]]) -> None:
+        """Cuts the limiter's rate once for every shard that throttled some of these records."""
+        if self.limiter is not None:
+            for shard in {self.limiter.shard_for(record) for record in throttled}:
+                self.limiter.throttled(shard)
+
+    def _send(self, batch: List[Dict[str, object]]) -> None:
+        """PutRecords with per-record resend of the entries that failed."""
+        with self._send_lock:
+            pending = batch
+            for attempt in range(self.max_attempts):
+                if attempt:
+                    self.stats["resent"] += len(pending)
+                    if self.limiter is None:
+                        time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+                pending = [pending[i] for i in self._put_once(pending)]
+                if not pending:
+                    return
+            self.stats["dropped"] += len(pending)
+            logging.error("Dropped %d records after %d attempts", len(pending), self.max_attempts)
+
+    def send_once(self, batch: List[Tuple[bytes, str]]) -> List[int]:
+        """One PutRecords attempt of (data, key) pairs, bypassing the buffer and the resends.
+
+        For callers that retry on their own schedule, e.g. BackgroundSender.
+        Records over the 1 MB limit are dropped. Returns the indices of the
+        records that failed.
+        """
+        records, indices = [], []
+        with self._lock:
+            for index, (data, key) in enumerate(batch):
+                size = len(data) + len(key.encode("utf-8"))
+                if size > MAX_RECORD_BYTES:
+                    self.stats["dropped"] += 1
+                    logging.error("Dropped a record of %d bytes for %s, over the 1 MB Kinesis limit", size, key)
+                    continue
+                records.append(self._record(data, key, size))
+                indices.append(index)
+        if not records:
+            return []
+        with self._send_lock:
+            return [indices[i] for i in self._put_once(records)]
+
+    def _put_once(self, pending: List[Dict[str, object]]) -> List[int]:
+        """One PutRecords call; returns the indices of the records that failed."""
+        # Imported here so loading the producer (and the fleet) does not import botocore
+        from botocore.exceptions import BotoCoreError, ClientError
+        if self.limiter is not None:
+            self.limiter.wait(self.limiter.reserve_batch(pending))
+        BATCH_RECORDS.observe(len(pending))
+        started = time.perf_counter()
+        try:
+            response = self.client.put_records(StreamName=self.stream, Records=pending)
+        except (BotoCoreError, ClientError) as e:
+            # Connection errors and timeouts fail every record, like an error response
+            if isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") == THROTTLED:
+                THROTTLES.inc()
+                self.stats["throttled"] += len(pending)
+                self._slow_down(pending)
+            logging.warning("PutRecords of %d records failed: %s", len(pending), e)
+            return list(range(len(pending)))
+        finally:
+            PUT_LATENCY.observe(time.perf_counter() - started)
+        self.stats["batches"] += 1
+        failed, throttled = [], []
+        for index, (record, result) in enumerate(zip(pending, response["Records"])):
+            if "ErrorCode" in result:
+                failed.append(index)
+                if result["ErrorCode"] == THROTTLED:
+                    THROTTLES.inc()
+                    self.stats["throttled"] += 1
+                    throttled.append(record)
+                    if self.router is not None:
+                        self.router.note_throttled(record.get("ExplicitHashKey"))
+            else:
+                self.stats["records_sent"] += 1
+                self.stats["bytes_sent"] += len(record["Data"])
+        self._slow_down(throttled)
+        return failed
@@ -0,0 +1,116 @@
+import math
+from typing import Dict, List, Optional
+
+# Constants
+UNITS = ("records", "bytes")
+RECORD_BYTES = 130.0  # Bytes per JSON record assumed until the first measurement (see encoder_bench)
+SMOOTHING = 0.3  # Weight of the newest measurement in the delivered-per-emitted estimate
+TOLERANCE = 0.02  # Relative error within which the delivered rate counts as on target
+SETTLE_PERIODS = 3  # Consecutive periods on target that make steady state
+DECREASE = 0.9  # Ceiling multiplier on a period with throttling
+INCREASE = 0.02  # Share of the target the ceiling regains per period without throttling
+
+class LoadController:
+    """Closed loop that holds the throughput a sink delivers at a target, in records/s or bytes/s.
+
+    Every control period the caller reports what it emitted, what the sink
+    delivered and how many records the sink pushed back (throttled or
+    overflowed); update() returns the emission rate (records/s) to aim for
+    next. The runner turns that into devices and intervals itself, so the
+    loop only has to learn what one emitted record yields at the sink (about
+    1 record, or its size in bytes) and how much the sink can take.
+
+    Throttling lowers a ceiling to DECREASE x the rate delivered in that
+    period, which then grows back by INCREASE x target per quiet period
+    (AIMD, like the shard rate limiter): a sink too small for the target is
+    driven at about its capacity, which the report gives as `ceiling_per_s`.
+
+    Steady state is SETTLE_PERIODS consecutive periods within `tolerance` of
+    the target; `time_to_steady_s` is when the first of them began. Drift is
+    the error of every period after that.
+
+    Args:
+        target: Delivered units per second to hold.
+        unit: "records" or "bytes".
+        tolerance: Relative error that counts as on target.
+        settle: Periods on target that make steady state.
+
+    Raises:
+        ValueError: Unknown unit or a target that is not positive.
+    """
+
+    def __init__(self, target: float, unit: str = "records", tolerance: float = TOLERANCE,
+                 settle: int = SETTLE_PERIODS):
+        if unit not in UNITS:
+            raise ValueError(f"Unknown unit {unit!r}, expected one of {UNITS}")
+        if target <= 0:
+            raise ValueError(f"Target must be positive, got {target}")
+        self.target = float(target)
+        self.unit = unit
+        self.tolerance = tolerance
+        self.settle = settle
+        self.per_record = 1.0 if unit == "records" else RECORD_BYTES  # Delivered units per emitted record
+        self.ceiling = math.inf
+        self.setpoint = self.target / self.per_record
+        self.steady_at: Optional[float] = None
+        self._streak_start: Optional[float] = None
+        self._streak = 0
+        self.errors: List[float] = []  # Relative error of every period after steady state
+        self.periods = 0
+        self.throttled_periods = 0
+        self.last_rate = 0.0
+
+    def update(self, now: float, seconds: float, emitted: int, delivered: float, throttled: int = 0) -> float:
+        """Takes one period's measurements and returns the emission rate (records/s) to aim for.
+
+        Args:
+            now: Time the period ended, in seconds from the start of the run.
+            seconds: Length of the period.
+            emitted: Records emitted in the period.
+            delivered: Units the sink delivered in the period.
+            throttled: Records the sink pushed back in the period.
+        """
+        self.periods += 1
+        rate = self.last_rate = delivered / seconds
+        if emitted and delivered and not throttled:
+            self.per_record += SMOOTHING * (delivered / emitted - self.per_record)
+        if throttled:
+            self.throttled_periods += 1
+            self.ceiling = min(self.ceiling, rate) * DECREASE
+        elif self.ceiling < math.inf:
+            self.ceiling += INCREASE * self.target
+            if self.ceiling >= self.target:
+                self.ceiling = math.inf
+        self._track(now - seconds, rate)
+        self.setpoint = min(self.target, self.ceiling) / self.per_record
+        return self.setpoint
+
+    def _track(self, started: float, rate: float) -> None:
+        error = (rate - self.target) / self.target
+        if self.steady_at is not None:
+            self.errors.append(error)
+            return
+        if abs(error) > self.tolerance:
+            self._streak = 0
+            return
+        if not self._streak:
+            self._streak_start = started
+        self._streak += 1
+        if self._streak >= self.settle:
+            self.steady_at = self._streak_start
+
+    def report(self) -> Dict[str, object]:
+        """Time to steady state, drift after it, and the sink's ceiling if it ever throttled."""
+        errors = self.errors
+        return {
+            "target_per_s": self.target,
+            "unit": self.unit,
+            "time_to_steady_s": self.steady_at,
+            "mean_error_pct": round(100 * sum(errors) / len(errors), 2) if errors else None,
+            "max_drift_pct": round(100 * max(map(abs, errors)), 2) if errors else None,
+            "achieved_per_s": round(self.target * (1 + sum(errors) / len(errors))) if errors else None,
+            "last_per_s": round(self.last_rate),
+            "ceiling_per_s": None if self.ceiling == math.inf else round(self.ceiling),
+            "throttled_periods": self.throttled_periods,
+            "periods": self.periods,
+        }
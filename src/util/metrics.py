@@ -0,0 +1,203 @@
+import bisect
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Constants
+DEFAULT_HOST = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus text exposition format
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Seconds
+LATENESS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # Seconds
+BATCH_BUCKETS = (1, 10, 50, 100, 250, 499, 500)  # Records per PutRecords call
+
+logging.basicConfig(level=logging.INFO)
+
+# Metrics are plain attribute updates without a lock: hot paths only touch them
+# once per batch or tick, and a lost increment under a thread race does not
+# matter for monitoring. Anything already counted elsewhere (e.g. a producer's
+# `stats` dict) is exported by a collector at scrape time instead, so it costs
+# nothing per record.
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+def _value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    """Monotonic count, e.g. records sent. Names should end in _total."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Optional[Dict[str, str]] = None, value: float = 0):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        yield self.name, self.labels, self.value
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. records waiting in a buffer."""
+
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+class Histogram:
+    """Counts observations into fixed buckets, exported as Prometheus cumulative buckets.
+
+    Args:
+        name: Metric name, e.g. nairobi_put_records_seconds.
+        help: One-line description.
+        buckets: Upper bounds of the buckets; +Inf is implied.
+        labels: Constant labels of this series.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.bounds = sorted(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, count: int = 1) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += count
+        self.sum += value * count
+        self.count += count
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f"{self.name}_bucket", {**self.labels, "le": _value(bound)}, cumulative
+        yield f"{self.name}_bucket", {**self.labels, "le": "+Inf"}, self.count
+        yield f"{self.name}_sum", self.labels, self.sum
+        yield f"{self.name}_count", self.labels, self.count
+
+def lateness_histogram(name: str, help: str, stats, labels: Optional[Dict[str, str]] = None,
+                       buckets: Sequence[float] = LATENESS_BUCKETS) -> Histogram:
+    """Re-buckets a scheduler's LatenessStats into a Histogram, at scrape time.
+
+    Each fine bucket is counted at its upper bound; the last (overflow) one goes to +Inf.
+    """
+    histogram = Histogram(name, help, buckets, labels)
+    last = len(stats.counts) - 1
+    for index, count in enumerate(stats.counts):
+        if count:
+            histogram.counts[len(histogram.bounds) if index == last else
+                             bisect.bisect_left(histogram.bounds, (index + 1) * stats.resolution)] += count
+    histogram.count = stats.count
+    histogram.sum = stats.total
+    return histogram
+
+class Registry:
+    """The metrics of one process, plus collectors that build metrics when scraped."""
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], object] = {}
+        self._collectors: List[Callable[[], Iterable[object]]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labels: Dict[str, str], *args):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls(name, help, *args, labels=labels)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name!r} is already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        """Returns the counter `name` with these labels, creating it on first use."""
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, **labels: str) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  **labels: str) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[object]]) -> None:
+        """Calls `collector` on every scrape; it returns Counter/Gauge/Histogram objects."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Iterable[object]]) -> None:
+        with self._lock:
+            self._collectors.remove(collector)
+
+    def collect(self) -> List[object]:
+        with self._lock:
+            metrics, collectors = list(self._metrics.values()), list(self._collectors)
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                logging.error("Metrics collector failed: %s", e)
+        return metrics
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format, HELP and TYPE once per name."""
+        families: Dict[str, List[object]] = {}
+        for metric in self.collect():
+            families.setdefault(metric.name, []).append(metric)
+        lines = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].help}")
+            lines.append(f"# TYPE {name} {metrics[0].kind}")
+            for metric in metrics:
+                for sample, labels, value in metric.samples():
+                    lines.append(f"{sample}{_labels(labels)} {_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()  # The process-wide default
+
+def start_metrics_server(port: int = 0, host: str = DEFAULT_HOST, registry: Optional[Registry] = None):
+    """Serves `registry` (REGISTRY by default) on http://host:port/metrics from a daemon thread.
+
+    Returns the http.server.ThreadingHTTPServer. Port 0 picks a free port, see
+    server.server_address. Stop it with server.shutdown().
+    """
+    # Imported here so processes that serve no metrics start without http.server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = self.server.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args) -> None:
+            pass  # One line per scrape is noise
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.registry = registry if registry is not None else REGISTRY
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,100 @@
+import os
+import gzip
+from datetime import datetime, timezone
+from typing import Dict, List, Set
+
+from src.util.clock import REAL_CLOCK
+
+# Constants
+DEFAULT_COMPRESSLEVEL = 1  # gzip level 1 compresses ~8x at a fraction of level 6's cost
+FLUSH_BYTES = 4 * 1024 * 1024  # Uncompressed bytes buffered per partition before a write
+
+def partition_dir(root: str, device_type: str, timestamp: int) -> str:
+    """Directory of the hourly partition a record belongs to, laid out like the S3 bucket.
+
+    e.g. <root>/type=phone/date=2024-01-31/hour=07 (UTC).
+    """
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return os.path.join(root, f"type={device_type}", f"date={moment:%Y-%m-%d}", f"hour={moment:%H}")
+
+class _Partition:
+    __slots__ = ("hour", "file", "buffer", "buffered")
+
+    def __init__(self, hour: int, file):
+        self.hour = hour
+        self.file = file
+        self.buffer: List[bytes] = []
+        self.buffered = 0
+
+class PartitionedWriter:
+    """Streams NDJSON records into gzip files partitioned by type, date and hour.
+
+    Records of one device type arrive in time order, so only the current
+    hour of each type is open: when a type moves to the next hour its old
+    file is flushed and closed. Lines are buffered and compressed in large
+    chunks, which keeps memory bounded by `flush_bytes` per device type.
+
+    Args:
+        root: Output directory.
+        part: Part number in the file names, one per writing process.
+        compresslevel: gzip level.
+        flush_bytes: Uncompressed bytes buffered per partition before compressing.
+        clock: Clock stamping records received through put(); the real clock by default.
+    """
+
+    def __init__(self, root: str, part: int = 0, compresslevel: int = DEFAULT_COMPRESSLEVEL,
+                 flush_bytes: int = FLUSH_BYTES, clock=None):
+        self.root = root
+        self.part = part
+        self.compresslevel = compresslevel
+        self.flush_bytes = flush_bytes
+        self.clock = clock if clock is not None else REAL_CLOCK
+        self.stats: Dict[str, int] = {"records": 0, "bytes": 0, "files": 0}
+        self._open: Dict[str, _Partition] = {}
+        self._seen: Set[str] = set()
+
+    def put(self, data: bytes, key: str) -> None:
+        """Producer interface for devices: one JSON record, partitioned by the clock's time."""
+        self.write(key.split("-", 1)[0], int(self.clock.time()), data + b"\n")
+
+    def write(self, device_type: str, timestamp: int, lines: bytes) -> None:
+        """Appends newline-terminated records that all fall in the hour of `timestamp`."""
+        hour = timestamp // 3600
+        partition = self._open.get(device_type)
+        if partition is None or partition.hour != hour:
+            if partition is not None:
+                self._close(partition)
+            partition = self._open[device_type] = self._start(device_type, timestamp)
+        partition.buffer.append(lines)
+        partition.buffered += len(lines)
+        self.stats["records"] += lines.count(b"\n")
+        self.stats["bytes"] += len(lines)
+        if partition.buffered >= self.flush_bytes:
+            self._flush(partition)
+
+    def _start(self, device_type: str, timestamp: int) -> _Partition:
+        directory = partition_dir(self.root, device_type, timestamp)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{self.part:05d}.ndjson.gz")
+        # A partition reopened within the same run gets another gzip member appended
+        mode = "ab" if path in self._seen else "wb"
+        if path not in self._seen:
+            self._seen.add(path)
+            self.stats["files"] += 1
+        return _Partition(timestamp // 3600, gzip.open(path, mode, compresslevel=self.compresslevel))
+
+    def _flush(self, partition: _Partition) -> None:
+        if partition.buffer:
+            partition.file.write(b"".join(partition.buffer))
+            partition.buffer = []
+            partition.buffered = 0
+
+    def _close(self, partition: _Partition) -> None:
+        self._flush(partition)
+        partition.file.close()
+
+    def close(self) -> None:
+        """Flushes and closes every open partition."""
+        for partition in self._open.values():
+            self._close(partition)
+        self._open = {}
@@ -0,0 +1,121 @@
+import time
+import bisect
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from src.util.metrics import REGISTRY
+from src.util.shard_router import SHARD_BYTES_PER_SEC, SHARD_RECORDS_PER_SEC
+
+# Constants
+BURST = 1.0  # Seconds of traffic a full bucket lets through at once, like the Kinesis shard limits
+DECREASE = 0.7  # Rate multiplier on every throttling response
+INCREASE = 0.2  # Share of the shard limit regained per second without throttling
+MIN_SHARE = 0.1  # The rate never drops below 10% of the shard limit
+
+WAITED = REGISTRY.counter("nairobi_rate_limit_wait_seconds_total", "Seconds sends were held back by the limiter")
+CUTS = REGISTRY.counter("nairobi_rate_limit_cuts_total", "Shard rates cut after a throttling response")
+
+class TokenBucket:
+    """Token bucket whose refill rate adapts to throttling (AIMD).
+
+    Callers reserve tokens up front and wait the returned time, so the bucket
+    may go into debt instead of rejecting. A throttling response cuts the rate
+    by DECREASE and empties the bucket; without throttling the rate grows back
+    towards `limit` by INCREASE x limit per second.
+
+    Not thread-safe on its own; ShardRateLimiter holds a lock around it.
+    """
+
+    def __init__(self, limit: float, now: float, burst: float = BURST):
+        self.limit = limit
+        self.rate = limit
+        self.burst = burst
+        self.tokens = limit * burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        self.rate = min(self.limit, self.rate + INCREASE * self.limit * elapsed)
+        self.tokens = min(self.rate * self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Takes `amount` tokens; returns the seconds to wait before using them."""
+        self._refill(now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def throttled(self, now: float) -> None:
+        self._refill(now)
+        self.rate = max(self.limit * MIN_SHARE, self.rate * DECREASE)
+        self.tokens = min(self.tokens, 0.0)
+
+def _hash_key(record: Dict[str, object]) -> int:
+    explicit = record.get("ExplicitHashKey")
+    if explicit is not None:
+        return int(explicit)
+    return int(hashlib.md5(record["PartitionKey"].encode("utf-8")).hexdigest(), 16)
+
+class ShardRateLimiter:
+    """Client-side rate limit of one records bucket and one bytes bucket per shard.
+
+    Records are mapped to shards the way Kinesis does (ExplicitHashKey, else
+    the MD5 of the partition key) over the ranges of `shards`, so sends are
+    paced per shard before they are throttled. Report throttling responses
+    with throttled() and that shard slows down smoothly.
+
+    Args:
+        shards: (shard_id, start, end) of every open shard, e.g. from list_shards().
+        records_per_sec: Per-shard record limit.
+        bytes_per_sec: Per-shard byte limit (data + partition key).
+        time_fn: Monotonic clock.
+    """
+
+    def __init__(self, shards: List[Tuple[str, int, int]], records_per_sec: float = SHARD_RECORDS_PER_SEC,
+                 bytes_per_sec: float = SHARD_BYTES_PER_SEC, time_fn=time.monotonic):
+        if not shards:
+            raise ValueError("A stream has at least one open shard")
+        now = time_fn()
+        self.shard_ids = [shard_id for shard_id, _, _ in shards]
+        self._starts = [start for _, start, _ in shards]
+        self.records = [TokenBucket(records_per_sec, now) for _ in shards]
+        self.bytes = [TokenBucket(bytes_per_sec, now) for _ in shards]
+        self.time_fn = time_fn
+        self._lock = threading.Lock()
+
+    def shard_for(self, record: Dict[str, object]) -> int:
+        """Index of the shard a PutRecords entry lands on."""
+        return max(0, bisect.bisect_right(self._starts, _hash_key(record)) - 1)
+
+    def reserve(self, shard: int, records: int, size: int) -> float:
+        """Takes capacity for `records` records of `size` bytes in total; returns the seconds to wait."""
+        with self._lock:
+            now = self.time_fn()
+            return max(self.records[shard].reserve(records, now), self.bytes[shard].reserve(size, now))
+
+    def reserve_batch(self, batch: Iterable[Dict[str, object]]) -> float:
+        """reserve() for every shard a PutRecords batch touches; returns the longest wait."""
+        counts: Dict[int, List[int]] = {}
+        for record in batch:
+            count = counts.setdefault(self.shard_for(record), [0, 0])
+            count[0] += 1
+            count[1] += len(record["Data"]) + len(record["PartitionKey"])
+        return max((self.reserve(shard, records, size) for shard, (records, size) in counts.items()), default=0.0)
+
+    def wait(self, seconds: float) -> None:
+        if seconds > 0:
+            WAITED.inc(seconds)
+            time.sleep(seconds)
+
+    def throttled(self, shard: int) -> None:
+        """Cuts the shard's rates after a throttling response."""
+        with self._lock:
+            now = self.time_fn()
+            self.records[shard].throttled(now)
+            self.bytes[shard].throttled(now)
+        CUTS.inc()
+
+    def shard_rates(self) -> Dict[str, float]:
+        """Shard id -> records/s currently allowed."""
+        return {shard_id: bucket.rate for shard_id, bucket in zip(self.shard_ids, self.records)}
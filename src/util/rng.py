@@ -0,0 +1,113 @@
+import hashlib
+import threading
+from array import array
+from typing import Sequence
+
+import numpy as np
+
+# Constants
+DEFAULT_BLOCK = 64  # Draws generated per refill of a device stream
+WORDS_PER_COUNTER = 4  # Philox emits four 64-bit words per counter step
+
+# One counter-based generator per process; device streams only store their key
+# and counter, so a stream costs a few hundred bytes instead of a Generator.
+_PHILOX = np.random.Philox(key=0)
+_GENERATOR = np.random.Generator(_PHILOX)
+_COUNTER = np.zeros(4, dtype=np.uint64)
+_KEY = np.zeros(2, dtype=np.uint64)
+_STATE = {
+    "bit_generator": "Philox",
+    "state": {"counter": _COUNTER, "key": _KEY},
+    "buffer": np.zeros(WORDS_PER_COUNTER, dtype=np.uint64),
+    "buffer_pos": WORDS_PER_COUNTER,
+    "has_uint32": 0,
+    "uinteger": 0,
+}
+_LOCK = threading.Lock()
+
+def stable_hash(device_id: str) -> int:
+    """64-bit hash of a device id that, unlike hash(), is the same in every process and run."""
+    return int.from_bytes(hashlib.md5(device_id.encode("utf-8")).digest()[:8], "little")
+
+class DeviceRandom:
+    """Independent, reproducible random stream for one device.
+
+    The stream is keyed by the fleet seed and the deviceId, so a device draws
+    the same numbers whichever process or order it runs in. Draws come from
+    blocks generated with NumPy's Philox in one call; the per-draw cost is an
+    array lookup. Offers the subset of the `random` module the simulators use.
+
+    Args:
+        fleet_seed: Seed shared by the whole fleet.
+        device_id: Device the stream belongs to.
+        block_size: Number of draws generated per refill.
+    """
+
+    __slots__ = ("key", "counter", "block", "position")
+
+    def __init__(self, fleet_seed: int, device_id: str, block_size: int = DEFAULT_BLOCK):
+        words = np.random.SeedSequence([fleet_seed, stable_hash(device_id)]).generate_state(2, np.uint64)
+        self.key = (int(words[0]), int(words[1]))
+        self.counter = 0
+        self.block = array("d", bytes(8 * block_size))
+        self.position = block_size
+
+    def _refill(self) -> None:
+        size = len(self.block)
+        with _LOCK:
+            _COUNTER[0] = self.counter
+            _KEY[0], _KEY[1] = self.key
+            _PHILOX.state = _STATE
+            values = _GENERATOR.random(size)
+        self.counter += -(-size // WORDS_PER_COUNTER)
+        self.block = array("d", values.tobytes())
+        self.position = 0
+
+    def seek(self, counter: int, position: int) -> None:
+        """Moves the stream to a saved (counter, position), e.g. from a fleet snapshot.
+
+        The block the position points into is generated again, so the next
+        draws are the ones the saved stream would have made.
+        """
+        size = len(self.block)
+        self.counter = counter
+        if position < size:
+            self.counter -= -(-size // WORDS_PER_COUNTER)
+            self._refill()
+        self.position = position
+
+    def random(self) -> float:
+        """Next float in [0, 1)."""
+        position = self.position
+        if position >= len(self.block):
+            self._refill()
+            position = 0
+        self.position = position + 1
+        return self.block[position]
+
+    def randint(self, a: int, b: int) -> int:
+        """Random integer N such that a <= N <= b."""
+        position = self.position
+        if position >= len(self.block):
+            self._refill()
+            position = 0
+        self.position = position + 1
+        return a + int(self.block[position] * (b - a + 1))
+
+    def uniform(self, a: float, b: float) -> float:
+        """Random float between a and b."""
+        position = self.position
+        if position >= len(self.block):
+            self._refill()
+            position = 0
+        self.position = position + 1
+        return a + (b - a) * self.block[position]
+
+    def choice(self, seq: Sequence):
+        """Random element of a non-empty sequence."""
+        position = self.position
+        if position >= len(self.block):
+            self._refill()
+            position = 0
+        self.position = position + 1
+        return seq[int(self.block[position] * len(seq))]
@@ -0,0 +1,234 @@
+import math
+import random
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.util.clock import REAL_CLOCK
+
+# Constants
+DEFAULT_TICK = 0.01  # Seconds per slot of the innermost wheel
+DEFAULT_SLOTS = 256  # Slots per wheel
+DEFAULT_LEVELS = 4  # 256**4 ticks of 10 ms cover more than a year
+LATENESS_BUCKET = 0.001  # Lateness histogram resolution (seconds)
+LATENESS_BUCKETS = 10000  # 10 s of lateness, later ticks land in the last bucket
+
+class TimingWheel:
+    """Hierarchical timing wheel (Varghese & Lauck).
+
+    Level 0 has one slot per tick; every slot of level L spans slots**L ticks.
+    A timer is placed on the lowest level whose span still covers its
+    deadline and moves down one level each time its outer slot comes round,
+    so scheduling and expiring are O(1) regardless of how many timers exist.
+
+    Args:
+        tick: Width of one level-0 slot, in seconds.
+        slots: Number of slots per level.
+        levels: Number of levels.
+        start: Time the wheel starts at, in seconds.
+    """
+
+    def __init__(self, tick: float = DEFAULT_TICK, slots: int = DEFAULT_SLOTS, levels: int = DEFAULT_LEVELS,
+                 start: float = 0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels: List[List[List[Tuple[int, object]]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current = int(start / tick)
+        self.ready: List[Tuple[int, object]] = []
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def to_ticks(self, when: float) -> int:
+        return int(math.ceil(when / self.tick - 1e-9))
+
+    def schedule(self, when: float, item: object) -> None:
+        """Schedule `item` to expire at time `when` (seconds)."""
+        self._insert(self.to_ticks(when), item)
+        self.size += 1
+
+    def _insert(self, due: int, item: object) -> None:
+        delta = due - self.current
+        if delta <= 0:
+            self.ready.append((due, item))
+            return
+        span = self.slots
+        for level in range(self.levels):
+            if delta < span or level == self.levels - 1:
+                index = (due // (span // self.slots)) % self.slots
+                self.wheels[level][index].append((due, item))
+                return
+            span *= self.slots
+
+    def next_tick(self) -> Optional[int]:
+        """Earliest tick at which the wheel has work, or None if it is empty.
+
+        That is the first non-empty level-0 slot or the first outer slot due to
+        cascade; every level is scanned at most one rotation ahead, and outer
+        levels only up to the best tick found so far.
+        """
+        if self.ready:
+            return self.current
+        best = None
+        width = 1
+        for wheel in self.wheels:
+            first = self.current // width + 1
+            last = first + self.slots if best is None else min(first + self.slots, -(-best // width))
+            for n in range(first, last):
+                if wheel[n % self.slots]:
+                    best = n * width
+                    break
+            width *= self.slots
+        return best
+
+    def advance(self, now: float) -> List[Tuple[int, object]]:
+        """Move the wheel to time `now` and return the expired (due_tick, item) pairs.
+
+        Runs of empty ticks are skipped, so a virtual clock can jump hours ahead cheaply.
+        """
+        target = int(math.floor(now / self.tick + 1e-9))
+        expired, self.ready = self.ready, []
+        while self.current < target:
+            next_tick = self.next_tick()
+            self.current = target if next_tick is None else min(target, next_tick)
+            # Cascade outer slots whose span starts at this tick, outermost first
+            for level in range(self.levels - 1, 0, -1):
+                width = self.slots ** level
+                if self.current % width == 0:
+                    bucket = self.wheels[level][(self.current // width) % self.slots]
+                    self.wheels[level][(self.current // width) % self.slots] = []
+                    for due, item in bucket:
+                        self._insert(due, item)
+            bucket = self.wheels[0][self.current % self.slots]
+            if bucket:
+                self.wheels[0][self.current % self.slots] = []
+                expired.extend(bucket)
+            if self.ready:
+                expired.extend(self.ready)
+                self.ready = []
+        self.size -= len(expired)
+        return expired
+
+class LatenessStats:
+    """Fixed-size histogram of how late ticks fired, cheap enough to record every tick."""
+
+    def __init__(self, resolution: float = LATENESS_BUCKET, buckets: int = LATENESS_BUCKETS):
+        self.resolution = resolution
+        self.counts = [0] * buckets
+        self.count = 0
+        self.total = 0.0  # Sum of every lateness, for the mean and Prometheus _sum
+        self.max = 0.0
+
+    def record(self, lateness: float) -> None:
+        index = min(int(lateness / self.resolution), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += lateness
+        if lateness > self.max:
+            self.max = lateness
+
+    def merge(self, other: "LatenessStats") -> None:
+        """Adds the ticks of another histogram with the same buckets, e.g. from another shard or process."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound (seconds) of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return (index + 1) * self.resolution
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "ticks": self.count,
+            "p50_ms": round(self.percentile(0.50) * 1000, 1),
+            "p90_ms": round(self.percentile(0.90) * 1000, 1),
+            "p99_ms": round(self.percentile(0.99) * 1000, 1),
+            "max_ms": round(self.max * 1000, 1),
+        }
+
+class _Timer:
+    __slots__ = ("callback", "interval", "remaining", "due")
+
+    def __init__(self, callback: Callable[[], object], interval: float, remaining: int, due: float):
+        self.callback = callback
+        self.interval = interval
+        self.remaining = remaining
+        self.due = due
+
+def _timer_due(entry: Tuple[int, _Timer]) -> float:
+    return entry[1].due
+
+class TickScheduler:
+    """Fires periodic callbacks for a whole process from one asyncio loop.
+
+    Each callback has its own interval and a random phase offset within its
+    first interval, so devices of the same type do not all fire on the same
+    second. Every firing records how late it ran compared with its due time.
+
+    With a VirtualClock the loop jumps straight to the next due tick instead
+    of sleeping, and timers fire in the same order as in real time.
+
+    Args:
+        tick: Resolution of the timing wheel, in seconds.
+        clock: RealClock or VirtualClock from src.util.clock.
+    """
+
+    def __init__(self, tick: float = DEFAULT_TICK, clock=None):
+        self.clock = clock if clock is not None else REAL_CLOCK
+        self.time_fn = self.clock.monotonic
+        self.wheel = TimingWheel(tick=tick, start=self.time_fn())
+        self.lateness = LatenessStats()
+        self.fired = 0
+
+    def add(self, callback: Callable[[], object], interval: float, count: int = 0,
+            phase: Optional[float] = None, start: Optional[float] = None) -> None:
+        """Fire `callback` every `interval` seconds, `count` times (0 = forever).
+
+        The first firing happens `phase` seconds (random within one interval by
+        default) after `start`, now by default; timers added with one start keep
+        their relative order however long adding them takes.
+        """
+        interval = max(interval, self.wheel.tick)
+        if phase is None:
+            phase = random.uniform(0, interval)
+        due = (self.time_fn() if start is None else start) + phase
+        self.wheel.schedule(due, _Timer(callback, interval, count, due))
+
+    async def run(self, duration: float = 0.0) -> None:
+        """Run until every timer is exhausted, or for `duration` seconds if given."""
+        stop = self.time_fn() + duration if duration else None
+        while len(self.wheel) and (stop is None or self.time_fn() < stop):
+            self.run_due(self.time_fn())
+            if not len(self.wheel):
+                break
+            wake = self.wheel.next_tick() * self.wheel.tick
+            await self.clock.wait_until(wake if stop is None else min(wake, stop))
+
+    def run_due(self, now: float) -> int:
+        """Fire every timer that is due at `now`; returns how many fired."""
+        expired = self.wheel.advance(now)
+        # Timers sharing a tick fire by exact due time, so the order does not depend on
+        # how the start time lines up with the ticks (or on real versus virtual time)
+        expired.sort(key=_timer_due)
+        for _, timer in expired:
+            self.lateness.record(max(0.0, self.time_fn() - timer.due))
+            try:
+                timer.callback()
+            except Exception as e:
+                logging.error("Scheduled tick failed: %s", e)
+            if timer.remaining != 1:
+                timer.remaining = max(timer.remaining - 1, 0)
+                timer.due += timer.interval
+                self.wheel.schedule(timer.due, timer)
+        self.fired += len(expired)
+        return len(expired)
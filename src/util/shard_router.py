@@ -0,0 +1,164 @@
+import time
+import zlib
+import bisect
+import logging
+import threading
+from typing import Dict, List, Set, Tuple
+
+from src.util.metrics import REGISTRY
+
+# Constants
+HASH_SPACE = 2 ** 128  # Kinesis hash keys are 128-bit
+SLOTS = 1024  # Keys hash to slots, and slots (not single keys) are pinned to shards
+SHARD_BYTES_PER_SEC = 1024 * 1024  # Per-shard write limits of Kinesis Data Streams
+SHARD_RECORDS_PER_SEC = 1000
+WINDOW = 1.0  # Seconds over which per-shard send rates are measured
+HOT_FRACTION = 0.8  # A shard is hot above 80% of either limit
+MAX_MOVES = 16  # Slots moved off hot shards per window
+
+logging.basicConfig(level=logging.INFO)
+
+HOT_WINDOWS = REGISTRY.counter("nairobi_hot_shard_windows_total", "Rate windows in which a shard ran hot")
+SLOT_MOVES = REGISTRY.counter("nairobi_shard_slot_moves_total", "Routing slots moved off a hot shard")
+
+def list_shards(client, stream: str) -> List[Tuple[str, int, int]]:
+    """Open shards of `stream` as (shard_id, starting hash key, ending hash key), by start.
+
+    Pages through ListShards; shards closed by a reshard are skipped.
+    """
+    shards, token = [], None
+    while True:
+        response = client.list_shards(NextToken=token) if token else client.list_shards(StreamName=stream)
+        for shard in response["Shards"]:
+            if "EndingSequenceNumber" in shard.get("SequenceNumberRange", {}):
+                continue
+            hash_range = shard["HashKeyRange"]
+            shards.append((shard["ShardId"], int(hash_range["StartingHashKey"]), int(hash_range["EndingHashKey"])))
+        token = response.get("NextToken")
+        if not token:
+            return sorted(shards, key=lambda shard: shard[1])
+
+class ShardRouter:
+    """Picks an ExplicitHashKey per record so bytes spread evenly over the stream's shards.
+
+    Kinesis routes by the MD5 of the partition key, so a skewed fleet (or
+    colliding device ids) can leave some shards hot and others idle. Here a
+    key hashes to one of `slots` slots and every slot is pinned to a shard,
+    initially the one owning the slot's share of the hash space. Records are
+    counted against their shard's current rate window. When a window closes,
+    shards above `hot_fraction` of a limit (or that had records throttled)
+    are flagged as hot and their busiest slots move to the least loaded
+    shards. A key stays on one shard, in order, until its slot moves.
+
+    Thread-safe: route() runs under the producer's buffer lock while
+    note_throttled() runs on the sending thread, so both take the router's lock.
+
+    Args:
+        shards: (shard_id, start, end) of every open shard, e.g. from list_shards().
+        slots: Routing granularity.
+        window: Seconds per rate window.
+        hot_fraction: Share of a per-shard limit above which a shard is hot.
+        bytes_per_sec: Per-shard byte limit.
+        records_per_sec: Per-shard record limit.
+        time_fn: Monotonic clock.
+    """
+
+    def __init__(self, shards: List[Tuple[str, int, int]], slots: int = SLOTS, window: float = WINDOW,
+                 hot_fraction: float = HOT_FRACTION, bytes_per_sec: float = SHARD_BYTES_PER_SEC,
+                 records_per_sec: float = SHARD_RECORDS_PER_SEC, time_fn=time.monotonic):
+        if not shards:
+            raise ValueError("A stream has at least one open shard")
+        self.shard_ids = [shard_id for shard_id, _, _ in shards]
+        # The middle of a shard's range is its explicit hash key
+        self.hash_keys = [str((start + end) // 2) for _, start, end in shards]
+        self._shard_of_hash_key = {key: index for index, key in enumerate(self.hash_keys)}
+        starts = [start for _, start, _ in shards]
+        self.slot_shard = [bisect.bisect_right(starts, (2 * slot + 1) * HASH_SPACE // (2 * slots)) - 1
+                           for slot in range(slots)]
+        self.window = window
+        self.hot_fraction = hot_fraction
+        self.bytes_per_sec = bytes_per_sec
+        self.records_per_sec = records_per_sec
+        self.time_fn = time_fn
+        # (bytes/s, records/s) of every shard over the last closed window
+        self.rates: List[Tuple[float, float]] = [(0.0, 0.0)] * len(shards)
+        self.hot: Set[int] = set()
+        self._slot_bytes = [0] * slots
+        self._shard_bytes = [0] * len(shards)
+        self._shard_records = [0] * len(shards)
+        self._throttled: Set[int] = set()
+        self._window_start = time_fn()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_stream(cls, client, stream: str, **kwargs) -> "ShardRouter":
+        """Reads the shard map of `stream` once; build a new router after a reshard."""
+        return cls(list_shards(client, stream), **kwargs)
+
+    def route(self, key: str, size: int) -> str:
+        """Counts a record of `size` bytes for partition key `key`; returns its ExplicitHashKey."""
+        slot = zlib.crc32(key.encode("utf-8")) % len(self.slot_shard)
+        with self._lock:
+            now = self.time_fn()
+            if now - self._window_start >= self.window:
+                self._roll(now)
+            shard = self.slot_shard[slot]
+            self._slot_bytes[slot] += size
+            self._shard_bytes[shard] += size
+            self._shard_records[shard] += 1
+        return self.hash_keys[shard]
+
+    def note_throttled(self, explicit_hash_key: str) -> None:
+        """Marks the shard behind `explicit_hash_key` hot for the current window."""
+        shard = self._shard_of_hash_key.get(explicit_hash_key)
+        if shard is not None:
+            with self._lock:
+                self._throttled.add(shard)
+
+    def shard_rates(self) -> Dict[str, Tuple[float, float]]:
+        """Shard id -> (bytes/s, records/s) over the last closed window."""
+        with self._lock:
+            return dict(zip(self.shard_ids, self.rates))
+
+    def _roll(self, now: float) -> None:
+        """Closes the rate window; call with _lock held."""
+        elapsed = now - self._window_start
+        self.rates = [(sent / elapsed, records / elapsed)
+                      for sent, records in zip(self._shard_bytes, self._shard_records)]
+        hot = {shard for shard, (bytes_rate, records_rate) in enumerate(self.rates)
+               if bytes_rate >= self.hot_fraction * self.bytes_per_sec
+               or records_rate >= self.hot_fraction * self.records_per_sec} | self._throttled
+        for shard in sorted(hot - self.hot):
+            logging.warning("Shard %s is hot (%.0f B/s, %.0f records/s), moving keys off it",
+                            self.shard_ids[shard], *self.rates[shard])
+        HOT_WINDOWS.inc(len(hot))
+        self.hot = hot
+        if hot and len(hot) < len(self.shard_ids):
+            self._rebalance()
+        self._slot_bytes = [0] * len(self._slot_bytes)
+        self._shard_bytes = [0] * len(self._shard_bytes)
+        self._shard_records = [0] * len(self._shard_records)
+        self._throttled = set()
+        self._window_start = now
+
+    def _rebalance(self) -> None:
+        """Moves the busiest slots of hot shards to the least loaded shards, while that evens bytes out."""
+        loads = list(self._shard_bytes)
+        mean = sum(loads) / len(loads)
+        moves = 0
+        for shard in sorted(self.hot, key=loads.__getitem__, reverse=True):
+            slots = sorted((slot for slot, owner in enumerate(self.slot_shard)
+                            if owner == shard and self._slot_bytes[slot]),
+                           key=self._slot_bytes.__getitem__, reverse=True)
+            for slot in slots:
+                if moves >= MAX_MOVES or loads[shard] <= mean:
+                    break
+                target = min((s for s in range(len(loads)) if s not in self.hot), key=loads.__getitem__)
+                size = self._slot_bytes[slot]
+                if loads[target] + size >= loads[shard]:
+                    continue  # Would only move the hot spot
+                self.slot_shard[slot] = target
+                loads[shard] -= size
+                loads[target] += size
+                moves += 1
+        SLOT_MOVES.inc(moves)
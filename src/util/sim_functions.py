@@ -1,12 +1,20 @@
 import sys
 import json
 import math
-import boto3
-from botocore.exceptions import ClientError
-from typing import List, Tuple, Union
-from tenacity import retry, stop_after_attempt, wait_exponential
+import functools
+from typing import Callable, List, Tuple, Union
+from src.util.metrics import REGISTRY
+from src.util.rate_limiter import ShardRateLimiter
+from src.util.shard_router import HASH_SPACE, list_shards
 
 DEGREES_PER_KM = 0.009  # Nairobi
+STREAM_NAME = "nairobi-stream"
+REGION_NAME = "us-east-2"
+THROTTLED = "ProvisionedThroughputExceededException"
+THROTTLE_ATTEMPTS = 10  # Paced put_record attempts of one record before a throttle is raised
+
+SEND_RETRIES = REGISTRY.counter("nairobi_put_record_retries_total", "PutRecord retries of send_to_kinesis")
+SEND_RECORDS = REGISTRY.counter("nairobi_put_record_total", "Records sent one by one by send_to_kinesis")
 
 def parse_3d(vector_str: str, name: str = "vector") -> Union[List[float], Tuple[float, float, float]]:
     """Parses a JSON array into a 3D vector (latitude, longitude, altitude).
@@ -102,12 +110,94 @@ def update_location_vector(
 
     return (new_location, updated_distance)
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def send_to_kinesis(data: bytes, key: str) -> None:
-    client = boto3.client("kinesis", region_name="us-east-2")
-    stream = "nairobi-stream"
+def advance_location(
+    location: List[float],
+    velocity_vector: Tuple[float, float, float],
+    total_distance_km: float,
+    speed_kmh: int
+) -> float:
+    """In-place variant of update_location_vector.
+
+    Writes the rounded new coordinates back into `location` instead of
+    allocating a new list every step.
+
+    Args:
+        location: Current 3D coordinates [lat, lon, alt], updated in place.
+        velocity_vector: 3D movement (delta_lat, delta_lon, delta_alt) in degrees/meters per second.
+        total_distance_km: Cumulative distance traveled (km).
+        speed_kmh: Speed in kilometers per hour.
+
+    Returns:
+        float: Updated total distance.
+    """
+    location[0] = round(location[0] + velocity_vector[0], 6)
+    location[1] = round(location[1] + velocity_vector[1], 6)
+    location[2] = round(location[2] + velocity_vector[2], 6)
+    return total_distance_km + speed_kmh / 3600
+
+@functools.lru_cache(maxsize=None)
+def get_kinesis_client(region_name: str = REGION_NAME, endpoint_url: str = None):
+    """Returns one shared Kinesis client per region/endpoint.
+
+    Creating a client per record costs a credential lookup and a fresh TLS
+    connection; botocore clients are thread-safe, so a pooled one is reused.
+    """
+    # Imported here so the device modules, TEST runs and the other sinks load without boto3
+    import boto3
+    return boto3.client("kinesis", region_name=region_name, endpoint_url=endpoint_url)
+
+def _is_throttle(e: BaseException) -> bool:
+    from botocore.exceptions import ClientError
+    return isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") == THROTTLED
+
+@functools.lru_cache(maxsize=None)
+def get_rate_limiter(stream: str = STREAM_NAME) -> ShardRateLimiter:
+    """Returns one per-shard rate limiter per stream, from a single ListShards.
+
+    If the shards cannot be listed, the whole stream gets the budget of one shard.
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
     try:
-        client.put_record(StreamName=stream, Data=data, PartitionKey=key)
-    except ClientError as e:
-        print(f"Final attempt failed: {e}")
-        raise  # Re-raise after retries
\ No newline at end of file
+        shards = list_shards(get_kinesis_client(), stream)
+    except (BotoCoreError, ClientError) as e:
+        print(f"Cannot list the shards of {stream}, pacing it as one shard: {e}")
+        shards = [("stream", 0, HASH_SPACE - 1)]
+    return ShardRateLimiter(shards)
+
+def send_to_kinesis(data: bytes, key: str) -> None:
+    """Sends one record with put_record, paced by its shard's token buckets.
+
+    A throttled put cuts the shard's rate and goes again once the bucket
+    allows, up to THROTTLE_ATTEMPTS times, instead of sleeping 4-10 s.
+    Other errors are retried by tenacity.
+    """
+    _send_with_retries()(data, key)
+
+@functools.lru_cache(maxsize=None)
+def _send_with_retries() -> Callable[[bytes, str], None]:
+    """_put_record wrapped in tenacity's retries, built on the first send."""
+    # Imported here so the device modules load without tenacity; only sending record by record needs it
+    from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+    # Throttles are paced by the limiter in _put_record; tenacity's long sleeps are left for other errors
+    return retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+                 retry=retry_if_exception(lambda e: not _is_throttle(e)),
+                 before_sleep=lambda _: SEND_RETRIES.inc())(_put_record)
+
+def _put_record(data: bytes, key: str) -> None:
+    from botocore.exceptions import ClientError
+    client = get_kinesis_client()
+    stream = STREAM_NAME
+    limiter = get_rate_limiter(stream)
+    shard = limiter.shard_for({"PartitionKey": key})
+    for attempt in range(THROTTLE_ATTEMPTS):
+        limiter.wait(limiter.reserve(shard, 1, len(data) + len(key)))
+        try:
+            client.put_record(StreamName=stream, Data=data, PartitionKey=key)
+            SEND_RECORDS.inc()
+            return
+        except ClientError as e:
+            if not _is_throttle(e) or attempt == THROTTLE_ATTEMPTS - 1:
+                print(f"Final attempt failed: {e}")
+                raise  # Re-raise after retries
+            limiter.throttled(shard)
+            SEND_RETRIES.inc()
\ No newline at end of file
@@ -0,0 +1,223 @@
+import os
+import sys
+import socket
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from src.util.clock import REAL_CLOCK
+from src.util.state_store import state_sink
+
+# Constants
+FILE_BUFFER_BYTES = 1024 * 1024  # Bytes buffered by FileSink before one append
+MEMORY_CAPACITY = 100_000  # Records kept by the default MemorySink
+MAX_DATAGRAM = 65507  # Largest UDP payload over IPv4
+
+# Every sink offers the producer interface devices already call:
+#   put(data, key), flush(), close() and a `stats` dict with at least
+#   records_sent, bytes_sent and dropped (the keys KinesisProducer reports).
+
+class FileSink:
+    """Appends records to a file, one per line (or with any other `delimiter`).
+
+    Writes are whole buffers of complete records through an O_APPEND file
+    descriptor, so several processes may share one file without splitting
+    lines. Use delimiter=b"" for fixed-size binary records.
+    """
+
+    def __init__(self, path: str, delimiter: bytes = b"\n", buffer_bytes: int = FILE_BUFFER_BYTES):
+        self.path = path
+        self.delimiter = delimiter
+        self.buffer_bytes = buffer_bytes
+        self.stats: Dict[str, int] = {"records_sent": 0, "bytes_sent": 0, "dropped": 0}
+        self._fd = self._open(path)
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def _open(self, path: str) -> int:
+        return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def put(self, data: bytes, key: str) -> None:
+        with self._lock:
+            self._buffer.append(data + self.delimiter)
+            self._buffered += len(data) + len(self.delimiter)
+            self.stats["records_sent"] += 1
+            self.stats["bytes_sent"] += len(data)
+            if self._buffered >= self.buffer_bytes:
+                self._write()
+
+    def _write(self) -> None:
+        if self._buffer:
+            os.write(self._fd, b"".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def flush(self) -> None:
+        with self._lock:
+            self._write()
+
+    def close(self) -> None:
+        self.flush()
+        os.close(self._fd)
+
+class StdoutSink(FileSink):
+    """Writes records to standard output, one per line, e.g. to pipe into another tool."""
+
+    def __init__(self, delimiter: bytes = b"\n", buffer_bytes: int = FILE_BUFFER_BYTES):
+        super().__init__("<stdout>", delimiter, buffer_bytes)
+
+    def _open(self, path: str) -> int:
+        sys.stdout.flush()
+        return os.dup(sys.stdout.fileno())
+
+class MemorySink:
+    """Keeps the last `capacity` (key, data) records in a ring buffer, for tests and benchmarks."""
+
+    def __init__(self, capacity: int = MEMORY_CAPACITY):
+        self.records: Deque[Tuple[str, bytes]] = deque(maxlen=capacity)
+        self.stats: Dict[str, int] = {"records_sent": 0, "bytes_sent": 0, "dropped": 0}
+
+    def put(self, data: bytes, key: str) -> None:
+        if len(self.records) == self.records.maxlen:
+            self.stats["dropped"] += 1  # Overwritten by this record
+        self.records.append((key, data))
+        self.stats["records_sent"] += 1
+        self.stats["bytes_sent"] += len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class UdpSink:
+    """Sends every record as one UDP datagram; fire and forget, like a syslog or statsd feed."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9999):
+        self.address = (host, port)
+        self.stats: Dict[str, int] = {"records_sent": 0, "bytes_sent": 0, "dropped": 0}
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def put(self, data: bytes, key: str) -> None:
+        if len(data) > MAX_DATAGRAM:
+            raise ValueError(f"Record of {len(data)} bytes does not fit in one UDP datagram")
+        try:
+            self._socket.sendto(data, self.address)
+        except OSError as e:
+            self.stats["dropped"] += 1
+            logging.warning("UDP send to %s:%d failed: %s", *self.address, e)
+            return
+        self.stats["records_sent"] += 1
+        self.stats["bytes_sent"] += len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._socket.close()
+
+class NullSink:
+    """Counts and discards every record, to measure the simulator without any output cost."""
+
+    def __init__(self):
+        self.stats: Dict[str, int] = {"records_sent": 0, "bytes_sent": 0, "dropped": 0}
+
+    def put(self, data: bytes, key: str) -> None:
+        self.stats["records_sent"] += 1
+        self.stats["bytes_sent"] += len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class CappedSink(NullSink):
+    """Null sink that takes `capacity` records per second of `clock` and throttles the rest, for tests and benchmarks.
+
+    It behaves like a stream with too few shards. Throttled records are not
+    retried, so they count as dropped too.
+    """
+
+    def __init__(self, capacity: int, clock=None):
+        super().__init__()
+        self.stats["throttled"] = 0
+        self.capacity = capacity
+        self.clock = clock if clock is not None else REAL_CLOCK
+        self.second, self.used = None, 0
+
+    def put(self, data: bytes, key: str) -> None:
+        second = int(self.clock.time())
+        if second != self.second:
+            self.second, self.used = second, 0
+        if self.used >= self.capacity:
+            self.stats["throttled"] += 1
+            self.stats["dropped"] += 1
+            return
+        self.used += 1
+        super().put(data, key)
+
+class LoggingSink:
+    """Logs every record at INFO, like the devices' TEST mode but after encoding."""
+
+    def __init__(self):
+        self.stats: Dict[str, int] = {"records_sent": 0, "bytes_sent": 0, "dropped": 0}
+
+    def put(self, data: bytes, key: str) -> None:
+        logging.info("Record for %s: %r", key, data)
+        self.stats["records_sent"] += 1
+        self.stats["bytes_sent"] += len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+def _kinesis_sink(endpoint_url: Optional[str] = None):
+    # Imported here so runs without a Kinesis sink do not need boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+    from src.util.kinesis_producer import KinesisProducer
+    from src.util.rate_limiter import ShardRateLimiter
+    from src.util.shard_router import ShardRouter, list_shards
+    from src.util.sim_functions import STREAM_NAME, get_kinesis_client
+    client = get_kinesis_client(endpoint_url=endpoint_url or None)
+    try:
+        shards = list_shards(client, STREAM_NAME)
+    except (BotoCoreError, ClientError) as e:
+        logging.warning("Cannot list the shards of %s, sending without routing or rate limits: %s", STREAM_NAME, e)
+        return KinesisProducer(client=client)
+    return KinesisProducer(client=client, router=ShardRouter(shards), limiter=ShardRateLimiter(shards))
+
+def _udp_sink(address: Optional[str] = None) -> UdpSink:
+    host, _, port = (address or "127.0.0.1:9999").rpartition(":")
+    return UdpSink(host or "127.0.0.1", int(port))
+
+# Sink name -> factory taking the optional argument after the first ":" of the spec
+SINKS: Dict[str, Callable[[Optional[str]], object]] = {
+    "kinesis": _kinesis_sink,
+    "file": lambda path: FileSink(path or "records.ndjson"),
+    "stdout": lambda _: StdoutSink(),
+    "memory": lambda capacity: MemorySink(int(capacity) if capacity else MEMORY_CAPACITY),
+    "udp": _udp_sink,
+    "log": lambda _: LoggingSink(),
+    "null": lambda _: NullSink(),
+    "state": state_sink,
+}
+
+def get_sink(spec: str):
+    """Builds a sink from a spec such as "kinesis", "kinesis:http://localhost:4567",
+    "file:out.ndjson", "stdout", "memory:10000", "udp:127.0.0.1:9999", "log", "null" or
+    "state:dynamodb:TABLE" (src.util.state_store).
+
+    Raises:
+        ValueError: If the sink name is unknown.
+    """
+    name, _, argument = spec.partition(":")
+    try:
+        factory = SINKS[name]
+    except KeyError:
+        raise ValueError(f"Unknown sink {name!r}, expected one of {sorted(SINKS)}") from None
+    return factory(argument or None)
@@ -0,0 +1,237 @@
+import math
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.util.sim_functions import DEGREES_PER_KM
+
+# Constants
+NAIROBI_LAT_RANGE = (-1.307963, -1.282735)  # The square random_coordinates() places devices in
+NAIROBI_LON_RANGE = (36.808427, 36.844133)
+CELL_METERS = 10.0  # Grid cell edge; ~10 devices per cell at 1M devices over the square
+
+def meters_to_degrees(meters: float) -> float:
+    """Degrees spanned by `meters`, with the simulators' flat Nairobi scale (DEGREES_PER_KM on both axes)."""
+    return meters / 1000 * DEGREES_PER_KM
+
+def degrees_to_meters(degrees: float) -> float:
+    return degrees / DEGREES_PER_KM * 1000
+
+class GridIndex:
+    """Uniform grid over (lat, lon) that keeps keys bucketed by the cell of their current location.
+
+    Each cell maps key -> the location list itself, so a device that moves
+    in place (advance_location) is always queried at its current position;
+    update() only has to move a key when it crosses into another cell,
+    which costs two divisions and a dict lookup otherwise. Cells are created
+    on demand, so devices that wander off the Nairobi square stay indexed.
+
+    Radius queries take whole cells that lie inside the circle by their
+    size and only check the keys of the cells on its edge, so their cost
+    grows with the circle's perimeter in cells rather than with the fleet.
+
+    Args:
+        cell_m: Cell edge in meters.
+        origin: (lat, lon) of the corner of cell (0, 0).
+    """
+
+    def __init__(self, cell_m: float = CELL_METERS,
+                 origin: Tuple[float, float] = (NAIROBI_LAT_RANGE[0], NAIROBI_LON_RANGE[0])):
+        self.cell_m = cell_m
+        self.cell_deg = meters_to_degrees(cell_m)
+        self.origin = origin
+        self.cells: Dict[Tuple[int, int], Dict[str, List[float]]] = {}
+        self._cell_of: Dict[str, Tuple[int, int]] = {}
+        # Rows and columns ever occupied (grown, never shrunk); bounds the rings nearest() may search
+        self.extent = [0, -1, 0, -1]
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._cell_of
+
+    def cell(self, lat: float, lon: float) -> Tuple[float, float]:
+        """(row, column) of the cell holding (lat, lon), as whole floats (floor division, as update() keys them)."""
+        return (lat - self.origin[0]) // self.cell_deg, (lon - self.origin[1]) // self.cell_deg
+
+    def update(self, key: str, location: List[float]) -> None:
+        """Inserts `key` or moves it to the cell of `location` ([lat, lon, alt], kept by reference)."""
+        size = self.cell_deg
+        cell = ((location[0] - self.origin[0]) // size, (location[1] - self.origin[1]) // size)
+        old = self._cell_of.get(key)
+        if old == cell:
+            return
+        if old is not None:
+            bucket = self.cells[old]
+            del bucket[key]
+            if not bucket:
+                del self.cells[old]
+        self._cell_of[key] = cell
+        bucket = self.cells.get(cell)
+        if bucket is None:
+            bucket = self.cells[cell] = {}
+            extent = self.extent
+            if extent[0] > extent[1]:
+                extent[:] = [cell[0], cell[0], cell[1], cell[1]]
+            else:
+                extent[:] = [min(extent[0], cell[0]), max(extent[1], cell[0]),
+                             min(extent[2], cell[1]), max(extent[3], cell[1])]
+        bucket[key] = location
+
+    def remove(self, key: str) -> None:
+        cell = self._cell_of.pop(key)
+        bucket = self.cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self.cells[cell]
+
+    def _rows(self, lat: float, lon: float, radius_deg: float) -> Iterable[Tuple[int, int, int, int, int]]:
+        """Per grid row touching the circle: (row, first, last) of the columns it touches and
+        (inner_first, inner_last) of the columns lying wholly inside it (empty when first > last)."""
+        origin_lat, origin_lon = self.origin
+        size = self.cell_deg
+        y = (lat - origin_lat) / size
+        x = (lon - origin_lon) / size
+        r = radius_deg / size
+        for row in range(math.floor(y - r), math.floor(y + r) + 1):
+            near = max(0.0, row - y, y - (row + 1))  # Closest and farthest vertical distance to the row
+            far = max(abs(row - y), abs(row + 1 - y))
+            reach = math.sqrt(max(0.0, r * r - near * near))
+            first, last = math.floor(x - reach), math.floor(x + reach)
+            if far <= r:
+                inner = math.sqrt(r * r - far * far)
+                inner_first, inner_last = math.ceil(x - inner), math.floor(x + inner) - 1
+            else:
+                inner_first, inner_last = 0, -1
+            yield row, first, last, inner_first, inner_last
+
+    def within(self, lat: float, lon: float, radius_m: float) -> List[str]:
+        """Keys within `radius_m` meters of (lat, lon)."""
+        radius_deg = meters_to_degrees(radius_m)
+        r2 = radius_deg * radius_deg
+        cells = self.cells
+        found = []
+        for row, first, last, inner_first, inner_last in self._rows(lat, lon, radius_deg):
+            for column in range(first, last + 1):
+                bucket = cells.get((row, column))
+                if not bucket:
+                    continue
+                if inner_first <= column <= inner_last:
+                    found.extend(bucket)
+                else:
+                    found.extend(key for key, loc in bucket.items()
+                                 if (loc[0] - lat) ** 2 + (loc[1] - lon) ** 2 <= r2)
+        return found
+
+    def count_within(self, lat: float, lon: float, radius_m: float) -> int:
+        """Number of keys within `radius_m` meters of (lat, lon), without listing them."""
+        radius_deg = meters_to_degrees(radius_m)
+        r2 = radius_deg * radius_deg
+        cells = self.cells
+        count = 0
+        for row, first, last, inner_first, inner_last in self._rows(lat, lon, radius_deg):
+            for column in range(first, last + 1):
+                bucket = cells.get((row, column))
+                if not bucket:
+                    continue
+                if inner_first <= column <= inner_last:
+                    count += len(bucket)
+                else:
+                    for loc in bucket.values():
+                        if (loc[0] - lat) ** 2 + (loc[1] - lon) ** 2 <= r2:
+                            count += 1
+        return count
+
+    def nearest(self, lat: float, lon: float, k: int = 1, max_m: Optional[float] = None) -> List[Tuple[float, str]]:
+        """Up to `k` (meters, key) pairs closest to (lat, lon), nearest first.
+
+        Searches rings of cells outwards from the point's cell and stops once
+        the next ring cannot hold anything closer than the k-th hit (or lies
+        beyond `max_m`). No key is returned for k < 1.
+        """
+        if not self._cell_of or k < 1:
+            return []
+        row0, column0 = (int(index) for index in self.cell(lat, lon))
+        best: List[Tuple[float, str]] = []  # Max-heap of the k closest as (-distance², key)
+        limit = meters_to_degrees(max_m) ** 2 if max_m is not None else math.inf
+        # Every occupied cell is reached by the ring at its Chebyshev distance from the start
+        first_row, last_row, first_column, last_column = self.extent
+        rings = int(max(row0 - first_row, last_row - row0, column0 - first_column, last_column - column0, 0))
+        for ring in range(rings + 1):
+            # A key in this ring is at least (ring - 1) cells away from the point
+            gap = max(0, ring - 1) * self.cell_deg
+            if gap * gap > limit or (len(best) == k and gap * gap > -best[0][0]):
+                break
+            for cell in self._ring(row0, column0, ring):
+                bucket = self.cells.get(cell)
+                if not bucket:
+                    continue
+                for key, loc in bucket.items():
+                    d2 = (loc[0] - lat) ** 2 + (loc[1] - lon) ** 2
+                    if d2 > limit:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, key))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, key))
+        return [(degrees_to_meters(math.sqrt(-d2)), key) for d2, key in sorted(best, reverse=True)]
+
+    @staticmethod
+    def _ring(row: int, column: int, ring: int) -> Iterable[Tuple[int, int]]:
+        if ring == 0:
+            yield row, column
+            return
+        for c in range(column - ring, column + ring + 1):
+            yield row - ring, c
+            yield row + ring, c
+        for r in range(row - ring + 1, row + ring):
+            yield r, column - ring
+            yield r, column + ring
+
+class FleetIndex:
+    """One GridIndex per device type, keyed by deviceId, so per-type queries never see other types.
+
+    Devices built with spatial_index=FleetIndex() call update() from their
+    update_location, keeping the index current as the fleet moves.
+    """
+
+    def __init__(self, cell_m: float = CELL_METERS):
+        self.cell_m = cell_m
+        self.grids: Dict[str, GridIndex] = {}
+
+    def __len__(self) -> int:
+        return sum(len(grid) for grid in self.grids.values())
+
+    def grid(self, device_type: str) -> GridIndex:
+        grid = self.grids.get(device_type)
+        if grid is None:
+            grid = self.grids[device_type] = GridIndex(self.cell_m)
+        return grid
+
+    def update(self, device_id: str, location: List[float]) -> None:
+        self.grid(device_id.split("-", 1)[0]).update(device_id, location)
+
+    def remove(self, device_id: str) -> None:
+        self.grids[device_id.split("-", 1)[0]].remove(device_id)
+
+    def _selected(self, types: Optional[Iterable[str]]) -> List[GridIndex]:
+        if types is None:
+            return list(self.grids.values())
+        return [self.grids[name] for name in types if name in self.grids]
+
+    def within(self, lat: float, lon: float, radius_m: float, types: Optional[Iterable[str]] = None) -> List[str]:
+        """deviceIds within `radius_m` meters, of the given types (e.g. ["phone"]) or all."""
+        return [key for grid in self._selected(types) for key in grid.within(lat, lon, radius_m)]
+
+    def count_within(self, lat: float, lon: float, radius_m: float, types: Optional[Iterable[str]] = None) -> int:
+        return sum(grid.count_within(lat, lon, radius_m) for grid in self._selected(types))
+
+    def density(self, lat: float, lon: float, radius_m: float, types: Optional[Iterable[str]] = None) -> float:
+        """Devices per km² within `radius_m` meters of (lat, lon)."""
+        return self.count_within(lat, lon, radius_m, types) / (math.pi * (radius_m / 1000) ** 2)
+
+    def nearest(self, lat: float, lon: float, k: int = 1, types: Optional[Iterable[str]] = None,
+                max_m: Optional[float] = None) -> List[Tuple[float, str]]:
+        """Up to `k` (meters, deviceId) pairs closest to (lat, lon) among the given types, nearest first."""
+        hits = [hit for grid in self._selected(types) for hit in grid.nearest(lat, lon, k, max_m)]
+        return sorted(hits)[:k]
@@ -0,0 +1,330 @@
+import os
+import json
+import math
+import time
+import logging
+import threading
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.util.encoders import BINARY_RECORD, decode_binary
+from src.util.sim_functions import REGION_NAME
+
+# Constants
+FLUSH_WINDOW = 60.0  # Seconds of ping timestamps coalesced into one write per device (DEFAULT_DELAY)
+BATCH_ITEMS = 25  # BatchWriteItem limit
+WRITE_UNIT_BYTES = 1024  # One DynamoDB write unit per started KB of item
+MAX_ATTEMPTS = 5  # BatchWriteItem attempts of one batch's unprocessed items before the flush gives up on them
+RETRY_BACKOFF = 0.05  # Seconds, doubled on every retry of unprocessed items
+STATE_TABLE = "nairobi-device-state"
+KEY = "deviceId"
+PASSIVE_FIELDS = ("timestamp",)  # Written along with a change but never a change on their own
+
+# (delta, full item) of one device, both keyed by deviceId
+Change = Tuple[Dict[str, object], Dict[str, object]]
+
+def decode_record(data: bytes) -> Dict[str, object]:
+    """Payload dict of one device record in any wire format of src.util.encoders.
+
+    Raises:
+        ValueError: If the record is neither JSON nor a binary record.
+    """
+    if data[:1] == b"{":
+        return json.loads(data)
+    if len(data) == BINARY_RECORD.size:
+        return decode_binary(data)
+    raise ValueError(f"Not a device record ({len(data)} bytes)")
+
+def _attribute_bytes(value: object) -> int:
+    # DynamoDB item size rules: strings by UTF-8 length, numbers ~1 byte per 2 digits + 1, lists 3 + 1 per element
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        return len(repr(value).lstrip("-").replace(".", "")) // 2 + 1
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(1 + _attribute_bytes(element) for element in value)
+    raise TypeError(f"Unsupported attribute value {value!r}")
+
+def item_bytes(item: Dict[str, object]) -> int:
+    """Size of `item` as DynamoDB bills it: attribute names plus values."""
+    return sum(len(name.encode("utf-8")) + _attribute_bytes(value) for name, value in item.items())
+
+def write_units(item: Dict[str, object]) -> int:
+    return max(1, math.ceil(item_bytes(item) / WRITE_UNIT_BYTES))
+
+class MemoryTable:
+    """Items in a dict; the stand-in for a DynamoDB table in tests and benchmarks."""
+
+    def __init__(self):
+        self.items: Dict[str, Dict[str, object]] = {}
+
+    def write_batch(self, changes: List[Change]) -> List[Change]:
+        """Applies (delta, item) changes, both keyed by deviceId. Returns the changes not written."""
+        for delta, _ in changes:
+            self.items.setdefault(delta[KEY], {}).update(delta)
+        return []
+
+    def get(self, device_id: str) -> Optional[Dict[str, object]]:
+        return self.items.get(device_id)
+
+    def close(self) -> None:
+        pass
+
+class FileTable(MemoryTable):
+    """MemoryTable persisted as an append-only log of deltas, one JSON object per line.
+
+    Each batch is one O_APPEND write, and opening the file replays it, so a
+    restarted simulator resumes from the last flushed state.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        if os.path.exists(path):
+            with open(path, "rb") as log:
+                for line in log:
+                    if line.strip():
+                        delta = json.loads(line)
+                        self.items.setdefault(delta[KEY], {}).update(delta)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def write_batch(self, changes: List[Change]) -> List[Change]:
+        os.write(self._fd, b"".join(json.dumps(delta).encode("utf-8") + b"\n" for delta, _ in changes))
+        return super().write_batch(changes)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+def _to_dynamo(value: object) -> Dict[str, object]:
+    if isinstance(value, str):
+        return {"S": value}
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if isinstance(value, (int, float, Decimal)):
+        return {"N": repr(value) if isinstance(value, float) else str(value)}
+    if isinstance(value, (list, tuple)):
+        return {"L": [_to_dynamo(element) for element in value]}
+    raise TypeError(f"Unsupported attribute value {value!r}")
+
+def _from_dynamo(value: Dict[str, object]) -> object:
+    (kind, inner), = value.items()
+    if kind == "N":
+        return float(inner) if any(c in inner for c in ".eE") else int(inner)
+    if kind == "L":
+        return [_from_dynamo(element) for element in inner]
+    return inner
+
+class DynamoTable:
+    """Writes device state to a DynamoDB table (partition key "deviceId") in BatchWriteItem calls.
+
+    BatchWriteItem only takes whole items, so every changed device is put with
+    its full last-known state; the deltas decide which devices are written.
+    Unprocessed items are retried with a doubling backoff.
+
+    Args:
+        table: Table name.
+        client: boto3 DynamoDB client; a new one for REGION_NAME (or `endpoint_url`) by default.
+        max_attempts: Attempts of a batch's unprocessed items before they are given up on.
+    """
+
+    def __init__(self, table: str = STATE_TABLE, client=None, endpoint_url: Optional[str] = None,
+                 max_attempts: int = MAX_ATTEMPTS):
+        if client is None:
+            # Imported here so the memory and file tables do not need boto3
+            import boto3
+            client = boto3.client("dynamodb", region_name=REGION_NAME, endpoint_url=endpoint_url)
+        self.table = table
+        self.client = client
+        self.max_attempts = max_attempts
+
+    def write_batch(self, changes: List[Change]) -> List[Change]:
+        from botocore.exceptions import BotoCoreError, ClientError
+        by_device = {delta[KEY]: (delta, item) for delta, item in changes}
+        requests = [{"PutRequest": {"Item": {name: _to_dynamo(value) for name, value in item.items()}}}
+                    for _, item in changes]
+        backoff = RETRY_BACKOFF
+        for attempt in range(self.max_attempts):
+            try:
+                response = self.client.batch_write_item(RequestItems={self.table: requests})
+            except (BotoCoreError, ClientError) as e:
+                logging.warning("BatchWriteItem of %d items to %s failed: %s", len(requests), self.table, e)
+                break
+            requests = response.get("UnprocessedItems", {}).get(self.table, [])
+            if not requests:
+                return []
+            if attempt + 1 < self.max_attempts:
+                time.sleep(backoff)
+                backoff *= 2
+        else:
+            logging.warning("Giving up on %d unprocessed items of %s for now", len(requests), self.table)
+        return [by_device[request["PutRequest"]["Item"][KEY]["S"]] for request in requests]
+
+    def get(self, device_id: str) -> Optional[Dict[str, object]]:
+        item = self.client.get_item(TableName=self.table, Key={KEY: {"S": device_id}}).get("Item")
+        return {name: _from_dynamo(value) for name, value in item.items()} if item else None
+
+    def close(self) -> None:
+        pass
+
+class StateStore:
+    """Last-known state of every device, written to a table as coalesced deltas.
+
+    record() merges a ping into the device's pending change: only attributes
+    that differ from the last written state are kept, and a device pinging
+    several times within one flush window is written once. flush() sends the
+    pending changes in batches of BATCH_ITEMS. Windows follow the pings' own
+    timestamps, so a VirtualClock run coalesces in simulated time.
+
+    A change only counts as written once the table took it: changes the
+    table failed to write go back to `pending` and are sent again with the
+    next flush. Table calls run outside the lock, so pings recorded during a
+    slow write or its backoff are not held up; they are compared with the
+    state being written (`flushing`), and one flush runs at a time.
+
+    Args:
+        table: MemoryTable, FileTable or DynamoTable.
+        window: Seconds of ping timestamps coalesced before a flush; 0 writes every ping's changes at once.
+        batch_items: Items per write_batch call (at most 25 for DynamoDB).
+    """
+
+    def __init__(self, table=None, window: float = FLUSH_WINDOW, batch_items: int = BATCH_ITEMS):
+        if batch_items < 1:
+            raise ValueError(f"batch_items must be at least 1, got {batch_items}")
+        self.table = table if table is not None else MemoryTable()
+        self.window = window
+        self.batch_items = batch_items
+        self.written: Dict[str, Dict[str, object]] = {}  # deviceId -> state as last written
+        self.pending: Dict[str, Dict[str, object]] = {}  # deviceId -> changed attributes not yet written
+        self.flushing: Dict[str, Dict[str, object]] = {}  # deviceId -> changed attributes being written
+        self.window_start: Optional[float] = None
+        # "failed": items a table write failed on, kept pending for the next flush
+        self.stats: Dict[str, int] = {"pings": 0, "coalesced": 0, "unchanged": 0, "items_written": 0,
+                                      "batches": 0, "write_units": 0, "delta_bytes": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def record(self, payload: Dict[str, object]) -> None:
+        """Merges one ping payload (as the devices send it) into the pending changes."""
+        with self._lock:
+            self.stats["pings"] += 1
+            device_id = payload[KEY]
+            timestamp = payload.get("timestamp")
+            if self.window_start is None:
+                self.window_start = timestamp
+            written = self.written.get(device_id, {})
+            if device_id in self.flushing:
+                written = dict(written, **self.flushing[device_id])
+            pending = self.pending.get(device_id)
+            changed = {name: value for name, value in payload.items()
+                       if name != KEY and name not in PASSIVE_FIELDS and written.get(name) != value}
+            if pending is not None:
+                self.stats["coalesced"] += 1
+                pending.update(changed)
+                pending.update((name, payload[name]) for name in PASSIVE_FIELDS if name in payload)
+            elif changed:
+                changed.update((name, payload[name]) for name in PASSIVE_FIELDS if name in payload)
+                self.pending[device_id] = changed
+            else:
+                self.stats["unchanged"] += 1
+            due = timestamp is not None and timestamp - self.window_start >= self.window
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes every pending change, in batches of `batch_items`; failed ones stay pending."""
+        with self._flush_lock:
+            with self._lock:
+                self.flushing, self.pending = self.pending, {}
+                self.window_start = None
+                changes = [(dict(delta, **{KEY: device_id}), dict(self.written.get(device_id, {KEY: device_id}),
+                                                                   **delta))
+                           for device_id, delta in self.flushing.items()]
+            for start in range(0, len(changes), self.batch_items):
+                batch = changes[start:start + self.batch_items]
+                failed = self.table.write_batch(batch)
+                failed_ids = {delta[KEY] for delta, _ in failed}
+                done = [change for change in batch if change[0][KEY] not in failed_ids]
+                with self._lock:
+                    for delta, item in done:
+                        self.written[item[KEY]] = item
+                        del self.flushing[item[KEY]]
+                    for delta, _ in failed:
+                        # Changes recorded since are newer than the failed ones
+                        device_id = delta.pop(KEY)
+                        self.pending[device_id] = dict(delta, **self.pending.get(device_id, {}))
+                        del self.flushing[device_id]
+                    self.stats["batches"] += 1
+                    self.stats["items_written"] += len(done)
+                    self.stats["failed"] += len(failed)
+                    self.stats["write_units"] += sum(write_units(item) for _, item in done)
+                    self.stats["delta_bytes"] += sum(item_bytes(delta) for delta, _ in done)
+
+    def get(self, device_id: str) -> Optional[Dict[str, object]]:
+        """Last-known state of a device, including changes not flushed yet."""
+        with self._lock:
+            state = self.written.get(device_id)
+            changes = [self.flushing.get(device_id), self.pending.get(device_id)]
+        if state is None and changes == [None, None]:
+            return self.table.get(device_id)
+        state = dict(state or {KEY: device_id})
+        for delta in changes:
+            state.update(delta or {})
+        return state
+
+    def write_units_per_1k_pings(self) -> float:
+        return self.stats["write_units"] * 1000 / max(1, self.stats["pings"])
+
+    def close(self) -> None:
+        self.flush()
+        if self.pending:
+            logging.warning("Closing with %d device states not written", len(self.pending))
+        self.table.close()
+
+class StateSink:
+    """Sink that tracks device state instead of shipping records: decodes every record into a StateStore.
+
+    Undecodable records are counted as dropped.
+    """
+
+    def __init__(self, store: StateStore):
+        self.store = store
+        self.stats: Dict[str, int] = {"records_sent": 0, "bytes_sent": 0, "dropped": 0}
+
+    def put(self, data: bytes, key: str) -> None:
+        try:
+            payload = decode_record(data)
+        except ValueError as e:
+            self.stats["dropped"] += 1
+            logging.warning("Not tracking the state of record for %s: %s", key, e)
+            return
+        self.store.record(payload)
+        self.stats["records_sent"] += 1
+        self.stats["bytes_sent"] += len(data)
+
+    def flush(self) -> None:
+        self.store.flush()
+
+    def close(self) -> None:
+        self.store.close()
+
+# Table name -> factory taking the optional argument after its ":" in a state sink spec
+TABLES: Dict[str, Callable[[Optional[str]], object]] = {
+    "memory": lambda _: MemoryTable(),
+    "file": lambda path: FileTable(path or "device-state.ndjson"),
+    "dynamodb": lambda table: DynamoTable(table or STATE_TABLE),
+}
+
+def state_sink(spec: Optional[str] = None) -> StateSink:
+    """Builds a StateSink from a table spec such as "memory", "file:state.ndjson" or "dynamodb:TABLE".
+
+    Raises:
+        ValueError: If the table kind is unknown.
+    """
+    name, _, argument = (spec or "memory").partition(":")
+    try:
+        factory = TABLES[name]
+    except KeyError:
+        raise ValueError(f"Unknown state table {name!r}, expected one of {sorted(TABLES)}") from None
+    return StateSink(StateStore(factory(argument or None)))
@@ -0,0 +1,387 @@
+import os
+import time
+import queue
+import base64
+import logging
+import argparse
+import importlib
+import multiprocessing
+from typing import Callable, Dict, List, Optional, Union
+
+from src.util.metrics import REGISTRY
+from src.util.scheduler import LatenessStats
+
+# Constants
+STREAM_NAME = "nairobi-stream"
+BATCH_SIZE = 100  # Records per handler call, Lambda's default for Kinesis
+FETCH_LIMIT = 1000  # Records per GetRecords call
+BATCHING_WINDOW = 0.0  # Seconds to wait for a full batch, Lambda's MaximumBatchingWindowInSeconds
+MAX_RETRIES = 3  # Handler retries of one batch before it is skipped
+POLL_INTERVAL = 0.2  # Seconds between GetRecords calls on a shard that returned nothing
+LAG_BUCKET = 0.01  # Lag histogram resolution (seconds)
+LAG_BUCKETS = 6000  # 60 s of lag, more lands in the last bucket
+DEFAULT_CHECKPOINT_DIR = "checkpoints"
+REPORT_POLL = 1.0  # Seconds between liveness checks of workers that have not reported yet
+# Errors after which a shard re-reads from its checkpoint or backs off instead of failing
+EXPIRED_ITERATOR = "ExpiredIteratorException"
+THROTTLED = "ProvisionedThroughputExceededException"
+
+logging.basicConfig(level=logging.INFO)
+
+RECORDS = REGISTRY.counter("nairobi_processor_records_total", "Records handed to the stream handler")
+BATCHES = REGISTRY.counter("nairobi_processor_batches_total", "Batches handed to the stream handler")
+HANDLER_ERRORS = REGISTRY.counter("nairobi_processor_handler_errors_total", "Batches the handler failed")
+SKIPPED = REGISTRY.counter("nairobi_processor_skipped_total", "Records skipped after MAX_RETRIES failed attempts")
+
+Handler = Callable[[Dict[str, object], object], object]
+
+def load_handler(spec: Union[str, Handler]) -> Handler:
+    """Resolves a Lambda-style "module:function" handler spec; callables pass through.
+
+    Raises:
+        ValueError: If the spec is not "module:function".
+    """
+    if callable(spec):
+        return spec
+    module, _, function = spec.partition(":")
+    if not module or not function:
+        raise ValueError(f"Handler {spec!r} is not of the form module:function")
+    return getattr(importlib.import_module(module), function)
+
+def _error_code(error: Exception) -> Optional[str]:
+    """The Kinesis error code of a botocore ClientError or a stand-in KinesisError."""
+    return getattr(error, "code", None) or getattr(error, "response", {}).get("Error", {}).get("Code")
+
+def _arrival(record: Dict[str, object]) -> float:
+    # boto3 parses the timestamp into a datetime, the in-process client leaves it a float
+    arrival = record["ApproximateArrivalTimestamp"]
+    return arrival.timestamp() if hasattr(arrival, "timestamp") else float(arrival)
+
+class MemoryCheckpointer:
+    """Shard id -> last processed sequence number, kept in memory (one process only)."""
+
+    def __init__(self):
+        self.sequences: Dict[str, str] = {}
+
+    def get(self, shard_id: str) -> Optional[str]:
+        return self.sequences.get(shard_id)
+
+    def set(self, shard_id: str, sequence: str) -> None:
+        self.sequences[shard_id] = sequence
+
+class FileCheckpointer:
+    """One file per shard under `directory`, holding the shard's last processed sequence number.
+
+    Every shard is read by a single worker, so workers in different
+    processes never write the same file; each write is a rename of a
+    complete temporary file, so a crash leaves the previous checkpoint.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CHECKPOINT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, shard_id: str) -> str:
+        return os.path.join(self.directory, shard_id)
+
+    def get(self, shard_id: str) -> Optional[str]:
+        try:
+            with open(self._path(shard_id)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set(self, shard_id: str, sequence: str) -> None:
+        temporary = self._path(shard_id) + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(sequence)
+        os.replace(temporary, self._path(shard_id))
+
+def kinesis_event(records: List[Dict[str, object]], shard_id: str, stream: str) -> Dict[str, object]:
+    """GetRecords records in the event shape Lambda hands a Kinesis-triggered function."""
+    return {"Records": [{
+        "kinesis": {
+            "kinesisSchemaVersion": "1.0",
+            "partitionKey": record["PartitionKey"],
+            "sequenceNumber": record["SequenceNumber"],
+            "data": base64.b64encode(record["Data"]).decode("ascii"),
+            "approximateArrivalTimestamp": _arrival(record),
+        },
+        "eventSource": "aws:kinesis",
+        "eventVersion": "1.0",
+        "eventID": f"{shard_id}:{record['SequenceNumber']}",
+        "eventName": "aws:kinesis:record",
+        "eventSourceARN": f"arn:aws:kinesis:local:000000000000:stream/{stream}",
+    } for record in records]}
+
+class ShardConsumer:
+    """Reads one shard in order and hands its records to `handler` in batches, like Lambda does.
+
+    The handler is called as handler(event, None) with Lambda's Kinesis event,
+    so a function written for Lambda runs unchanged. After a batch succeeds its
+    last sequence number is checkpointed, and a restarted consumer resumes
+    after it. A handler may return {"batchItemFailures": [{"itemIdentifier":
+    <sequence number>}]} (ReportBatchItemFailures): the batch is then
+    checkpointed up to the first failure and retried from there. A batch
+    that raises or keeps failing is retried `max_retries` times, then skipped.
+
+    Args:
+        client: boto3 Kinesis client, or a LocalKinesis.client().
+        stream: Stream name.
+        shard_id: The shard to read.
+        handler: Lambda-style handler(event, context).
+        checkpointer: Stores the last processed sequence number per shard.
+        batch_size: Maximum records per handler call.
+        batching_window: Seconds to wait for `batch_size` records before calling the handler anyway.
+        max_retries: Retries of a failing batch before it is skipped.
+        start: Where a shard without a checkpoint starts, "TRIM_HORIZON" or "LATEST".
+    """
+
+    def __init__(self, client, stream: str, shard_id: str, handler: Handler, checkpointer,
+                 batch_size: int = BATCH_SIZE, batching_window: float = BATCHING_WINDOW,
+                 max_retries: int = MAX_RETRIES, start: str = "TRIM_HORIZON"):
+        self.client = client
+        self.stream = stream
+        self.shard_id = shard_id
+        self.handler = handler
+        self.checkpointer = checkpointer
+        self.batch_size = batch_size
+        self.batching_window = batching_window
+        self.max_retries = max_retries
+        self.start = start
+        self.stats: Dict[str, int] = {"records": 0, "batches": 0, "errors": 0, "skipped": 0}
+        self.lag = LatenessStats(LAG_BUCKET, LAG_BUCKETS)  # Arrival in the stream -> handler done
+        self.millis_behind = 0
+        self._buffer: List[Dict[str, object]] = []
+        self._first_buffered = 0.0
+        self._attempts = 0
+        self.closed = False  # The shard was closed by a reshard and has been read to its end
+        self.next_fetch = 0.0
+        self._iterator: Optional[str] = None
+
+    def _open_iterator(self) -> str:
+        sequence = self.checkpointer.get(self.shard_id)
+        if sequence is None:
+            request = {"ShardIteratorType": self.start}
+        else:
+            request = {"ShardIteratorType": "AFTER_SEQUENCE_NUMBER", "StartingSequenceNumber": sequence}
+        return self.client.get_shard_iterator(StreamName=self.stream, ShardId=self.shard_id,
+                                              **request)["ShardIterator"]
+
+    def _fetch(self, now: float) -> None:
+        if self._iterator is None:
+            self._iterator = self._open_iterator()
+        try:
+            response = self.client.get_records(ShardIterator=self._iterator, Limit=FETCH_LIMIT)
+        except Exception as e:
+            code = _error_code(e)
+            if code == EXPIRED_ITERATOR:
+                self._iterator = None  # Re-read from the checkpoint, which the buffer is already past
+                self._buffer = []
+                return
+            if code == THROTTLED:
+                self.next_fetch = now + POLL_INTERVAL
+                return
+            raise
+        self._iterator = response.get("NextShardIterator")
+        self.closed = self._iterator is None
+        self.millis_behind = response.get("MillisBehindLatest", 0)
+        if response["Records"]:
+            if not self._buffer:
+                self._first_buffered = now
+            self._buffer.extend(response["Records"])
+        else:
+            self.next_fetch = now + POLL_INTERVAL
+
+    def poll(self) -> int:
+        """Fetches if due and runs at most one batch; returns the records handled (0 when idle)."""
+        now = time.monotonic()
+        if len(self._buffer) < self.batch_size and now >= self.next_fetch and not self.closed:
+            self._fetch(now)
+        if not self._buffer:
+            return 0
+        if len(self._buffer) < self.batch_size and now - self._first_buffered < self.batching_window:
+            return 0
+        return self._run_batch(self._buffer[:self.batch_size])
+
+    def _run_batch(self, batch: List[Dict[str, object]]) -> int:
+        failed_at = len(batch)
+        try:
+            response = self.handler(kinesis_event(batch, self.shard_id, self.stream), None)
+        except Exception as e:
+            logging.warning("Handler failed on %d records of %s: %s", len(batch), self.shard_id, e)
+            failed_at = 0
+        else:
+            failures = response.get("batchItemFailures") if isinstance(response, dict) else None
+            if failures:
+                failed = {failure["itemIdentifier"] for failure in failures}
+                # Like Lambda, an identifier outside the batch fails the whole batch
+                failed_at = next((i for i, record in enumerate(batch) if record["SequenceNumber"] in failed), 0)
+        if failed_at == len(batch):
+            self._done(batch)
+            return len(batch)
+        self.stats["errors"] += 1
+        HANDLER_ERRORS.inc()
+        self._done(batch[:failed_at])  # Records before the failure are not retried
+        self._attempts += 1
+        if self._attempts <= self.max_retries:
+            return failed_at
+        skipped = batch[failed_at:]
+        logging.error("Skipping %d records of %s after %d retries", len(skipped), self.shard_id, self.max_retries)
+        self.stats["skipped"] += len(skipped)
+        SKIPPED.inc(len(skipped))
+        self._done(skipped, handled=False)
+        return len(batch)
+
+    def _done(self, records: List[Dict[str, object]], handled: bool = True) -> None:
+        """Drops `records`, the head of the buffer, and checkpoints after them."""
+        if not records:
+            return
+        self._attempts = 0
+        del self._buffer[:len(records)]
+        self._first_buffered = time.monotonic()
+        self.checkpointer.set(self.shard_id, records[-1]["SequenceNumber"])
+        if not handled:
+            return
+        now = time.time()
+        for record in records:
+            self.lag.record(max(0.0, now - _arrival(record)))
+        self.stats["records"] += len(records)
+        self.stats["batches"] += 1
+        RECORDS.inc(len(records))
+        BATCHES.inc()
+
+    @property
+    def caught_up(self) -> bool:
+        """Nothing buffered, and the shard is closed or its last GetRecords came back empty."""
+        return not self._buffer and (self.closed or time.monotonic() < self.next_fetch)
+
+def _summary(consumers: List[ShardConsumer], elapsed: float) -> Dict[str, object]:
+    summary = {key: sum(consumer.stats[key] for consumer in consumers)
+               for key in ("records", "batches", "errors", "skipped")}
+    summary["elapsed"] = elapsed
+    summary["lag"] = LatenessStats(LAG_BUCKET, LAG_BUCKETS)
+    for consumer in consumers:
+        summary["lag"].merge(consumer.lag)
+    return summary
+
+def consume_shards(client, shard_ids: List[str], handler: Union[str, Handler], checkpointer,
+                   stream: str = STREAM_NAME, duration: float = 0.0, until_caught_up: bool = False,
+                   **options) -> Dict[str, object]:
+    """Polls `shard_ids` round-robin in this process until `duration` passes or, with
+    `until_caught_up`, every shard has reached its tip. Options go to ShardConsumer.
+
+    Returns the summed stats of the shards and their lag histogram.
+    """
+    handler = load_handler(handler)
+    consumers = [ShardConsumer(client, stream, shard_id, handler, checkpointer, **options) for shard_id in shard_ids]
+    start = time.monotonic()
+    while not duration or time.monotonic() - start < duration:
+        handled = sum(consumer.poll() for consumer in consumers)
+        if not handled:
+            if until_caught_up and all(consumer.caught_up for consumer in consumers):
+                break
+            time.sleep(min(POLL_INTERVAL, max(0.0, min(c.next_fetch for c in consumers) - time.monotonic())))
+    return _summary(consumers, time.monotonic() - start)
+
+def _new_client(endpoint_url: Optional[str]):
+    """A Kinesis client of its own, not get_kinesis_client()'s cached one.
+
+    A forked worker must not reuse a client (and its open keep-alive
+    connections) the parent or another worker already holds.
+    """
+    # Imported here so in-process consumers do not need boto3
+    import boto3
+    from src.util.sim_functions import REGION_NAME
+    return boto3.client("kinesis", region_name=REGION_NAME, endpoint_url=endpoint_url)
+
+def _process_worker(shard_ids: List[str], handler: Union[str, Handler], stream: str, endpoint_url: Optional[str],
+                    checkpoint_dir: str, duration: float, until_caught_up: bool, options: Dict[str, object],
+                    reports: multiprocessing.Queue) -> None:
+    logging.getLogger().setLevel(logging.WARNING)
+    client = _new_client(endpoint_url)
+    reports.put(consume_shards(client, shard_ids, handler, FileCheckpointer(checkpoint_dir), stream, duration,
+                               until_caught_up, **options))
+
+def aggregate(summaries: List[Dict[str, object]]) -> Dict[str, object]:
+    """Sums worker summaries into records/s and lag percentiles."""
+    lag = LatenessStats(LAG_BUCKET, LAG_BUCKETS)
+    for summary in summaries:
+        lag.merge(summary["lag"])
+    elapsed = max((summary["elapsed"] for summary in summaries), default=0.0) or 1.0
+    records = sum(summary["records"] for summary in summaries)
+    result = {key: sum(summary[key] for summary in summaries) for key in ("records", "batches", "errors", "skipped")}
+    result["elapsed_s"] = round(elapsed, 2)
+    result["records_per_sec"] = round(records / elapsed, 1)
+    lag_summary = lag.summary()
+    for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms"):
+        result["lag_" + key] = lag_summary[key]
+    return result
+
+def run_processor(handler: Union[str, Handler], stream: str = STREAM_NAME, endpoint_url: Optional[str] = None,
+                  processes: Optional[int] = None, checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR,
+                  duration: float = 0.0, until_caught_up: bool = False, client=None,
+                  **options) -> Dict[str, object]:
+    """Consumes every open shard of `stream`, one worker process per shard by default.
+
+    Shard i goes to process i % `processes`. Workers checkpoint under
+    `checkpoint_dir`, so a rerun resumes where the last one stopped.
+    processes=0 polls every shard in this process instead, through `client`
+    if given (e.g. LocalKinesis().client() for an in-process stream).
+    """
+    # Imported here so in-process consumers do not need boto3
+    from src.util.shard_router import list_shards
+    if client is None:
+        client = _new_client(endpoint_url)
+    shard_ids = [shard_id for shard_id, _, _ in list_shards(client, stream)]
+    if processes == 0:
+        return aggregate([consume_shards(client, shard_ids, handler, FileCheckpointer(checkpoint_dir), stream,
+                                         duration, until_caught_up, **options)])
+    processes = min(processes or len(shard_ids), len(shard_ids))
+    reports = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_process_worker, name=f"processor-{i}", daemon=True,
+                                args=(shard_ids[i::processes], handler, stream, endpoint_url, checkpoint_dir,
+                                      duration, until_caught_up, options, reports))
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    logging.info("Consuming %d shards of %s across %d processes", len(shard_ids), stream, processes)
+    summaries = []
+    while len(summaries) < processes:
+        try:
+            summaries.append(reports.get(timeout=REPORT_POLL))
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                logging.error("%d of %d processor workers exited without a report", processes - len(summaries),
+                              processes)
+                break
+    for worker in workers:
+        worker.join()
+    return aggregate(summaries)
+
+def count_records(event: Dict[str, object], context: object) -> None:
+    """Default handler: decodes every record and does nothing else, to measure the runtime itself."""
+    for record in event["Records"]:
+        base64.b64decode(record["kinesis"]["data"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consumes a Kinesis stream shard-parallel with a Lambda-style handler.")
+    parser.add_argument("handler", nargs="?", default="src.util.stream_processor:count_records",
+                        help="module:function called with each batch as a Lambda Kinesis event")
+    parser.add_argument("--stream", default=STREAM_NAME)
+    parser.add_argument("--endpoint-url", help="e.g. http://127.0.0.1:4567 for src.util.kinesis_local")
+    parser.add_argument("--processes", type=int, help="Worker processes (default: one per shard)")
+    parser.add_argument("--checkpoint-dir", default=DEFAULT_CHECKPOINT_DIR)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--batching-window", type=float, default=BATCHING_WINDOW)
+    parser.add_argument("--start", choices=("TRIM_HORIZON", "LATEST"), default="TRIM_HORIZON",
+                        help="Where shards without a checkpoint start")
+    parser.add_argument("--duration", type=float, default=0.0, help="Seconds to run (default: forever)")
+    parser.add_argument("--until-caught-up", action="store_true", help="Stop once every shard reaches its tip")
+    args = parser.parse_args()
+    result = run_processor(args.handler, args.stream, args.endpoint_url, args.processes, args.checkpoint_dir,
+                           args.duration, args.until_caught_up, batch_size=args.batch_size,
+                           batching_window=args.batching_window, start=args.start)
+    logging.info("Processed: %s", result)
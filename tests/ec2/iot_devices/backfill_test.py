@@ -0,0 +1,66 @@
+import os
+import gzip
+import json
+import numpy as np
+from src.util.clock import VirtualClock
+from src.util.encoders import TemplateJsonEncoder
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet, fleet_specs
+from src.ec2.iot_devices.fleet_arrays import PhoneArrays, CarArrays, DroneArrays
+from src.ec2.iot_devices.backfill import backfill_arrays, backfill_objects
+
+START = 1704151800  # 2024-01-01 23:30 UTC
+
+def read_partitions(root):
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            with gzip.open(os.path.join(directory, name), "rt") as f:
+                files[os.path.relpath(os.path.join(directory, name), root)] = f.read().splitlines()
+    return files
+
+def test_ndjson_matches_template_encoder():
+    devices = build_fleet(30, test=True, seed=5)
+    for _ in range(20):
+        for device in devices:
+            device.simulate_step()
+    for cls in (PhoneArrays, CarArrays, DroneArrays):
+        group = [d for d in devices if d.device_id.startswith(cls.prefix)]
+        arrays = cls.from_devices(group)
+        timestamps = START + 7 * np.arange(len(group))
+        lines = b"".join(arrays.ndjson(timestamps, [0, 2, len(group)]))
+        expected = b"".join(TemplateJsonEncoder().encode(d, int(t)) + b"\n" for d, t in zip(group, timestamps))
+        assert lines == expected
+
+def test_backfill_arrays_partitions_by_type_date_and_hour(tmp_path):
+    stats = backfill_arrays(40, START, START + 7200, str(tmp_path), seed=1)
+    files = read_partitions(tmp_path)
+    # Every device pings once a minute for two hours
+    assert stats["records"] == 40 * 120 == sum(len(lines) for lines in files.values())
+    assert "type=phone/date=2024-01-01/hour=23/part-00000.ndjson.gz" in files
+    assert "type=drone/date=2024-01-02/hour=01/part-00000.ndjson.gz" in files
+    assert stats["files"] == len(files) == 9
+    for path, lines in files.items():
+        device_type, date, hour = (part.split("=")[1] for part in path.split(os.sep)[:3])
+        records = [json.loads(line) for line in lines]
+        timestamps = [r["timestamp"] for r in records]
+        assert timestamps == sorted(timestamps)
+        for record in records:
+            assert record["deviceId"].startswith(device_type + "-")
+            assert START <= record["timestamp"] < START + 7200
+        assert (timestamps[0] // 3600) == (timestamps[-1] // 3600)
+
+def test_backfill_objects_writes_what_the_live_fleet_sends(tmp_path):
+    backfill_objects(fleet_specs(12, seed=9), START, START + 600, str(tmp_path), seed=9)
+    written = sorted(line for lines in read_partitions(tmp_path).values() for line in lines)
+
+    sent = []
+    clock = VirtualClock(start=START)
+
+    class ListProducer:
+        def put(self, data, key):
+            sent.append(data.decode("utf-8"))
+
+    devices = build_fleet(12, test=False, producer=ListProducer(), seed=9, clock=clock)
+    FleetRunner(devices, clock=clock).run(duration=600)
+    assert written == sorted(sent)
+    assert len(written) == 12 * 10
@@ -0,0 +1,176 @@
+import json
+import time
+import threading
+import pytest
+from src.util.sinks import MemorySink
+from src.util.kinesis_producer import KinesisProducer
+from src.util.background_sender import BackgroundSender
+from src.ec2.iot_devices.fleet import run_fleet
+
+class FlakySink(MemorySink):
+    """MemorySink whose put() raises for the first `failures` calls."""
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def put(self, data, key):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sink unavailable")
+        super().put(data, key)
+
+class GatedSink(MemorySink):
+    """MemorySink whose put() waits until the test opens the gate."""
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def put(self, data, key):
+        self.gate.wait()
+        super().put(data, key)
+
+def test_failed_records_are_retried_in_the_background():
+    sink = FlakySink(failures=3)
+    sender = BackgroundSender(sink, retry_backoff=0.001)
+    for i in range(5):
+        sender.put(b"%d" % i, f"car-{i}")
+    sender.flush()
+    assert sorted(data for _, data in sink.records) == [b"0", b"1", b"2", b"3", b"4"]
+    assert sender.stats["retried"] >= 3
+    assert sender.stats["dropped"] == 0
+    sender.close()
+
+def test_records_are_dropped_after_max_attempts():
+    sender = BackgroundSender(FlakySink(failures=100), max_attempts=2, retry_backoff=0.001)
+    sender.put(b"{}", "drone-1")
+    sender.close()
+    assert sender.stats["failed"] == 1
+    assert sender.stats["dropped"] == 1
+
+def test_put_does_not_wait_for_a_slow_sink():
+    sink = GatedSink()
+    sender = BackgroundSender(sink, capacity=100)
+    start = time.monotonic()
+    for i in range(50):
+        sender.put(b"{}", f"phone-{i}")
+    assert time.monotonic() - start < 0.5
+    sink.gate.set()
+    sender.close()
+    assert sink.stats["records_sent"] == 50
+
+def test_drop_oldest_keeps_the_newest_records():
+    sink = GatedSink()
+    sender = BackgroundSender(sink, capacity=2, overflow="drop-oldest")
+    sender.put(b"first", "car-1")  # Taken by the worker, which then blocks on the gate
+    while sender.queue_depth:
+        time.sleep(0.001)
+    for data in (b"a", b"b", b"c", b"d"):
+        sender.put(data, "car-1")
+    sink.gate.set()
+    sender.close()
+    assert [data for _, data in sink.records] == [b"first", b"c", b"d"]
+    assert sender.stats["overflow_dropped"] == 2
+    assert sender.stats["dropped"] == 2
+
+def test_spill_keeps_every_record_in_order(tmp_path):
+    sink = GatedSink()
+    spill = tmp_path / "spill.bin"
+    sender = BackgroundSender(sink, capacity=3, overflow="spill", spill_path=str(spill))
+    for i in range(20):
+        sender.put(b"%d" % i, f"phone-{i}")
+    assert sender.stats["spilled"] > 0
+    sink.gate.set()
+    sender.close()
+    assert [data for _, data in sink.records] == [b"%d" % i for i in range(20)]
+    assert [key for key, _ in sink.records] == [f"phone-{i}" for i in range(20)]
+    assert not spill.exists()
+
+def test_block_waits_for_room():
+    sink = GatedSink()
+    sender = BackgroundSender(sink, capacity=1, overflow="block")
+    sender.put(b"1", "car-1")
+    while sender.queue_depth:
+        time.sleep(0.001)
+    sender.put(b"2", "car-1")
+    blocked = threading.Thread(target=sender.put, args=(b"3", "car-1"))
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+    sink.gate.set()
+    blocked.join(2)
+    assert not blocked.is_alive()
+    sender.close()
+    assert [data for _, data in sink.records] == [b"1", b"2", b"3"]
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError, match="overflow"):
+        BackgroundSender(MemorySink(), overflow="explode")
+
+class ThrottleFirstRecord:
+    """put_records that throttles the first record of the first call."""
+    def __init__(self):
+        self.calls = 0
+        self.sent = []
+
+    def put_records(self, StreamName, Records):
+        self.calls += 1
+        results = []
+        for i, record in enumerate(Records):
+            if self.calls == 1 and i == 0:
+                results.append({"ErrorCode": "ProvisionedThroughputExceededException"})
+            else:
+                self.sent.append(record["Data"])
+                results.append({"SequenceNumber": "1"})
+        return {"Records": results, "FailedRecordCount": int(self.calls == 1)}
+
+def test_producer_failures_go_to_the_retry_queue():
+    client = ThrottleFirstRecord()
+    producer = KinesisProducer(client=client, linger=60)
+    assert producer.send_once([(b"a", "car-1"), (b"b", "car-2")]) == [0]
+    sender = BackgroundSender(KinesisProducer(client=ThrottleFirstRecord(), linger=60), retry_backoff=0.001)
+    for data in (b"a", b"b", b"c"):
+        sender.put(data, "car-1")
+    sender.close()
+    assert sorted(sender.sink.client.sent) == [b"a", b"b", b"c"]
+    assert sender.stats["records_sent"] == 3
+    assert sender.stats["retried"] == 1
+
+def test_run_fleet_with_a_background_sender(tmp_path):
+    path = tmp_path / "fleet.ndjson"
+    assert run_fleet(10, steps=2, delay=0.01, test=False, sink=f"file:{path}",
+                     background={"capacity": 5, "overflow": "spill"}) == 20
+    assert len([json.loads(line) for line in path.read_text().splitlines()]) == 20
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError, match="capacity"):
+        BackgroundSender(MemorySink(), capacity=0)
+
+class SmallBatches:
+    """send_once sink with a 12-byte batch limit that fails every record of its first two calls."""
+    max_bytes = 12
+
+    def __init__(self):
+        self.batches = []
+        self.stats = {"records_sent": 0, "bytes_sent": 0, "dropped": 0}
+
+    def send_once(self, batch):
+        self.batches.append(batch)
+        if len(self.batches) <= 2:
+            return list(range(len(batch)))
+        self.stats["records_sent"] += len(batch)
+        return []
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_retried_records_respect_the_batch_byte_limit():
+    sink = SmallBatches()
+    sender = BackgroundSender(sink, retry_backoff=0.05)
+    for i in range(4):
+        sender.put(b"abcd", "k")  # 5 bytes with the key: two per batch
+    sender.close()
+    assert sink.stats["records_sent"] == 4
+    assert all(sum(len(data) + len(key) for data, key in batch) <= 12 for batch in sink.batches)
@@ -75,7 +75,7 @@ def test_get_payload(car_instance):
 
 def test_simulate_step(monkeypatch, car_instance):
     # Patch update_heading to avoid randomness during this test.
-    monkeypatch.setattr(car_instance, "update_heading", lambda: None)
+    monkeypatch.setattr(Car, "update_heading", lambda self: None)
     original_location = car_instance.location.copy()
     payload = car_instance.simulate_step()
     # Verify the payload has the required keys.
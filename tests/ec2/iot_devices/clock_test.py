@@ -0,0 +1,26 @@
+import time
+import pytest
+from src.util.clock import VirtualClock
+from src.ec2.iot_devices.phone import Phone
+
+def test_virtual_clock_as_fast_as_possible():
+    clock = VirtualClock(start=1_700_000_000.0)
+    started = time.monotonic()
+    for _ in range(1440):
+        clock.sleep(60.0)
+    assert clock.time() == 1_700_000_000.0 + 86400.0
+    assert time.monotonic() - started < 1.0
+
+def test_virtual_clock_speedup_paces_against_real_time():
+    clock = VirtualClock(start=0.0, speedup=100.0)
+    started = time.monotonic()
+    for _ in range(50):
+        clock.sleep(0.4)  # 20 simulated seconds
+    assert time.monotonic() - started == pytest.approx(0.2, abs=0.1)
+
+def test_device_timestamps_follow_simulated_time():
+    clock = VirtualClock(start=1_700_000_000.0)
+    phone = Phone("phone-1234567", [-1.29, 36.82, 0.0], 90, test=True, clock=clock)
+    phone.simulate(steps=3, delay=60.0)
+    assert clock.time() == 1_700_000_180.0
+    assert phone.get_payload()["timestamp"] == 1_700_000_180
@@ -0,0 +1,81 @@
+import os
+import gzip
+import json
+import pytest
+from src.ec2.iot_devices.backfill import backfill_arrays, backfill_objects
+from src.ec2.iot_devices.fleet import fleet_specs
+from src.ec2.iot_devices.phone import Phone
+from src.util.encoders import get_encoder
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq  # noqa: E402
+from src.util.columnar import ColumnarWriter, read_archive  # noqa: E402
+
+START = 1704151800  # 2024-01-01 23:30 UTC
+
+def ndjson_records(root, device_type):
+    records = []
+    for directory, _, names in sorted(os.walk(os.path.join(root, f"type={device_type}"))):
+        for name in sorted(names):
+            with gzip.open(os.path.join(directory, name), "rt") as f:
+                records += [json.loads(line) for line in f]
+    return records
+
+def archived_records(root, device_type):
+    level = "gas" if device_type == "car" else "battery"
+    return [{"deviceId": row["deviceId"], "timestamp": int(row["timestamp"].timestamp()), "status": row["status"],
+             "location": [row["lat"], row["lon"], row["alt"]], level: row[level]}
+            for row in read_archive(root, device_type).to_pylist()]
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_columnar_backfill_holds_the_same_records_as_ndjson(tmp_path, file_format):
+    backfill_arrays(40, START, START + 7200, str(tmp_path / "json"), seed=1)
+    stats = backfill_arrays(40, START, START + 7200, str(tmp_path / "cols"), seed=1, file_format=file_format)
+    assert stats["records"] == 40 * 120
+    assert (tmp_path / "cols" / "type=phone" / "date=2024-01-01" / "hour=23" / f"part-00000.{file_format}").exists()
+    for device_type in ("phone", "car", "drone"):
+        assert archived_records(tmp_path / "cols", device_type) == ndjson_records(tmp_path / "json", device_type)
+
+def test_objects_backfill_writes_typed_columns(tmp_path):
+    backfill_objects(fleet_specs(12, seed=9), START, START + 600, str(tmp_path / "json"), seed=9)
+    backfill_objects(fleet_specs(12, seed=9), START, START + 600, str(tmp_path / "cols"), seed=9,
+                     file_format="parquet")
+    table = read_archive(str(tmp_path / "cols"), "car")
+    assert table.schema.field("status").type == pa.dictionary(pa.int8(), pa.string())
+    assert pa.types.is_timestamp(table.schema.field("timestamp").type)  # Parquet keeps it in ms
+    assert table.schema.field("timestamp").type.tz == "UTC"
+    assert table.schema.field("gas").type == pa.float64()
+    for device_type in ("phone", "car", "drone"):
+        key = lambda r: (r["deviceId"], r["timestamp"])  # noqa: E731
+        assert sorted(archived_records(tmp_path / "cols", device_type), key=key) == sorted(
+            ndjson_records(tmp_path / "json", device_type), key=key)
+
+def test_batches_bound_memory_and_reopened_hours_get_new_parts(tmp_path):
+    writer = ColumnarWriter(str(tmp_path), batch_rows=10)
+    payload = {"deviceId": "phone-1", "timestamp": START, "status": "moving", "location": [-1.3, 36.8, 0.0],
+               "battery": 90.0}
+    for i in range(25):
+        writer.write_payload(dict(payload, timestamp=START + i))
+        assert writer._open["phone"].buffered < 10
+    writer.write_payload(dict(payload, timestamp=START + 3600))
+    writer.write_payload(dict(payload, timestamp=START, status="charging"))  # Back to the first hour
+    writer.close()
+    directory = tmp_path / "type=phone" / "date=2024-01-01" / "hour=23"
+    assert sorted(os.listdir(directory)) == ["part-00000-1.parquet", "part-00000.parquet"]
+    assert pq.ParquetFile(directory / "part-00000.parquet").num_row_groups == 3
+    assert writer.stats["records_sent"] == 27 and writer.stats["files"] == 3
+    assert read_archive(str(tmp_path), "phone").column("status").to_pylist().count("charging") == 1
+    with pytest.raises(ValueError):
+        ColumnarWriter(str(tmp_path), file_format="csv")
+
+def test_put_takes_every_encoder_and_flush_writes_the_open_batch(tmp_path):
+    writer = ColumnarWriter(str(tmp_path), batch_rows=1000)
+    phone = Phone("phone-1000001", [-1.3, 36.8, 0.0], 90, test=True)
+    for i, name in enumerate(("json", "template", "binary")):
+        writer.put(get_encoder(name).encode(phone, START + i), phone.device_id)
+    writer.put(b"not a record", phone.device_id)
+    writer.flush()
+    assert writer.stats["batches"] == 1 and writer._open["phone"].buffered == 0
+    writer.close()
+    assert writer.stats["records_sent"] == 3 and writer.stats["dropped"] == 1 and writer.stats["bytes_sent"] > 0
+    assert [r["timestamp"] for r in archived_records(str(tmp_path), "phone")] == [START, START + 1, START + 2]
@@ -0,0 +1,67 @@
+import pytest
+from collections import defaultdict
+from src.ec2.iot_devices.car import Car
+from src.ec2.iot_devices.phone import Phone
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet
+from src.util.clock import VirtualClock
+from src.util.emission import DeadReckoning, error_meters, extrapolate, reconstruct
+from src.util.sinks import MemorySink
+from src.util.state_store import decode_record
+
+def test_extrapolate_holds_one_sample_and_continues_two():
+    assert extrapolate((0, 1.0, 2.0, 0.0, 50.0), None, 60) == (60, 1.0, 2.0, 0.0, 50.0)
+    assert extrapolate((60, 1.1, 2.0, 3.0, 49.0), (0, 1.0, 2.0, 0.0, 50.0), 120) == pytest.approx(
+        (120, 1.2, 2.0, 6.0, 48.0))
+    assert extrapolate((60, 0.0, 0.0, 0.0, 1.0), (0, 0.0, 0.0, 0.0, 3.0), 600)[4] == 0.0
+    assert error_meters((0, 0.009, 0.0, 0.0, 0), (0, 0.0, 0.0, 0.0, 0)) == pytest.approx(1000.0)
+
+def test_a_car_going_straight_only_sends_heartbeats(monkeypatch):
+    monkeypatch.setattr(Car, "update_heading", lambda self: None)
+    clock = VirtualClock(start=0)
+    policy = DeadReckoning(heartbeat=600)
+    sink = MemorySink()
+    car = Car("car-1", [-1.3, 36.82, 0.0], 90.0, test=False, producer=sink, clock=clock, emission=policy)
+    for _ in range(60):
+        car.simulate_step()
+        clock.sleep(60)
+    # The first record, one to learn the speed, then one heartbeat every 10 minutes
+    assert policy.stats["first"] == 1 and policy.stats["position"] == 1
+    assert policy.stats["heartbeat"] == 5 and policy.stats["sent"] == len(sink.records) == 7
+    assert policy.stats["suppressed"] == 53
+
+def test_status_changes_are_always_sent():
+    clock = VirtualClock(start=0)
+    policy = DeadReckoning()
+    phone = Phone("phone-1", [-1.3, 36.82, 0.0], 0.0, test=False, producer=MemorySink(), clock=clock, emission=policy)
+    phone.battery = 16.0
+    sent = []
+    for _ in range(10):
+        sent.append(phone.simulate_step() is not None)
+        clock.sleep(60)
+    assert sent[0] and policy.stats["status"] >= 1
+    assert not sent[-1]  # Charging in place at a steady rate is predictable
+
+def test_reconstruct_rebuilds_the_suppressed_series():
+    steps, delay = 40, 60.0
+    series = {}
+    for policy in (None, DeadReckoning(position_m=10.0, level_step=5.0)):
+        sink = MemorySink()
+        clock = VirtualClock(start=1704067200)
+        devices = build_fleet(60, test=False, producer=sink, seed=7, clock=clock, emission=policy)
+        FleetRunner(devices, delay, clock=clock).run(steps)
+        by_device = defaultdict(list)
+        for _, data in sink.records:
+            payload = decode_record(data)
+            by_device[payload["deviceId"]].append(payload)
+        series[policy is None] = by_device
+    truth, sent = series[True], series[False]
+    assert sum(map(len, sent.values())) < sum(map(len, truth.values())) / 2
+    for device_id, actual in truth.items():
+        rebuilt = reconstruct(sent[device_id], delay, end=actual[-1]["timestamp"])
+        assert len(rebuilt) == len(actual) == steps
+        for got, expected in zip(rebuilt, actual):
+            assert got["status"] == expected["status"]
+            level = next(key for key in ("battery", "gas") if key in expected)
+            assert abs(got[level] - expected[level]) <= 5.0 + 0.1
+            g, e = got["location"], expected["location"]
+            assert error_meters((0, g[0], g[1], g[2], 0), (0, e[0], e[1], e[2], 0)) <= 10.0 + 0.5
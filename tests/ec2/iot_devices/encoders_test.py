@@ -0,0 +1,55 @@
+import pytest
+import json
+from src.util.encoders import JsonEncoder, TemplateJsonEncoder, BinaryEncoder, decode_binary, get_encoder, BINARY_RECORD
+from src.ec2.iot_devices.phone import Phone
+from src.ec2.iot_devices.car import Car
+from src.ec2.iot_devices.drone import Drone
+
+@pytest.fixture
+def devices():
+    phone = Phone("phone-1234567", [-1.292076, 36.821948, 0.0], 90, test=True)
+    car = Car("car-7654321", [-1.3, 36.83, 0.0], 0, test=True)
+    drone = Drone("drone-1000001", [-1.29, 36.81, 12.345678], 180, test=True)
+    for device in (phone, car, drone):
+        for _ in range(3):
+            device.simulate_step()
+    return [phone, car, drone]
+
+def test_template_matches_json_dumps(devices):
+    for device in devices:
+        expected = json.dumps(dict(device.get_payload(), timestamp=1700000000)).encode("utf-8")
+        assert JsonEncoder().encode(device, 1700000000) == expected
+        assert TemplateJsonEncoder().encode(device, 1700000000) == expected
+
+def test_binary_round_trip(devices):
+    for device in devices:
+        data = BinaryEncoder().encode(device, 1700000000)
+        assert len(data) == BINARY_RECORD.size
+        decoded = decode_binary(data)
+        payload = dict(device.get_payload(), timestamp=1700000000)
+        assert decoded["deviceId"] == payload["deviceId"]
+        assert decoded["status"] == payload["status"]
+        # Coordinates are microdegrees, altitude millimetres, levels tenths.
+        assert decoded["location"][:2] == payload["location"][:2]
+        assert decoded["location"][2] == pytest.approx(payload["location"][2], abs=0.0005)
+        level = "gas" if device.DEVICE_TYPE == "car" else "battery"
+        assert decoded[level] == pytest.approx(payload[level])
+
+def test_decode_rejects_unknown_version(devices):
+    data = bytearray(BinaryEncoder().encode(devices[0], 0))
+    data[0] = 99
+    with pytest.raises(ValueError):
+        decode_binary(bytes(data))
+
+def test_get_encoder():
+    assert get_encoder("binary").name == "binary"
+    with pytest.raises(ValueError):
+        get_encoder("xml")
+
+def test_simulate_step_sends_encoded_record(monkeypatch):
+    sent = []
+    monkeypatch.setattr("src.ec2.iot_devices.car.send_to_kinesis", lambda data, key: sent.append((data, key)))
+    car = Car("car-1234567", [-1.3, 36.83, 0.0], 0, test=False, encoder=BinaryEncoder())
+    data = car.simulate_step()
+    assert sent == [(data, "car-1234567")]
+    assert decode_binary(data)["deviceId"] == "car-1234567"
@@ -0,0 +1,122 @@
+import pytest
+import numpy as np
+from src.ec2.iot_devices.fleet_arrays import FleetArrays, PhoneArrays, CarArrays, DroneArrays, HEADINGS
+from src.ec2.iot_devices.phone import Phone
+from src.ec2.iot_devices.car import Car
+from src.ec2.iot_devices.drone import Drone
+
+class FixedJitter:
+    """Stands in for np.random.Generator so drone altitude jitter matches random.uniform."""
+    def uniform(self, low, high, size):
+        return np.full(size, 0.05)
+
+def make_phones():
+    phones = []
+    for i, battery in enumerate([100.0, 50.0, 15.2, 15.0, 94.5, 3.0]):
+        p = Phone(f"phone-{1000000 + i}", [-1.29 + i * 0.001, 36.82, 0.0], HEADINGS[i % 4], test=True)
+        p.battery = battery
+        phones.append(p)
+    phones[5].is_charging = True
+    return phones
+
+def test_phone_arrays_match_object_model():
+    phones = make_phones()
+    arrays = PhoneArrays.from_devices(phones)
+    # 400 ticks cover draining, charging and resuming; heading changes are skipped on both sides.
+    for _ in range(400):
+        for p in phones:
+            p.update_battery()
+            p.update_location()
+        arrays.update_battery()
+        arrays.update_location()
+    for i, p in enumerate(phones):
+        assert arrays.payload(i, timestamp=0) == dict(p.get_payload(), timestamp=0)
+        assert arrays.total_distance_km[i] == pytest.approx(p.total_distance_km)
+
+def test_car_gas_and_location_match_object_model(monkeypatch):
+    # No refill and no heading change on either side.
+    monkeypatch.setattr("random.randint", lambda a, b: 2)
+    cars = [Car(f"car-{1000000 + i}", [-1.29, 36.82, 0.0], h, test=True) for i, h in enumerate([0, 90, 180, 270])]
+    cars[0].gas = 31.0
+    arrays = CarArrays.from_devices(cars)
+    for _ in range(200):
+        for c in cars:
+            c.update_gas()
+            c.update_location()
+        arrays.update_gas(np.random.default_rng(0))
+        arrays.update_location()
+    for i, c in enumerate(cars):
+        assert arrays.payload(i, timestamp=0) == dict(c.get_payload(), timestamp=0)
+
+def test_car_refill_below_threshold():
+    arrays = CarArrays.random(10000, np.random.default_rng(1))
+    arrays.level[:] = 30.0
+    arrays.update_gas(np.random.default_rng(2))
+    refilled = arrays.level == 100.0
+    assert 0.05 < refilled.mean() < 0.15
+    assert np.all(arrays.level[~refilled] == 29.8)
+
+def test_drone_state_machine_matches_object_model(monkeypatch):
+    monkeypatch.setattr("random.uniform", lambda a, b: 0.05)
+    drones = []
+    for i, (battery, alt) in enumerate([(100.0, 10.0), (21.0, 2.0), (20.0, 0.5), (90.0, 0.0)]):
+        d = Drone(f"drone-{1000000 + i}", [-1.29, 36.82, alt], 90, test=True)
+        d.battery = battery
+        drones.append(d)
+    drones[3].is_descending = True
+    drones[3].is_landed = True
+    arrays = DroneArrays.from_devices(drones)
+    for _ in range(300):
+        for d in drones:
+            d.update_battery()
+            d.update_movement()
+        arrays.update_battery()
+        arrays.update_movement(FixedJitter())
+    for i, d in enumerate(drones):
+        assert arrays.payload(i, timestamp=0) == dict(d.get_payload(), timestamp=0)
+        assert arrays.total_distance_km[i] == pytest.approx(d.total_distance_km)
+
+def test_step_whole_fleet():
+    rng = np.random.default_rng(7)
+    for cls in (PhoneArrays, CarArrays, DroneArrays):
+        arrays = cls.random(1000, rng)
+        for _ in range(5):
+            arrays.step(rng)
+        assert len(arrays.statuses()) == 1000
+        assert np.all((arrays.level >= 0.0) & (arrays.level <= 100.0))
+
+def test_take_and_put_step_a_subset():
+    rng = np.random.default_rng(8)
+    drones = DroneArrays.random(10, rng)
+    drones.level[:] = 16.0
+    before = drones.take(np.arange(10))
+    index = np.array([1, 4, 7])
+    subset = drones.take(index)
+    assert type(subset) is DroneArrays and len(subset) == 3
+    subset.step(rng)
+    drones.put(index, subset)
+    assert list(np.flatnonzero(drones.is_descending)) == [1, 4, 7]
+    assert np.array_equal(np.delete(drones.lat, index), np.delete(before.lat, index))
+    assert np.array_equal(np.flatnonzero(drones.total_distance_km), index)
+
+def test_round_like_python_matches_builtin_round():
+    from src.ec2.iot_devices.fleet_arrays import round_like_python
+    rng = np.random.default_rng(3)
+    # Random values plus the exact-step sums that produce near-ties.
+    values = np.concatenate([
+        rng.uniform(-2.0, 40.0, 20000),
+        -1.29 + np.arange(2000) * (5 * 0.009 / 3600),
+        36.82 + np.arange(2000) * (60 * 0.009 / 3600),
+    ])
+    for digits in (1, 6):
+        expected = np.array([round(float(v), digits) for v in values])
+        assert np.array_equal(round_like_python(values, digits), expected)
+
+def test_subclass_missing_a_hook_fails_when_created():
+    class Incomplete(FleetArrays):
+        @staticmethod
+        def random_speed(count, rng):
+            return np.zeros(count)
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete.random(3, np.random.default_rng(0))
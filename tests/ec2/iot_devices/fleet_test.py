@@ -0,0 +1,105 @@
+import time
+import tracemalloc
+import pytest
+from src.ec2.iot_devices.fleet import DEVICE_BYTES_BUDGET, FleetRunner, build_fleet, fleet_mix
+from src.ec2.iot_devices.phone import Phone
+from src.ec2.iot_devices.car import Car
+from src.ec2.iot_devices.drone import Drone
+from src.util.clock import VirtualClock
+
+def test_fleet_mix_matches_launcher_split():
+    # Same 55/35/10 split as the subprocess launcher.
+    assert fleet_mix(25) == (13, 8, 4)
+    assert sum(fleet_mix(1001)) == 1001
+
+def test_build_fleet_types_and_ids():
+    devices = build_fleet(100, test=True)
+    assert len(devices) == 100
+    assert sum(isinstance(d, Phone) for d in devices) == 55
+    assert sum(isinstance(d, Car) for d in devices) == 35
+    assert sum(isinstance(d, Drone) for d in devices) == 10
+    for device in devices:
+        prefix, number = device.device_id.split("-")
+        assert prefix in ("phone", "car", "drone")
+        assert len(number) == 7
+
+def test_runner_steps_every_device(monkeypatch):
+    # Avoid real sleeping; the runner only sleeps until the next device is due.
+    monkeypatch.setattr(time, "sleep", lambda s: None)
+    devices = build_fleet(20, test=True)
+    runner = FleetRunner(devices, delay=0.0)
+    assert runner.run(steps=3) == 60
+    assert all(d.total_distance_km > 0 or getattr(d, "is_charging", False) for d in devices)
+
+def test_shard_for_is_stable_and_spread():
+    from src.ec2.iot_devices.fleet import shard_for
+    ids = [f"phone-{1000000 + i}" for i in range(4000)]
+    shards = [shard_for(device_id, 4) for device_id in ids]
+    assert shards == [shard_for(device_id, 4) for device_id in ids]
+    assert all(800 < shards.count(s) < 1200 for s in range(4))
+
+def test_run_sharded_aggregates_worker_reports():
+    from src.ec2.iot_devices.fleet import run_sharded
+    summary = run_sharded(40, processes=2, steps=2, delay=0.01, test=True, report_interval=0.5)
+    assert summary["shards"] == 2
+    assert summary["shards_done"] == 2
+    assert summary["devices"] == 40
+    assert summary["steps"] == 80
+    assert summary["records"] == 80
+
+def _record_ticks(monkeypatch, orders):
+    """Logs (device_id, timestamp) of every step into orders[id(device)]; devices have no __dict__ to patch."""
+    for cls in (Phone, Car, Drone):
+        monkeypatch.setattr(cls, "simulate_step", lambda self, step=cls.simulate_step: orders[id(self)].append(
+            (self.device_id, step(self)["timestamp"])))
+
+def test_virtual_clock_matches_real_time_order_and_state(monkeypatch):
+    real_devices = build_fleet(20, test=True, seed=11)
+    clock = VirtualClock(start=1_700_000_000.0)
+    virtual_devices = build_fleet(20, test=True, seed=11, clock=clock)
+    real_order, virtual_order = [], []
+    orders = {id(device): real_order for device in real_devices}
+    orders.update((id(device), virtual_order) for device in virtual_devices)
+    _record_ticks(monkeypatch, orders)
+    FleetRunner(real_devices, delay=0.05).run(steps=3)
+    FleetRunner(virtual_devices, delay=0.05, clock=clock).run(steps=3)
+    assert [device_id for device_id, _ in virtual_order] == [device_id for device_id, _ in real_order]
+    for real, virtual in zip(real_devices, virtual_devices):
+        assert virtual.get_payload()["location"] == real.get_payload()["location"]
+        assert virtual.level == real.level
+    # Simulated time started at the requested epoch and never waited for the wall clock
+    assert all(timestamp == 1_700_000_000 for _, timestamp in virtual_order)
+
+def test_virtual_clock_simulates_a_day_of_pings_quickly():
+    clock = VirtualClock(start=1_700_000_000.0)
+    devices = build_fleet(10, test=False, seed=3, clock=clock, producer=_ListProducer())
+    started = time.monotonic()
+    assert FleetRunner(devices, delay=60.0, clock=clock).run(steps=1440) == 14400
+    assert time.monotonic() - started < 30
+    assert 1_700_000_000 + 86340 <= clock.time() < 1_700_000_000 + 86400
+
+class _ListProducer:
+    def __init__(self):
+        self.records = []
+
+    def put(self, data, key):
+        self.records.append((key, data))
+
+@pytest.mark.parametrize("cls", [Phone, Car, Drone])
+def test_devices_fit_the_per_device_memory_budget(cls):
+    tracemalloc.start()
+    devices = [cls(f"{cls.DEVICE_TYPE}-{1000000 + i}", [-1.292076, 36.821948 + i * 1e-6, 0.0], 90.0)
+               for i in range(10_000)]
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert used / len(devices) <= DEVICE_BYTES_BUDGET
+    with pytest.raises(AttributeError):
+        devices[0].extra = 1  # No instance __dict__
+
+def test_runner_records_boot_milestones_without_extra_ticks():
+    clock = VirtualClock(start=0)
+    runner = FleetRunner(build_fleet(30, test=True, seed=4, clock=clock), 60.0, clock=clock)
+    assert runner.run(steps=2) == 60
+    assert runner.scheduler.lateness.count == 60
+    assert list(runner.boot) == ["fleet_ready", "first_record", "full_fleet"]
+    assert 0 < runner.boot["fleet_ready"] <= runner.boot["first_record"] <= runner.boot["full_fleet"]
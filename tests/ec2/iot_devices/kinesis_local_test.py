@@ -0,0 +1,63 @@
+import base64
+import pytest
+from src.util.kinesis_local import HASH_KEY_SPACE, KinesisError, LocalKinesis, hash_key, start_server
+from src.util.kinesis_producer import KinesisProducer
+
+def put_records(kinesis, count, size=10, key="phone-{}"):
+    records = [{"Data": base64.b64encode(b"x" * size).decode(), "PartitionKey": key.format(i)} for i in range(count)]
+    return kinesis.handle("PutRecords", {"StreamName": "s", "Records": records})
+
+def test_records_are_routed_by_hash_key_range():
+    kinesis = LocalKinesis(shards=3)
+    response = put_records(kinesis, 300)
+    shards = kinesis.handle("ListShards", {"StreamName": "s"})["Shards"]
+    ranges = {s["ShardId"]: (int(s["HashKeyRange"]["StartingHashKey"]), int(s["HashKeyRange"]["EndingHashKey"]))
+              for s in shards}
+    assert ranges["shardId-000000000002"][1] == HASH_KEY_SPACE - 1
+    for i, result in enumerate(response["Records"]):
+        low, high = ranges[result["ShardId"]]
+        assert low <= hash_key(f"phone-{i}") <= high
+
+def test_shard_record_limit_throttles_and_refills():
+    now = [1000.0]
+    kinesis = LocalKinesis(shards=1, time_fn=lambda: now[0])
+    response = put_records(kinesis, 1200)
+    assert response["FailedRecordCount"] == 200
+    assert response["Records"][-1]["ErrorCode"] == "ProvisionedThroughputExceededException"
+    with pytest.raises(KinesisError) as error:
+        kinesis.handle("PutRecord", {"StreamName": "s", "Data": "eA==", "PartitionKey": "car-1"})
+    assert error.value.code == "ProvisionedThroughputExceededException"
+    now[0] += 0.5
+    assert put_records(kinesis, 600)["FailedRecordCount"] == 100
+
+def test_shard_byte_limit_throttles():
+    kinesis = LocalKinesis(shards=1, time_fn=lambda: 0.0)
+    # 100 KB records: ten fit in the 1 MB per second of one shard
+    assert put_records(kinesis, 12, size=100 * 1024)["FailedRecordCount"] == 2
+
+def test_get_records_reads_a_shard_in_order():
+    kinesis = LocalKinesis(shards=1)
+    put_records(kinesis, 5)
+    iterator = kinesis.handle("GetShardIterator", {"StreamName": "s", "ShardId": "shardId-000000000000",
+                                                   "ShardIteratorType": "TRIM_HORIZON"})["ShardIterator"]
+    first = kinesis.handle("GetRecords", {"ShardIterator": iterator, "Limit": 3})
+    second = kinesis.handle("GetRecords", {"ShardIterator": first["NextShardIterator"]})
+    keys = [r["PartitionKey"] for r in first["Records"] + second["Records"]]
+    assert keys == [f"phone-{i}" for i in range(5)]
+
+def test_boto3_producer_against_local_server(monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "local")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "local")
+    server = start_server(kinesis=LocalKinesis(shards=2))
+    try:
+        client = boto3.client("kinesis", region_name="us-east-2",
+                              endpoint_url=f"http://127.0.0.1:{server.server_address[1]}")
+        producer = KinesisProducer(stream="nairobi-stream", client=client)
+        for i in range(100):
+            producer.put(b'{"n": %d}' % i, f"phone-{i}")
+        producer.close()
+        assert producer.stats["records_sent"] == 100
+        assert len(client.list_shards(StreamName="nairobi-stream")["Shards"]) == 2
+    finally:
+        server.shutdown()
@@ -0,0 +1,105 @@
+import pytest
+import time
+from botocore.exceptions import EndpointConnectionError
+from src.util.kinesis_producer import KinesisProducer, MAX_BATCH_RECORDS
+
+class FakeKinesis:
+    """Records PutRecords calls; fails the listed positions of the first call."""
+    def __init__(self, fail_first=()):
+        self.calls = []
+        self.fail_first = set(fail_first)
+
+    def put_records(self, StreamName, Records):
+        self.calls.append(list(Records))
+        results = []
+        for i, _ in enumerate(Records):
+            if len(self.calls) == 1 and i in self.fail_first:
+                results.append({"ErrorCode": "ProvisionedThroughputExceededException", "ErrorMessage": "slow down"})
+            else:
+                results.append({"SequenceNumber": str(i), "ShardId": "shardId-000000000000"})
+        return {"FailedRecordCount": sum("ErrorCode" in r for r in results), "Records": results}
+
+def test_flushes_at_record_limit():
+    client = FakeKinesis()
+    producer = KinesisProducer(client=client, linger=60)
+    for i in range(MAX_BATCH_RECORDS + 1):
+        producer.put(b"{}", f"phone-{i}")
+    assert [len(c) for c in client.calls] == [MAX_BATCH_RECORDS]
+    producer.close()
+    assert [len(c) for c in client.calls] == [MAX_BATCH_RECORDS, 1]
+    assert producer.stats["records_sent"] == MAX_BATCH_RECORDS + 1
+
+def test_flushes_at_byte_limit():
+    client = FakeKinesis()
+    producer = KinesisProducer(client=client, max_bytes=1000, linger=60)
+    for i in range(5):
+        producer.put(b"x" * 300, "car-1")
+    producer.close()
+    # 300 bytes of data + 5 bytes of key per record: three fit under 1000 bytes.
+    assert [len(c) for c in client.calls] == [3, 2]
+
+def test_flushes_after_linger():
+    client = FakeKinesis()
+    producer = KinesisProducer(client=client, linger=0.05)
+    producer.put(b"{}", "drone-1")
+    time.sleep(0.3)
+    assert len(client.calls) == 1
+    producer.close()
+
+def test_resends_only_failed_records(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda s: None)
+    client = FakeKinesis(fail_first=(1, 3))
+    producer = KinesisProducer(client=client, linger=60)
+    for i in range(5):
+        producer.put(str(i).encode(), f"phone-{i}")
+    producer.flush()
+    assert [r["Data"] for r in client.calls[1]] == [b"1", b"3"]
+    assert producer.stats["records_sent"] == 5
+    assert producer.stats["resent"] == 2 and producer.stats["throttled"] == 2
+    assert producer.stats["dropped"] == 0
+
+class Unreachable(FakeKinesis):
+    """Fails the first `outages` calls with a connection error instead of a response."""
+    def __init__(self, outages):
+        super().__init__()
+        self.outages = outages
+
+    def put_records(self, StreamName, Records):
+        if self.outages:
+            self.outages -= 1
+            raise EndpointConnectionError(endpoint_url="https://kinesis.us-east-2.amazonaws.com")
+        return super().put_records(StreamName, Records)
+
+def test_connection_errors_are_resent_then_counted_as_dropped(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda s: None)
+    producer = KinesisProducer(client=Unreachable(outages=2), linger=60)
+    producer.put(b"{}", "car-1")
+    producer.flush()
+    assert producer.stats["records_sent"] == 1
+    assert producer.stats["resent"] == 2 and producer.stats["throttled"] == 0  # Resent, but not throttled
+    producer = KinesisProducer(client=Unreachable(outages=100), linger=60, max_attempts=2)
+    producer.put(b"{}", "car-1")
+    producer.flush()
+    assert producer.stats["dropped"] == 1
+
+def test_linger_thread_survives_send_errors(monkeypatch):
+    producer = KinesisProducer(client=FakeKinesis(), linger=0.02)
+    sends = []
+
+    def failing_send(batch):
+        sends.append(batch)
+        if len(sends) == 1:
+            raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(producer, "_send", failing_send)
+    producer.put(b"{}", "drone-1")
+    time.sleep(0.2)
+    producer.put(b"{}", "drone-2")
+    time.sleep(0.2)
+    assert len(sends) == 2
+    producer.close()
+
+def test_rejects_oversized_record():
+    producer = KinesisProducer(client=FakeKinesis())
+    with pytest.raises(ValueError):
+        producer.put(b"x" * (1024 * 1024), "phone-1")
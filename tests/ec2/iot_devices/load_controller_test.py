@@ -0,0 +1,35 @@
+import math
+import pytest
+from src.util.load_controller import DECREASE, INCREASE, RECORD_BYTES, LoadController
+
+def test_settles_and_reports_drift():
+    controller = LoadController(1000, tolerance=0.02, settle=3)
+    assert controller.setpoint == 1000
+    for now, delivered in zip(range(5, 45, 5), (2000, 4000, 4950, 5000, 5050, 4900, 5000, 5200)):
+        controller.update(now, 5, 5000, delivered)
+    report = controller.report()
+    # On target from the period starting at 10 s; 4900 and 5200 afterwards are drift
+    assert report["time_to_steady_s"] == 10
+    assert report["max_drift_pct"] == 4.0 and report["mean_error_pct"] == 0.67
+    assert report["ceiling_per_s"] is None and report["periods"] == 8
+
+def test_learns_bytes_per_record():
+    controller = LoadController(13000, unit="bytes")
+    assert controller.setpoint == 13000 / RECORD_BYTES
+    for now in range(1, 30):
+        setpoint = controller.update(now, 1, 100, 100 * 260)
+    assert setpoint == pytest.approx(50, rel=0.01)
+
+def test_throttling_caps_the_setpoint_at_what_the_sink_took():
+    controller = LoadController(1000)
+    assert controller.update(1, 1, 1000, 600, throttled=400) == pytest.approx(600 * DECREASE)
+    assert controller.update(2, 1, 540, 540) == pytest.approx(600 * DECREASE + INCREASE * 1000)
+    for now in range(3, 100):
+        controller.update(now, 1, 1000, 1000)
+    assert controller.ceiling == math.inf and controller.setpoint == 1000
+    assert controller.report()["throttled_periods"] == 1
+
+def test_invalid_targets():
+    for target, unit in ((0, "records"), (100, "messages")):
+        with pytest.raises(ValueError):
+            LoadController(target, unit)
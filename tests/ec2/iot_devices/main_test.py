@@ -0,0 +1,33 @@
+import os
+import pytest
+from src.ec2.iot_devices.main import make_emission, make_snapshot, parse_args
+from src.ec2.iot_devices.snapshot import SNAPSHOT_INTERVAL
+from src.util.emission import HEARTBEAT, LEVEL_STEP
+
+def test_processes_requires_a_value():
+    args = parse_args(["--processes", "100"])
+    assert args.processes == 100
+    assert args.num_devices == 25
+    assert parse_args(["--processes", "4", "1000"]).num_devices == 1000
+    with pytest.raises(SystemExit):
+        parse_args(["1000", "--processes"])
+
+def test_processes_auto_and_zero_mean_one_per_core():
+    assert parse_args(["--processes", "auto"]).processes == (os.cpu_count() or 1)
+    assert parse_args(["--processes", "0"]).processes == (os.cpu_count() or 1)
+
+def test_sender_queue_must_be_positive():
+    with pytest.raises(SystemExit):
+        parse_args(["--sender-queue", "0"])
+    assert parse_args(["--sender-queue", "10"]).sender_queue == 10
+
+def test_dead_reckoning_options_only_when_asked_for():
+    assert make_emission(parse_args([])) is None
+    assert make_emission(parse_args(["--dead-reckoning", "--position-error", "25"])) == {
+        "position_m": 25.0, "level_step": LEVEL_STEP, "heartbeat": HEARTBEAT, "on_heading": True}
+    assert make_emission(parse_args(["--dead-reckoning", "--ignore-heading"]))["on_heading"] is False
+
+def test_snapshot_options_only_when_asked_for():
+    assert make_snapshot(parse_args([])) is None
+    assert make_snapshot(parse_args(["--snapshot", "fleet.snap"])) == {"path": "fleet.snap",
+                                                                      "interval": SNAPSHOT_INTERVAL}
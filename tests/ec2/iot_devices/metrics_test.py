@@ -0,0 +1,97 @@
+import time
+import urllib.error
+import urllib.request
+import pytest
+from src.util.metrics import Registry, lateness_histogram, start_metrics_server
+from src.util.scheduler import LatenessStats
+from src.util.sinks import MemorySink
+from src.util.kinesis_producer import THROTTLES, KinesisProducer
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet, fleet_metrics
+
+def samples(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    registry.counter("records_total", "Records", shard="1").inc(3)
+    registry.counter("records_total", "Records", shard="1").inc()
+    registry.gauge("depth", "Queue depth").set(7)
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    text = registry.render()
+    assert "# TYPE records_total counter" in text
+    assert text.count("# HELP records_total") == 1
+    values = samples(text)
+    assert values['records_total{shard="1"}'] == "4"
+    assert values["depth"] == "7"
+    assert values['latency_seconds_bucket{le="0.1"}'] == "2"
+    assert values['latency_seconds_bucket{le="1"}'] == "3"
+    assert values['latency_seconds_bucket{le="+Inf"}'] == "4"
+    assert values["latency_seconds_count"] == "4"
+    assert float(values["latency_seconds_sum"]) == pytest.approx(3.65)
+
+def test_registry_rejects_a_name_of_another_kind():
+    registry = Registry()
+    registry.counter("depth", "Queue depth")
+    with pytest.raises(ValueError):
+        registry.gauge("depth", "Queue depth")
+
+def test_lateness_histogram_rebuckets_scheduler_stats():
+    stats = LatenessStats(resolution=0.001, buckets=100)
+    for lateness in (0.0002, 0.003, 0.02, 5.0):
+        stats.record(lateness)
+    histogram = lateness_histogram("lateness_seconds", "Lateness", stats, buckets=(0.001, 0.01, 0.05))
+    assert histogram.counts == [1, 1, 1, 1]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(5.0232)
+
+def test_fleet_metrics_read_runner_and_sink_counters():
+    sink = MemorySink()
+    devices = build_fleet(10, test=False, producer=sink, seed=3)
+    runner = FleetRunner(devices, delay=0.01)
+    runner.run(steps=2)
+    registry = Registry()
+    registry.add_collector(lambda: fleet_metrics(runner, sink, {"shard": "0"}))
+    values = samples(registry.render())
+    assert values['nairobi_device_steps_total{shard="0"}'] == "20"
+    assert values['nairobi_records_sent_total{shard="0"}'] == "20"
+    assert values['nairobi_tick_lateness_seconds_count{shard="0"}'] == "20"
+    assert "nairobi_producer_queue_depth" not in registry.render()
+
+class ThrottlingKinesis:
+    """Throttles every other record of the first PutRecords call."""
+    def __init__(self):
+        self.calls = 0
+
+    def put_records(self, StreamName, Records):
+        self.calls += 1
+        results = [{"ErrorCode": "ProvisionedThroughputExceededException"} if self.calls == 1 and i % 2 == 0
+                   else {"SequenceNumber": str(i)} for i, _ in enumerate(Records)]
+        return {"Records": results}
+
+def test_producer_counts_throttled_records(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda s: None)
+    before = THROTTLES.value
+    producer = KinesisProducer(client=ThrottlingKinesis(), linger=60)
+    for i in range(4):
+        producer.put(b"{}", f"car-{i}")
+    assert producer.queue_depth == 4
+    producer.flush()
+    assert producer.queue_depth == 0
+    assert THROTTLES.value - before == 2
+
+def test_metrics_server_serves_the_registry():
+    registry = Registry()
+    registry.counter("nairobi_up_total", "Up").inc()
+    server = start_metrics_server(registry=registry)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "nairobi_up_total 1" in response.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        server.shutdown()
+        server.server_close()
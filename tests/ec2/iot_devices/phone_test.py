@@ -101,7 +101,7 @@ def test_simulate_step(monkeypatch, phone_instance):
     # Patch time.sleep to avoid delay.
     monkeypatch.setattr(time, "sleep", lambda s: None)
     # We can patch update_heading to keep heading stable for predictable location update.
-    monkeypatch.setattr(phone_instance, "update_heading", lambda: None)
+    monkeypatch.setattr(Phone, "update_heading", lambda self: None)
     original_location = phone_instance.location.copy()
     payload = phone_instance.simulate_step()
     # Verify payload structure and that location or battery state has updated.
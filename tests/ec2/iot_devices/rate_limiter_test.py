@@ -0,0 +1,82 @@
+import time
+import pytest
+from botocore.exceptions import ClientError
+from src.util import sim_functions
+from src.util.kinesis_local import HASH_KEY_SPACE, hash_key
+from src.util.kinesis_producer import KinesisProducer
+from src.util.rate_limiter import DECREASE, TokenBucket, ShardRateLimiter
+
+def two_shards():
+    return [("shardId-0", 0, HASH_KEY_SPACE // 2 - 1), ("shardId-1", HASH_KEY_SPACE // 2, HASH_KEY_SPACE - 1)]
+
+def test_bucket_lets_a_burst_through_then_paces():
+    bucket = TokenBucket(1000, now=0.0)
+    assert bucket.reserve(1000, 0.0) == 0.0
+    assert bucket.reserve(500, 0.0) == pytest.approx(0.5)
+    assert bucket.reserve(500, 1.0) == pytest.approx(0.0)
+
+def test_throttling_cuts_the_rate_and_it_grows_back():
+    bucket = TokenBucket(1000, now=0.0)
+    bucket.throttled(0.0)
+    assert bucket.rate == pytest.approx(1000 * DECREASE)
+    assert bucket.reserve(70, 0.0) == pytest.approx(0.1)
+    bucket.reserve(0, 10.0)
+    assert bucket.rate == 1000
+
+def test_limiter_maps_records_to_shards_like_kinesis():
+    limiter = ShardRateLimiter(two_shards())
+    for i in range(50):
+        key = f"car-{i}"
+        assert limiter.shard_for({"PartitionKey": key}) == int(hash_key(key) >= HASH_KEY_SPACE // 2)
+    assert limiter.shard_for({"PartitionKey": "car-1", "ExplicitHashKey": str(HASH_KEY_SPACE - 1)}) == 1
+
+def test_reserve_batch_waits_for_the_busiest_shard():
+    limiter = ShardRateLimiter(two_shards(), records_per_sec=100, time_fn=lambda: 0.0)
+    batch = [{"Data": b"{}", "PartitionKey": "k", "ExplicitHashKey": "0"}] * 150
+    batch += [{"Data": b"{}", "PartitionKey": "k", "ExplicitHashKey": str(HASH_KEY_SPACE - 1)}] * 20
+    assert limiter.reserve_batch(batch) == pytest.approx(0.5)
+
+class ThrottleOnce:
+    """put_records that throttles every record of the first call."""
+    def __init__(self):
+        self.calls = 0
+
+    def put_records(self, StreamName, Records):
+        self.calls += 1
+        error = {"ErrorCode": "ProvisionedThroughputExceededException"}
+        return {"Records": [error if self.calls == 1 else {"SequenceNumber": "1"} for _ in Records]}
+
+def test_producer_paces_resends_with_the_limiter(monkeypatch):
+    slept = []
+    monkeypatch.setattr(time, "sleep", slept.append)
+    limiter = ShardRateLimiter(two_shards(), time_fn=lambda: 0.0)
+    producer = KinesisProducer(client=ThrottleOnce(), linger=60, limiter=limiter)
+    for i in range(10):
+        producer.put(b"{}", f"phone-{i}")
+    producer.flush()
+    assert producer.stats["records_sent"] == 10
+    assert producer.stats["resent"] == 10
+    assert all(rate == 1000 * DECREASE for rate in limiter.shard_rates().values())
+    # The resend waits for the cut buckets, not for the fixed backoff
+    assert slept and all(s != 0.05 for s in slept)
+
+class ThrottlingPutRecord:
+    def __init__(self, throttles):
+        self.throttles = throttles
+        self.sent = []
+
+    def put_record(self, StreamName, Data, PartitionKey):
+        if self.throttles:
+            self.throttles -= 1
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "PutRecord")
+        self.sent.append(Data)
+
+def test_send_to_kinesis_retries_throttles_without_tenacity_sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(time, "sleep", slept.append)
+    client = ThrottlingPutRecord(throttles=2)
+    monkeypatch.setattr(sim_functions, "get_kinesis_client", lambda: client)
+    monkeypatch.setattr(sim_functions, "get_rate_limiter", lambda stream: ShardRateLimiter(two_shards()))
+    sim_functions.send_to_kinesis(b"{}", "drone-1")
+    assert client.sent == [b"{}"]
+    assert all(s < 1 for s in slept)
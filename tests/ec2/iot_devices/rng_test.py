@@ -0,0 +1,35 @@
+from src.util.rng import DeviceRandom, stable_hash
+from src.ec2.iot_devices.fleet import build_fleet
+
+def test_same_seed_and_device_give_same_stream():
+    a = DeviceRandom(42, "car-1234567")
+    b = DeviceRandom(42, "car-1234567")
+    assert [a.random() for _ in range(100)] == [b.random() for _ in range(100)]
+
+def test_streams_differ_per_device_and_seed():
+    base = [DeviceRandom(42, "car-1234567").random() for _ in range(10)]
+    assert base != [DeviceRandom(42, "car-1234568").random() for _ in range(10)]
+    assert base != [DeviceRandom(43, "car-1234567").random() for _ in range(10)]
+
+def test_block_refills_do_not_repeat():
+    rng = DeviceRandom(1, "phone-1000000", block_size=8)
+    draws = [rng.random() for _ in range(64)]
+    assert len(set(draws)) == 64
+
+def test_random_module_subset():
+    rng = DeviceRandom(7, "drone-7654321")
+    ints = [rng.randint(1, 5) for _ in range(5000)]
+    assert set(ints) == {1, 2, 3, 4, 5}
+    assert 0.15 < ints.count(1) / 5000 < 0.25
+    assert all(-0.1 <= rng.uniform(-0.1, 0.1) < 0.1 for _ in range(1000))
+    assert {rng.choice([0, 90, 180, 270]) for _ in range(200)} == {0, 90, 180, 270}
+
+def test_stable_hash_is_deterministic():
+    assert stable_hash("phone-1234567") == stable_hash("phone-1234567")
+    assert stable_hash("phone-1234567") != stable_hash("phone-1234568")
+
+def test_seeded_fleets_are_reproducible():
+    def run():
+        fleet = build_fleet(30, test=True, seed=2024)
+        return [[dict(d.simulate_step(), timestamp=0) for _ in range(20)] for d in fleet]
+    assert run() == run()
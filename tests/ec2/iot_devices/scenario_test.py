@@ -0,0 +1,165 @@
+import os
+import json
+import glob
+import numpy as np
+import pytest
+from src.util.clock import VirtualClock
+from src.util.sinks import CappedSink, MemorySink
+from src.util.kinesis_local import LocalKinesis
+from src.util.kinesis_producer import KinesisProducer
+from src.util.spatial_index import degrees_to_meters
+from src.ec2.iot_devices.main import make_clock
+from src.ec2.iot_devices.scenario import DevicePool, Hotspot, Scenario, ScenarioRunner, parse_args, parse_curve
+
+START = 1704067200  # 2024-01-01 00:00 UTC
+SCENARIOS = os.path.join(os.path.dirname(__file__), "..", "..", "..", "docs", "scenarios")
+
+def test_curves():
+    times = np.array([0.0, 50.0, 100.0, 200.0])
+    assert list(parse_curve(7)(times)) == [7.0] * 4
+    assert list(parse_curve([[0, 10], [100, 20]])(times)) == [10.0, 15.0, 20.0, 20.0]
+    diurnal = parse_curve({"diurnal": {"min": 1, "max": 3, "peak": 12}}, START)
+    assert list(diurnal(np.array([12 * 3600.0, 0.0, 6 * 3600.0]))) == pytest.approx([3.0, 1.0, 2.0])
+    for bad in ("x", [[10, 1], [0, 2]], {"spline": []}):
+        with pytest.raises(ValueError):
+            parse_curve(bad)
+
+def test_pool_grows_and_shrinks_in_place():
+    rng = np.random.default_rng(1)
+    pool = DevicePool("phone", "phone", 1000, 10.0, parse_curve(1), [], rng)
+    lat = pool.arrays.lat
+    pool.resize(800, 0.0)
+    assert pool.active == 800 and (pool.next_due[:800] < 10.0).all()
+    pool.resize(300, 5.0)
+    pool.resize(5000, 6.0)  # Capped at the capacity
+    assert pool.active == 1000 and pool.joined == 1500 and pool.left == 500
+    assert pool.arrays.lat is lat  # Joining re-initializes slots, it does not reallocate
+    assert list(pool.arrays.ids[:3]) == [1000000, 1000001, 1000002]
+
+    fired = 0
+    for now in range(6, 36):
+        due = pool.tick(float(now))
+        fired += 0 if due is None else len(due[0])
+    assert fired == pytest.approx(3000, abs=1000)  # Every device about once per 10 s
+    assert pool.arrays.total_distance_km[:1000].min() > 0
+
+def test_hotspot_places_joining_devices_in_its_disc():
+    stadium = Hotspot("stadium", -1.3045, 36.825, 300, weight=0.5, types=["phone"], start=100, end=200)
+    pool = DevicePool("phone", "phone", 2000, 60.0, parse_curve(1), [stadium], np.random.default_rng(2))
+    pool.resize(1000, 0.0)  # Closed
+    pool.resize(2000, 150.0)
+    distance = degrees_to_meters(np.hypot(pool.arrays.lat + 1.3045, pool.arrays.lon - 36.825))
+    assert (distance[:1000] > 300).mean() > 0.9
+    assert (distance[1000:1500] <= 301).all() and (distance[1500:] > 300).mean() > 0.9
+    # A car pool ignores a phone hotspot
+    assert DevicePool("car", "car", 10, 60.0, parse_curve(1), [stadium], np.random.default_rng(2)).hotspots == []
+
+def test_runner_follows_population_mix_and_bursts():
+    scenario = Scenario({
+        "duration": 600, "population": [[0, 0], [300, 1000]], "mix": {"phone": 3, "car": 1},
+        "interval": 10,
+        "hotspots": [{"name": "park", "lat": -1.29, "lon": 36.82, "radius_m": 100, "from": 10000}],
+        "bursts": [{"name": "swarm", "type": "drone", "at": 400, "duration": 100, "devices": 200, "ramp": 10,
+                    "interval": 1, "hotspot": "park"}],
+    })
+    sink = MemorySink(1000000)
+    runner = ScenarioRunner(scenario, sink, VirtualClock(start=START), seed=4, report_interval=100)
+    summary = runner.run()
+    pools = {pool.name: pool for pool, _ in runner.pools}
+    assert [pool.capacity for pool in pools.values()] == [750, 250, 0, 200]
+    assert summary["peak_devices"] == 1200 and summary["ticks"] == 600
+    assert [entry["devices"]["phone"] for entry in summary["timeline"]] == [0, 250, 500, 750, 750, 750]
+    assert pools["swarm"].active == 0 and pools["swarm"].left == 200
+
+    records = [(key, json.loads(data)) for key, data in sink.records]
+    assert summary["records"] == len(records) and summary["bytes"] == sum(len(d) + 1 for _, d in sink.records)
+    swarm = [r for key, r in records if key.startswith("drone-")]
+    # 200 drones pinging every second for about 90 s (the ramps), all taking off in the park
+    assert 16000 < len(swarm) < 20000
+    first = {}
+    for record in swarm:
+        first.setdefault(record["deviceId"], record["location"])
+    assert len(first) == 200
+    assert all(degrees_to_meters(np.hypot(lat + 1.29, lon - 36.82)) < 100 + 20 for lat, lon, _ in first.values())
+    assert all(START <= r["timestamp"] < START + 600 for _, r in records)
+    assert all(key == r["deviceId"] for key, r in records)
+
+def test_test_mode_counts_without_a_producer():
+    scenario = Scenario({"duration": 120, "population": 600, "interval": 60})
+    summary = ScenarioRunner(scenario, None, VirtualClock(start=START), seed=1).run()
+    assert summary["records"] == pytest.approx(1200, abs=20) and summary["bytes"] == 0
+
+def test_invalid_scenarios():
+    for spec in ({"duration": 10}, {"duration": 10, "population": 1, "crowds": []},
+                 {"duration": 10, "population": 1, "mix": {"bus": 1}},
+                 {"duration": 10, "population": 1, "bursts": [{"type": "drone", "at": 0, "devices": 1,
+                                                               "hotspot": "nowhere"}]},
+                 {"duration": 10, "population": 1e8}):
+        with pytest.raises(ValueError):
+            Scenario(spec)
+
+def test_example_scenarios_parse():
+    paths = glob.glob(os.path.join(SCENARIOS, "*.json"))
+    assert paths
+    for path in paths:
+        assert Scenario.load(path).duration > 0
+
+def test_stadium_hotspot_opens_while_phones_join():
+    scenario = Scenario.load(os.path.join(SCENARIOS, "stadium.json"))
+    stadium = scenario.hotspots[0]
+    phones = scenario.targets(START)["phone"]
+    # Only devices that join while a hotspot is open are placed in it
+    assert phones(np.array(stadium.end)) > phones(np.array(stadium.start))
+
+def test_cli_clock_options_match_main():
+    args = parse_args(["stadium.json", "--speedup", "60", "--start", "2024-01-01T00:00:00+00:00"])
+    clock = make_clock(args)
+    assert clock.time() == START and clock.speedup == 60
+    assert make_clock(parse_args(["stadium.json"])) is None
+
+def _controlled(target, population=1000000, interval=20, duration=300, sink=None):
+    clock = VirtualClock(start=START)
+    spec = {"duration": duration, "population": population, "interval": interval, "target": target}
+    runner = ScenarioRunner(Scenario(spec), sink(clock) if sink else MemorySink(10), clock, seed=1)
+    return runner, runner.run()["controller"]
+
+def test_controller_holds_a_records_target_with_devices():
+    runner, report = _controlled({"records_per_s": 2000})
+    assert report["time_to_steady_s"] <= 30 and report["max_drift_pct"] <= 5
+    assert report["achieved_per_s"] == pytest.approx(2000, rel=0.01)
+    # 2000 records/s at one ping per 20 s per device, in the default mix
+    assert report["devices"] == pytest.approx(40000, rel=0.01) and report["rate_scale"] == 1.0
+    assert [pool.active for pool, _ in runner.base] == pytest.approx([22000, 14000, 4000], rel=0.02)
+
+def test_controller_shortens_intervals_when_the_population_is_exhausted():
+    _, report = _controlled({"bytes_per_s": 200000}, population=10000, interval=60)
+    assert report["time_to_steady_s"] is not None and report["achieved_per_s"] == pytest.approx(200000, rel=0.01)
+    assert report["devices"] == 10000 and 5 < report["rate_scale"] < 10
+
+def test_controller_finds_the_ceiling_of_a_throttling_sink():
+    _, report = _controlled({"records_per_s": 5000}, sink=lambda clock: CappedSink(3000, clock))
+    assert report["time_to_steady_s"] is None and report["throttled_periods"] > 0
+    assert 2400 < report["ceiling_per_s"] < 3000 and report["last_per_s"] <= 3000
+
+def test_controller_backs_off_when_kinesis_throttles():
+    producers = []
+
+    def producer(clock):
+        # One attempt per record: resends would wait in real time while the virtual clock stands still
+        kinesis = LocalKinesis(shards=2, time_fn=clock.time)
+        producers.append(KinesisProducer("s", kinesis.client(), linger=3600, max_attempts=1))
+        return producers[0]
+
+    _, report = _controlled({"records_per_s": 3000}, duration=120, sink=producer)
+    stats = producers[0].stats
+    producers[0].close()
+    assert stats["throttled"] > 0 and stats["resent"] == 0 and report["throttled_periods"] > 0
+    # Two shards take 2 x 1000 records/s
+    assert report["ceiling_per_s"] < 2000 and report["last_per_s"] <= 2000
+
+def test_bytes_target_needs_a_producer():
+    scenario = Scenario({"duration": 10, "population": 10, "target": {"bytes_per_s": 1000}})
+    with pytest.raises(ValueError):
+        ScenarioRunner(scenario, None, VirtualClock(start=START))
+    with pytest.raises(ValueError):
+        Scenario({"duration": 10, "population": 10, "target": {"records_per_s": 1, "bytes_per_s": 1}})
@@ -0,0 +1,87 @@
+import pytest
+import asyncio
+from src.util.clock import VirtualClock
+from src.util.scheduler import TimingWheel, TickScheduler, LatenessStats
+
+def test_wheel_expires_on_due_tick_across_levels():
+    wheel = TimingWheel(tick=1.0, slots=4, levels=3)
+    # 3 lands on level 0, 6 and 13 on level 1, 40 on the (overflowing) top level.
+    for when in (3, 6, 13, 40):
+        wheel.schedule(when, when)
+    fired = {}
+    for now in range(1, 50):
+        for due, item in wheel.advance(now):
+            fired[item] = now
+    assert fired == {3: 3, 6: 6, 13: 13, 40: 40}
+    assert len(wheel) == 0
+
+def test_wheel_past_deadline_fires_on_next_advance():
+    wheel = TimingWheel(tick=1.0, slots=4, levels=2, start=10.0)
+    wheel.schedule(5.0, "late")
+    assert wheel.advance(10.0) == [(5, "late")]
+
+def test_wheel_jumps_over_empty_ticks():
+    wheel = TimingWheel(tick=0.01, slots=256, levels=4)
+    wheel.schedule(86400.0, "tomorrow")
+    assert wheel.next_tick() == 8640000 // 65536 * 65536
+    # One advance over a simulated day still lands on the due tick
+    assert wheel.advance(86399.99) == []
+    assert wheel.advance(86400.0) == [(8640000, "tomorrow")]
+
+def test_scheduler_fires_each_callback_count_times():
+    clock = VirtualClock(start=0.0)
+    scheduler = TickScheduler(tick=0.5, clock=clock)
+    calls = {"phone": 0, "drone": 0}
+    scheduler.add(lambda: calls.__setitem__("phone", calls["phone"] + 1), interval=60.0, count=3, phase=1.0)
+    scheduler.add(lambda: calls.__setitem__("drone", calls["drone"] + 1), interval=10.0, count=3, phase=1.0)
+    while clock.now < 200:
+        clock.advance(0.5)
+        scheduler.run_due(clock.now)
+    assert calls == {"phone": 3, "drone": 3}
+    assert scheduler.fired == 6
+    assert scheduler.lateness.max == 0.0
+
+def test_scheduler_random_phase_within_interval():
+    clock = VirtualClock(start=0.0)
+    scheduler = TickScheduler(tick=1.0, clock=clock)
+    fired_at = []
+    for _ in range(200):
+        scheduler.add(lambda: fired_at.append(clock.now), interval=60.0, count=1)
+    while len(scheduler.wheel):
+        clock.advance(1.0)
+        scheduler.run_due(clock.now)
+    assert max(fired_at) <= 61.0
+    assert len(set(fired_at)) > 20
+
+def test_scheduler_asyncio_run():
+    scheduler = TickScheduler(tick=0.01)
+    calls = []
+    scheduler.add(lambda: calls.append(1), interval=0.02, count=5)
+    asyncio.run(scheduler.run())
+    assert len(calls) == 5
+    assert scheduler.lateness.summary()["ticks"] == 5
+
+def test_scheduler_virtual_clock_runs_a_day_without_waiting():
+    clock = VirtualClock(start=1_700_000_000.0)
+    scheduler = TickScheduler(clock=clock)
+    fired_at = []
+    scheduler.add(lambda: fired_at.append(clock.time()), interval=3600.0, count=24, phase=0.0)
+    asyncio.run(scheduler.run())
+    assert fired_at == [1_700_000_000.0 + 3600.0 * i for i in range(24)]
+    assert scheduler.lateness.max == 0.0
+
+def test_scheduler_virtual_clock_stops_after_duration():
+    clock = VirtualClock(start=0.0)
+    scheduler = TickScheduler(tick=1.0, clock=clock)
+    calls = []
+    scheduler.add(lambda: calls.append(clock.now), interval=10.0, phase=0.0)
+    asyncio.run(scheduler.run(duration=95.0))
+    assert calls == [10.0 * i for i in range(10)]
+
+def test_lateness_percentiles():
+    stats = LatenessStats(resolution=0.001)
+    for i in range(100):
+        stats.record(i / 1000)
+    assert stats.percentile(0.5) == pytest.approx(0.050)
+    assert stats.percentile(0.99) == pytest.approx(0.099)
+    assert stats.summary()["max_ms"] == 99.0
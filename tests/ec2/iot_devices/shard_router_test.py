@@ -0,0 +1,95 @@
+import threading
+import pytest
+from src.util.kinesis_local import HASH_KEY_SPACE, LocalKinesis, hash_key, start_server
+from src.util.kinesis_producer import KinesisProducer
+from src.util.shard_router import ShardRouter, list_shards
+
+def four_shards():
+    return [(f"shardId-{i}", i * HASH_KEY_SPACE // 4, (i + 1) * HASH_KEY_SPACE // 4 - 1) for i in range(4)]
+
+class PagedKinesis:
+    """ListShards over two pages, with a shard closed by a reshard."""
+    def list_shards(self, StreamName=None, NextToken=None):
+        if NextToken is None:
+            return {"Shards": [{"ShardId": "shardId-1", "HashKeyRange": {"StartingHashKey": "50",
+                                                                       "EndingHashKey": "99"},
+                                "SequenceNumberRange": {"StartingSequenceNumber": "1"}},
+                               {"ShardId": "shardId-old", "HashKeyRange": {"StartingHashKey": "0",
+                                                                         "EndingHashKey": "99"},
+                                "SequenceNumberRange": {"StartingSequenceNumber": "0",
+                                                        "EndingSequenceNumber": "9"}}],
+                    "NextToken": "page-2"}
+        return {"Shards": [{"ShardId": "shardId-0", "HashKeyRange": {"StartingHashKey": "0", "EndingHashKey": "49"},
+                            "SequenceNumberRange": {"StartingSequenceNumber": "1"}}]}
+
+def test_list_shards_pages_and_skips_closed_shards():
+    assert list_shards(PagedKinesis(), "s") == [("shardId-0", 0, 49), ("shardId-1", 50, 99)]
+
+def test_routes_keys_stably_inside_their_shard_range():
+    router = ShardRouter(four_shards())
+    assert [router.slot_shard.count(i) for i in range(4)] == [256] * 4
+    for i in range(100):
+        key = f"phone-{i}"
+        explicit = router.route(key, 100)
+        assert explicit == router.route(key, 100)
+        shard, start, end = four_shards()[router.hash_keys.index(explicit)]
+        assert start <= int(explicit) <= end
+
+def test_hot_shard_is_flagged_and_its_slots_move():
+    now = [0.0]
+    router = ShardRouter(four_shards(), time_fn=lambda: now[0])
+    keys = [key for key in (f"car-{i}" for i in range(2000)) if router.route(key, 0) == router.hash_keys[0]]
+    now[0] = 10.0
+    router.route("roll-the-window", 0)
+    for key in keys:  # ~500 keys, two records each in one second: hot on records
+        router.route(key, 130)
+        router.route(key, 130)
+    now[0] = 11.0
+    router.route("roll-the-window", 0)
+    assert router.hot == {0}
+    assert router.shard_rates()["shardId-0"][1] >= 800
+    moved = [key for key in keys if router.route(key, 130) != router.hash_keys[0]]
+    assert 0 < len(moved) < len(keys)
+
+def test_throttled_records_mark_their_shard_hot():
+    now = [0.0]
+    router = ShardRouter(four_shards(), time_fn=lambda: now[0])
+    explicit = router.route("drone-1", 50)
+    router.note_throttled(explicit)
+    now[0] = 1.0
+    router.route("drone-1", 50)
+    assert router.hot == {router.hash_keys.index(explicit)}
+
+def test_producer_spreads_keys_md5_would_put_on_one_shard(monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "local")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "local")
+    server = start_server(kinesis=LocalKinesis(shards=4))
+    try:
+        client = boto3.client("kinesis", region_name="us-east-2",
+                              endpoint_url=f"http://127.0.0.1:{server.server_address[1]}")
+        keys = [key for key in (f"phone-{i}" for i in range(1000)) if hash_key(key) < HASH_KEY_SPACE // 4][:200]
+        producer = KinesisProducer(stream="nairobi-stream", client=client,
+                                   router=ShardRouter.for_stream(client, "nairobi-stream"))
+        for key in keys:
+            producer.put(b"{}", key)
+        producer.close()
+        assert producer.stats["records_sent"] == 200
+        counts = [len(shard.records) for shard in server.kinesis.streams["nairobi-stream"].shards]
+        assert sum(counts) == 200
+        assert min(counts) > 20
+    finally:
+        server.shutdown()
+
+def test_throttle_marks_from_another_thread_are_not_lost():
+    now = [0.0]
+    router = ShardRouter(four_shards(), time_fn=lambda: now[0])
+    explicit = router.route("drone-1", 50)
+    marking = threading.Thread(target=lambda: [router.note_throttled(explicit) for _ in range(1000)])
+    marking.start()
+    for i in range(1000):
+        router.route(f"car-{i}", 10)
+    marking.join()
+    now[0] = 1.0
+    router.route("drone-1", 50)
+    assert router.hash_keys.index(explicit) in router.hot
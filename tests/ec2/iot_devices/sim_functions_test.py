@@ -1,3 +1,6 @@
+import os
+import sys
+import subprocess
 import pytest
 from math import radians, cos, sin
 from src.util.sim_functions import parse_3d, heading_to_vector, update_location_vector, DEGREES_PER_KM
@@ -271,3 +274,10 @@ def test_integration_zero_speed():
     assert location == pytest.approx([expected_lat, expected_lon, expected_alt], abs=1e-6)
     assert total_distance_km == pytest.approx(0.0)  # No distance traveled
 
+def test_device_modules_load_without_the_aws_libraries():
+    """boto3, botocore and tenacity are only imported once a Kinesis send needs them."""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    code = ("import sys, src.ec2.iot_devices.main, src.util.sinks, src.util.kinesis_producer; "
+            "print(sorted(name for name in ('boto3', 'botocore', 'tenacity') if name in sys.modules))")
+    loaded = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert loaded.stdout.strip() == "[]"
@@ -0,0 +1,51 @@
+import json
+import socket
+import pytest
+from src.util.sinks import FileSink, MemorySink, NullSink, UdpSink, get_sink
+from src.ec2.iot_devices.fleet import run_fleet
+
+def test_file_sink_appends_one_record_per_line(tmp_path):
+    path = tmp_path / "records.ndjson"
+    sink = FileSink(str(path), buffer_bytes=10)
+    for i in range(5):
+        sink.put(b'{"n": %d}' % i, f"phone-{i}")
+    sink.close()
+    assert [json.loads(line)["n"] for line in path.read_text().splitlines()] == [0, 1, 2, 3, 4]
+    assert sink.stats["records_sent"] == 5
+
+def test_memory_sink_is_a_ring_buffer():
+    sink = get_sink("memory:3")
+    assert isinstance(sink, MemorySink)
+    for i in range(5):
+        sink.put(b"%d" % i, "car-1")
+    assert [data for _, data in sink.records] == [b"2", b"3", b"4"]
+    assert sink.stats["dropped"] == 2
+
+def test_null_sink_only_counts():
+    sink = get_sink("null")
+    assert isinstance(sink, NullSink)
+    sink.put(b"abc", "phone-1")
+    sink.put(b"de", "phone-2")
+    assert sink.stats == {"records_sent": 2, "bytes_sent": 5, "dropped": 0}
+
+def test_udp_sink_sends_one_datagram_per_record():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(2)
+    sink = get_sink(f"udp:127.0.0.1:{receiver.getsockname()[1]}")
+    assert isinstance(sink, UdpSink)
+    sink.put(b'{"deviceId": "drone-1"}', "drone-1")
+    assert receiver.recvfrom(1024)[0] == b'{"deviceId": "drone-1"}'
+    sink.close()
+    receiver.close()
+
+def test_get_sink_rejects_unknown_names():
+    with pytest.raises(ValueError, match="Unknown sink"):
+        get_sink("carrier-pigeon")
+
+def test_run_fleet_sends_to_the_chosen_sink(tmp_path):
+    path = tmp_path / "fleet.ndjson"
+    assert run_fleet(10, steps=2, delay=0.01, test=False, sink=f"file:{path}") == 20
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 20
+    assert {r["deviceId"].split("-")[0] for r in records} == {"phone", "car", "drone"}
@@ -0,0 +1,119 @@
+import os
+import asyncio
+import numpy as np
+import pytest
+from src.ec2.iot_devices import snapshot
+from src.ec2.iot_devices.fleet import FleetRunner, build_fleet, restore_fleet, run_fleet
+from src.ec2.iot_devices.fleet_arrays import PhoneArrays, DroneArrays
+from src.ec2.iot_devices.snapshot import (
+    FleetSnapshots, array_records, device_records, load_snapshot, restore_arrays, save_snapshot
+)
+from src.util.clock import VirtualClock
+
+def _state(device):
+    return (device.device_id, device.location, device.heading, device.speed_kmh, device.total_distance_km,
+            device.status, getattr(device, device.LEVEL_FIELD))
+
+def test_objects_round_trip_and_continue_their_trajectories(tmp_path):
+    path = str(tmp_path / "fleet.snap")
+    clock = VirtualClock(start=1704067200)
+    devices = build_fleet(200, test=True, seed=3, clock=clock)
+    for _ in range(30):
+        for device in devices:
+            device.simulate_step()
+    FleetSnapshots(path).save(devices, clock.time())
+
+    later = VirtualClock(start=1704067200 + 86400)
+    restored = restore_fleet(FleetSnapshots(path), test=True, seed=3, clock=later)
+    assert later.time() == clock.time()  # Simulated time resumes at the snapshot
+    assert [_state(d) for d in restored] == [_state(d) for d in devices]
+    assert [type(d) for d in restored] == [type(d) for d in devices] and restored[0].clock is later
+    # The random streams resume too, so the restored fleet walks on exactly as the original does
+    for _ in range(30):
+        for fleet in (devices, restored):
+            for device in fleet:
+                device.simulate_step()
+    assert [_state(d) for d in restored] == [_state(d) for d in devices]
+
+def test_arrays_round_trip(tmp_path):
+    path = str(tmp_path / "arrays.snap")
+    rng = np.random.default_rng(1)
+    phones, drones = PhoneArrays.random(500, rng), DroneArrays.random(300, rng)
+    phones.level, drones.level = rng.uniform(0, 100, 500), rng.uniform(0, 100, 300)
+    for _ in range(100):
+        phones.step(rng)
+        drones.step(rng)
+    save_snapshot(path, array_records([phones, drones]), 1704067200.0)
+
+    records, timestamp = load_snapshot(path)
+    assert isinstance(records, np.memmap) and timestamp == 1704067200.0
+    fleets = restore_arrays(records)
+    assert sorted(fleets) == ["drone", "phone"]
+    for before, after in ((phones, fleets["phone"]), (drones, fleets["drone"])):
+        for name in ("ids", "lat", "lon", "alt", "heading", "speed", "level", "total_distance_km"):
+            assert np.array_equal(getattr(before, name), getattr(after, name))
+        assert list(before.statuses()) == list(after.statuses())
+    assert set(fleets["drone"].statuses()) == {"flying", "descending", "landed"}
+    assert set(fleets["phone"].statuses()) == {"moving", "charging"}
+
+def test_a_failed_save_keeps_the_last_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / "fleet.snap")
+    devices = build_fleet(10, test=True, seed=1)
+    save_snapshot(path, device_records(devices), 1.0)
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(np, "memmap", fail)
+    with pytest.raises(OSError):
+        save_snapshot(path, device_records(devices), 2.0)
+    monkeypatch.undo()
+    records, timestamp = load_snapshot(path)
+    assert len(records) == 10 and timestamp == 1.0
+
+    with open(path, "r+b") as f:
+        f.truncate(100)
+    with pytest.raises(ValueError):
+        load_snapshot(path)
+
+def test_run_fleet_restores_the_fleet_it_saved(tmp_path):
+    snapshot = {"path": str(tmp_path / "fleet.snap")}
+    assert run_fleet(40, steps=3, test=True, seed=5, clock=VirtualClock(start=0), snapshot=snapshot) == 120
+    first, _ = load_snapshot(snapshot["path"])
+    first = first.copy()
+    # A different size and seed do not matter: the saved fleet comes back and runs on
+    assert run_fleet(7, steps=2, test=True, seed=5, clock=VirtualClock(start=0), snapshot=snapshot) == 80
+    second, _ = load_snapshot(snapshot["path"])
+    assert np.array_equal(first["id"], second["id"])
+    assert (second["distance"] >= first["distance"]).all() and (second["distance"] > first["distance"]).any()
+
+def test_forever_runs_snapshot_periodically_without_counting_steps(tmp_path):
+    snapshots = FleetSnapshots(str(tmp_path / "fleet.snap"), interval=60.0)
+    clock = VirtualClock(start=0)
+    runner = FleetRunner(build_fleet(20, test=True, seed=2, clock=clock), 10.0, clock=clock, snapshots=snapshots)
+    assert runner.run(duration=300.0) == runner.scheduler.fired - runner.snapshot_ticks
+    # Every minute (unless the last save is still being written), and once at the end
+    assert runner.snapshot_ticks == 4 and snapshots.stats["saves"] + snapshots.stats["skipped"] == 5
+    assert 580 <= runner.steps_run <= 600
+    assert not os.path.exists(snapshots.path + ".tmp")
+
+def test_a_background_save_packs_between_turns_of_the_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "PACK_CHUNK", 10)
+    snapshots = FleetSnapshots(str(tmp_path / "fleet.snap"))
+    devices = build_fleet(50, test=True, seed=4)
+    turns = []
+
+    async def tick_while_saving():
+        save = asyncio.ensure_future(snapshots.save_in_background(devices, 5.0))
+        while not save.done():
+            turns.append(len(turns))
+            await asyncio.sleep(0)
+        await save
+
+    asyncio.run(tick_while_saving())
+    assert len(turns) >= 5  # One turn per chunk at least, then the write in a worker thread
+    records, timestamp = load_snapshot(snapshots.path)
+    assert timestamp == 5.0 and np.array_equal(records, device_records(devices))
+    # An older save that reaches the file after a newer one leaves it alone
+    snapshots.save(devices[:10], 6.0)
+    snapshots._write(device_records(devices), 7.0, 1, 0.0)
+    assert len(load_snapshot(snapshots.path)[0]) == 10 and snapshots.stats["saves"] == 2
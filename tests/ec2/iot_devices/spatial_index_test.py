@@ -0,0 +1,72 @@
+import math
+import random
+import pytest
+from src.ec2.iot_devices.fleet import build_fleet
+from src.util.clock import VirtualClock
+from src.util.spatial_index import GridIndex, FleetIndex, degrees_to_meters
+
+def scattered(count, seed=0):
+    """Points over the Nairobi square and a little beyond it."""
+    rng = random.Random(seed)
+    return {f"phone-{i}": [rng.uniform(-1.31, -1.28), rng.uniform(36.805, 36.847), 0.0] for i in range(count)}
+
+def meters(loc, lat, lon):
+    return degrees_to_meters(math.hypot(loc[0] - lat, loc[1] - lon))
+
+@pytest.mark.parametrize("radius_m", [0.5, 7.0, 35.0, 200.0, 1500.0])
+def test_radius_queries_match_a_full_scan(radius_m):
+    points = scattered(3000)
+    index = GridIndex(cell_m=10.0)
+    for key, loc in points.items():
+        index.update(key, loc)
+    rng = random.Random(1)
+    for _ in range(20):
+        lat, lon = rng.uniform(-1.31, -1.28), rng.uniform(36.805, 36.847)
+        expected = {key for key, loc in points.items() if meters(loc, lat, lon) <= radius_m}
+        assert set(index.within(lat, lon, radius_m)) == expected
+        assert index.count_within(lat, lon, radius_m) == len(expected)
+
+def test_nearest_matches_a_full_scan():
+    points = scattered(2000)
+    index = GridIndex(cell_m=10.0)
+    for key, loc in points.items():
+        index.update(key, loc)
+    rng = random.Random(2)
+    for k in (1, 5, 50):
+        lat, lon = rng.uniform(-1.4, -1.2), rng.uniform(36.7, 36.9)  # Also from far outside the square
+        expected = sorted((meters(loc, lat, lon), key) for key, loc in points.items())[:k]
+        found = index.nearest(lat, lon, k)
+        assert [key for _, key in found] == [key for _, key in expected]
+        assert [d for d, _ in found] == pytest.approx([d for d, _ in expected])
+    assert index.nearest(-1.3, 36.82, 3, max_m=0.001) == []
+    assert GridIndex().nearest(-1.3, 36.82) == []
+    assert index.nearest(-1.3, 36.82, 0) == [] and index.nearest(-1.3, 36.82, -1) == []
+
+def test_updates_move_keys_between_cells_and_remove_empties_them():
+    index = GridIndex(cell_m=10.0)
+    loc = [-1.3, 36.82, 0.0]
+    index.update("car-1", loc)
+    loc[0] += 0.001  # ~111 m north, in place like advance_location
+    index.update("car-1", loc)
+    assert len(index.cells) == 1 and len(index) == 1
+    assert index.within(-1.299, 36.82, 1.0) == ["car-1"]
+    assert index.within(-1.3, 36.82, 50.0) == []
+    index.remove("car-1")
+    assert len(index) == 0 and not index.cells
+
+def test_fleet_index_follows_a_moving_fleet_by_type():
+    clock = VirtualClock(start=1704067200)
+    index = FleetIndex()
+    devices = build_fleet(300, test=True, seed=3, clock=clock, spatial_index=index)
+    assert len(index) == 300
+    for _ in range(5):
+        for device in devices:
+            device.simulate_step()
+    lat, lon = devices[0].location[0], devices[0].location[1]
+    for types in (None, ["phone"], ["car", "drone"]):
+        chosen = [d for d in devices if types is None or d.DEVICE_TYPE in types]
+        expected = {d.device_id for d in chosen if meters(d.location, lat, lon) <= 800.0}
+        assert set(index.within(lat, lon, 800.0, types)) == expected
+        assert index.density(lat, lon, 800.0, types) == pytest.approx(len(expected) / (math.pi * 0.8 ** 2))
+        nearest = min(chosen, key=lambda d: meters(d.location, lat, lon))
+        assert index.nearest(lat, lon, 1, types)[0][1] == nearest.device_id
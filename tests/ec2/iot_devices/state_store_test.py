@@ -0,0 +1,155 @@
+import json
+import pytest
+from src.ec2.iot_devices.fleet import run_fleet
+from src.util.clock import VirtualClock
+from src.util.sinks import get_sink
+from src.util.state_store import (
+    DynamoTable, FileTable, MemoryTable, StateSink, StateStore, item_bytes, write_units
+)
+
+def ping(device_id, timestamp, status="moving", location=(-1.3, 36.82, 0.0), battery=90.0):
+    return {"deviceId": device_id, "timestamp": timestamp, "status": status, "location": list(location),
+            "battery": battery}
+
+class RecordingTable(MemoryTable):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def write_batch(self, changes):
+        self.batches.append([delta for delta, _ in changes])
+        return super().write_batch(changes)
+
+def test_pings_within_a_window_coalesce_into_one_delta_per_device():
+    table = RecordingTable()
+    store = StateStore(table, window=10)
+    store.record(ping("phone-1", 100))
+    store.record(ping("phone-1", 105, battery=89.5))
+    store.record(ping("car-1", 106))
+    assert table.batches == []
+    store.record(ping("phone-1", 110, battery=89.0))  # Closes the window
+    assert len(table.batches) == 1
+    assert sorted(delta["deviceId"] for delta in table.batches[0]) == ["car-1", "phone-1"]
+    assert store.stats["coalesced"] == 2 and store.stats["items_written"] == 2
+    assert table.items["phone-1"]["battery"] == 89.0 and table.items["phone-1"]["timestamp"] == 110
+
+    store.record(ping("phone-1", 120, battery=88.5))
+    store.record(ping("car-1", 121))  # Same state as written, only a newer timestamp
+    store.flush()
+    assert table.batches[1] == [{"battery": 88.5, "timestamp": 120, "deviceId": "phone-1"}]
+    assert store.stats["unchanged"] == 1
+    assert store.get("car-1")["timestamp"] == 106
+
+def test_flushes_go_out_in_bounded_batches():
+    table = RecordingTable()
+    store = StateStore(table, window=60, batch_items=25)
+    for i in range(60):
+        store.record(ping(f"car-{i}", 0))
+    store.flush()
+    assert [len(batch) for batch in table.batches] == [25, 25, 10]
+    assert store.stats["write_units"] == 60 and store.write_units_per_1k_pings() == 1000
+    with pytest.raises(ValueError):
+        StateStore(batch_items=0)
+
+def test_get_includes_pending_changes():
+    store = StateStore(window=60)
+    store.record(ping("drone-1", 0, status="flying"))
+    store.flush()
+    store.record(ping("drone-1", 10, status="descending"))
+    assert store.get("drone-1")["status"] == "descending"
+    assert store.table.get("drone-1")["status"] == "flying"
+    assert store.get("drone-2") is None
+
+def test_file_table_replays_its_log(tmp_path):
+    path = str(tmp_path / "state.ndjson")
+    store = StateStore(FileTable(path), window=0)
+    store.record(ping("phone-1", 0))
+    store.record(ping("phone-1", 60, status="charging", battery=15.0))
+    store.close()
+    assert [sorted(json.loads(line)) for line in open(path)][1] == ["battery", "deviceId", "status", "timestamp"]
+    assert FileTable(path).get("phone-1") == ping("phone-1", 60, status="charging", battery=15.0)
+
+def test_write_units_follow_dynamodb_item_sizes():
+    item = ping("phone-1234567", 1704067200)
+    assert item_bytes(item) < 100 and write_units(item) == 1
+    assert write_units({"deviceId": "x" * 3000}) == 3
+
+class FakeDynamo:
+    def __init__(self, unprocessed_rounds=1):
+        self.calls = []
+        self.unprocessed_rounds = unprocessed_rounds
+
+    def batch_write_item(self, RequestItems):
+        (table, requests), = RequestItems.items()
+        self.calls.append(requests)
+        if self.unprocessed_rounds:
+            self.unprocessed_rounds -= 1
+            return {"UnprocessedItems": {table: requests[:1]}}
+        return {"UnprocessedItems": {}}
+
+def test_dynamo_table_puts_full_items_and_retries_unprocessed_ones():
+    client = FakeDynamo()
+    store = StateStore(DynamoTable("state", client=client), window=0)
+    store.record(ping("phone-1", 0))
+    store.record(ping("phone-1", 60, battery=89.5))
+    item = client.calls[-1][0]["PutRequest"]["Item"]
+    assert item["battery"] == {"N": "89.5"} and item["status"] == {"S": "moving"}  # Whole item, not the delta
+    assert item["location"]["L"][0] == {"N": "-1.3"}
+    assert [len(call) for call in client.calls] == [1, 1, 1]
+    assert store.stats["failed"] == 0
+
+    client = FakeDynamo(unprocessed_rounds=10)
+    store = StateStore(DynamoTable("state", client=client, max_attempts=2), window=0)
+    store.record(ping("phone-1", 0))
+    assert store.stats["failed"] == 1 and store.stats["write_units"] == 0 and "phone-1" in store.pending
+    client.unprocessed_rounds = 0
+    store.flush()
+    assert store.stats["items_written"] == 1 and not store.pending
+
+class FailingTable(MemoryTable):
+    """Fails the writes of `failing` device ids until they are removed from it."""
+
+    def __init__(self, failing):
+        super().__init__()
+        self.failing = set(failing)
+
+    def write_batch(self, changes):
+        failed = [change for change in changes if change[0]["deviceId"] in self.failing]
+        super().write_batch([change for change in changes if change not in failed])
+        return failed
+
+def test_failed_writes_stay_pending_and_are_sent_again():
+    table = FailingTable(["phone-1"])
+    store = StateStore(table, window=60)
+    store.record(ping("phone-1", 0))
+    store.record(ping("car-1", 0))
+    store.flush()
+    assert store.stats["items_written"] == 1 and store.stats["failed"] == 1 and store.stats["write_units"] == 1
+    assert "phone-1" not in store.written and table.get("phone-1") is None
+    # The same state again is still a change, since it never reached the table
+    store.record(ping("phone-1", 10, battery=89.5))
+    assert store.stats["unchanged"] == 0
+    table.failing.clear()
+    store.flush()
+    assert table.get("phone-1") == ping("phone-1", 10, battery=89.5)
+    assert store.get("phone-1") == table.get("phone-1") and not store.pending
+
+@pytest.mark.parametrize("encoder", ["template", "binary"])
+def test_state_sink_tracks_a_fleet_in_any_encoding(tmp_path, encoder):
+    path = tmp_path / "state.ndjson"
+    clock = VirtualClock(start=1704067200)
+    run_fleet(20, steps=3, delay=1.0, test=False, encoder=encoder, seed=1, clock=clock, sink=f"state:file:{path}")
+    items = FileTable(str(path)).items
+    assert len(items) == 20
+    assert all(item["timestamp"] == 1704067202 for item in items.values())
+
+def test_state_sink_drops_undecodable_records():
+    sink = get_sink("state:memory")
+    assert isinstance(sink, StateSink)
+    sink.put(b'{"deviceId": "car-1", "timestamp": 1, "status": "moving", "gas": 50.0}', "car-1")
+    sink.put(b"garbage", "car-2")
+    sink.close()
+    assert sink.stats == {"records_sent": 1, "bytes_sent": 70, "dropped": 1}
+    assert sink.store.table.get("car-1")["gas"] == 50.0
+    with pytest.raises(ValueError):
+        get_sink("state:redis")
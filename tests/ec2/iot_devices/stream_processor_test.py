@@ -0,0 +1,103 @@
+import json
+import base64
+import pytest
+from src.util.kinesis_local import LocalKinesis, start_server
+from src.util.kinesis_producer import KinesisProducer
+from src.util.stream_processor import (
+    FileCheckpointer, MemoryCheckpointer, ShardConsumer, consume_shards, load_handler, run_processor
+)
+
+def filled_stream(records, shards=2):
+    kinesis = LocalKinesis(shards=shards)
+    client = kinesis.client()
+    client.put_records(StreamName="s", Records=[{"Data": json.dumps({"n": i}).encode(), "PartitionKey": f"car-{i}"}
+                                                for i in range(records)])
+    return kinesis, client
+
+class Collect:
+    """Lambda-style handler remembering the decoded records of every event."""
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, context):
+        self.events.append([json.loads(base64.b64decode(r["kinesis"]["data"]))["n"] for r in event["Records"]])
+
+    @property
+    def seen(self):
+        return [n for event in self.events for n in event]
+
+def test_consumer_batches_records_in_shard_order():
+    _, client = filled_stream(250, shards=1)
+    handler = Collect()
+    consumer = ShardConsumer(client, "s", "shardId-000000000000", handler, MemoryCheckpointer(), batch_size=100)
+    while consumer.poll():
+        pass
+    assert [len(event) for event in handler.events] == [100, 100, 50]
+    assert handler.seen == list(range(250))
+    assert consumer.caught_up
+
+def test_restart_resumes_after_the_checkpoint(tmp_path):
+    kinesis, client = filled_stream(100)
+    first = Collect()
+    consume_shards(client, ["shardId-000000000000", "shardId-000000000001"], first, FileCheckpointer(str(tmp_path)),
+                   "s", until_caught_up=True)
+    assert sorted(first.seen) == list(range(100))
+    client.put_records(StreamName="s", Records=[{"Data": b'{"n": 100}', "PartitionKey": "car-100"}])
+    second = Collect()
+    consume_shards(client, ["shardId-000000000000", "shardId-000000000001"], second, FileCheckpointer(str(tmp_path)),
+                   "s", until_caught_up=True)
+    assert second.seen == [100]
+
+def test_partial_batch_failures_are_retried_from_the_first_failure():
+    _, client = filled_stream(10, shards=1)
+    calls = []
+
+    def handler(event, context):
+        sequences = [r["kinesis"]["sequenceNumber"] for r in event["Records"]]
+        calls.append(len(sequences))
+        if len(calls) == 1:
+            return {"batchItemFailures": [{"itemIdentifier": sequences[4]}]}
+
+    checkpointer = MemoryCheckpointer()
+    consumer = ShardConsumer(client, "s", "shardId-000000000000", handler, checkpointer)
+    consumer.poll()
+    consumer.poll()
+    assert calls == [10, 6]
+    assert consumer.stats["records"] == 10
+    assert int(checkpointer.get("shardId-000000000000")) == 9
+
+def test_failing_batch_is_skipped_after_max_retries():
+    _, client = filled_stream(5, shards=1)
+
+    def handler(event, context):
+        raise RuntimeError("bad batch")
+
+    consumer = ShardConsumer(client, "s", "shardId-000000000000", handler, MemoryCheckpointer(), max_retries=2)
+    assert [consumer.poll() for _ in range(3)] == [0, 0, 5]  # The first try and two retries fail
+    assert consumer.stats == {"records": 0, "batches": 0, "errors": 3, "skipped": 5}
+
+def test_load_handler_resolves_module_function():
+    assert load_handler("json:dumps") is json.dumps
+    with pytest.raises(ValueError, match="module:function"):
+        load_handler("json.dumps")
+
+def test_run_processor_consumes_the_stand_in_across_processes(tmp_path, monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "local")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "local")
+    server = start_server(kinesis=LocalKinesis(shards=2))
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        producer = KinesisProducer(stream="s", client=boto3.client("kinesis", region_name="us-east-2",
+                                                                   endpoint_url=endpoint))
+        for i in range(300):
+            producer.put(b'{"n": %d}' % i, f"phone-{i}")
+        producer.close()
+        result = run_processor("src.util.stream_processor:count_records", "s", endpoint, processes=2,
+                               checkpoint_dir=str(tmp_path), until_caught_up=True)
+        assert result["records"] == 300
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["shardId-000000000000", "shardId-000000000001"]
+        assert run_processor("src.util.stream_processor:count_records", "s", endpoint, processes=0,
+                             checkpoint_dir=str(tmp_path), until_caught_up=True)["records"] == 0
+    finally:
+        server.shutdown()